@@ -0,0 +1,170 @@
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# --- RÉPONSES TYPES (au format attendu par chaque agent) ---
+
+OPTIMIZATION_REPLY = {
+    "sql_id": "bench",
+    "explication_plan": "Parcours complet de la table faute d'index sélectif.",
+    "points_couteux": ["TABLE ACCESS FULL", "Tri en mémoire", "Lectures disque"],
+    "recommandations": [{"type": "Index", "description": "CREATE INDEX bench_idx ON t(col);"}],
+    "gain_estime": "60%"
+}
+
+SECURITY_REPLY = {
+    "score": 65,
+    "risques": [{"nom": "Privilèges ANY", "severite": "Critique", "details": "DROP ANY TABLE accordé."}],
+    "recommandations": ["1. Révoquer les privilèges ANY non essentiels."]
+}
+
+ANOMALY_REPLY = [
+    {"timestamp": "2026-01-13 03:15:00", "classification": "SUSPECT",
+     "justification": "Connexion SYS nocturne", "severite": 6},
+    {"timestamp": "2026-01-13 10:00:00", "classification": "NORMAL",
+     "justification": "Consultation standard", "severite": 0}
+]
+
+BACKUP_REPLY = (
+    "---JSON---\n"
+    + json.dumps({"type": "Incrémentale Niveau 1", "frequence": "Quotidienne", "retention_jours": 14,
+                  "emplacement_stockage": "Disque", "cout_estime": "Moyen"}, ensure_ascii=False)
+    + "\n---RMAN---\nRUN {\n  BACKUP INCREMENTAL LEVEL 1 DATABASE PLUS ARCHIVELOG;\n}"
+)
+
+
+def pick_reply(prompt):
+    """Choisit une réponse plausible selon le prompt reçu (même routage que prompts.yaml)."""
+    if "---RMAN---" in prompt:
+        return BACKUP_REPLY
+    if "QUESTIONS D'AUDIT" in prompt:
+        return json.dumps(SECURITY_REPLY, ensure_ascii=False)
+    if "LOGS À ANALYSER" in prompt:
+        return json.dumps(ANOMALY_REPLY, ensure_ascii=False)
+    if "Performance Tuning" in prompt:
+        return json.dumps(OPTIMIZATION_REPLY, ensure_ascii=False)
+    return "Réponse simulée de l'assistant DBA. " * 8
+
+
+def count_tokens(text):
+    """Approximation grossière (~4 caractères par token)."""
+    return max(1, len(text) // 4)
+
+
+class MockConfig:
+    def __init__(self, latency=0.2, token_rate=0.0, error_rate=0.0, seed=None):
+        self.latency = latency          # latence fixe avant le premier token (s)
+        self.token_rate = token_rate    # tokens de complétion par seconde (0 = instantané)
+        self.error_rate = error_rate    # proportion de réponses HTTP 500
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def generation_time(self, tokens):
+        return tokens / self.token_rate if self.token_rate > 0 else 0.0
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Endpoint /chat/completions compatible DeepSeek/OpenAI (réponse complète ou SSE)."""
+    config = MockConfig()
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        cfg = self.config
+        with cfg.lock:
+            cfg.requests += 1
+            failed = cfg.random.random() < cfg.error_rate
+            if failed:
+                cfg.errors += 1
+
+        time.sleep(cfg.latency)
+        if failed:
+            self._send_json(500, {"error": {"message": "Erreur simulée", "type": "server_error"}})
+            return
+
+        prompt = "\n".join(m.get("content", "") for m in request.get("messages", []))
+        reply = pick_reply(prompt)
+        usage = {"prompt_tokens": count_tokens(prompt), "completion_tokens": count_tokens(reply)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if request.get("stream"):
+            self._stream(reply, usage, request.get("model", "deepseek-chat"))
+            return
+
+        time.sleep(cfg.generation_time(usage["completion_tokens"]))
+        self._send_json(200, {
+            "id": "mock-completion",
+            "object": "chat.completion",
+            "model": request.get("model", "deepseek-chat"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+            "usage": usage
+        })
+
+    def _stream(self, reply, usage, model):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        # Découpage en morceaux d'environ 4 tokens, émis au débit configuré
+        chunk_size = 16
+        chunks = [reply[i:i + chunk_size] for i in range(0, len(reply), chunk_size)]
+        delay = self.config.generation_time(count_tokens(reply)) / max(1, len(chunks))
+        for i, chunk in enumerate(chunks):
+            event = {
+                "id": "mock-completion", "object": "chat.completion.chunk", "model": model,
+                "choices": [{"index": 0, "delta": {"content": chunk},
+                             "finish_reason": "stop" if i == len(chunks) - 1 else None}]
+            }
+            if i == len(chunks) - 1:
+                event["usage"] = usage
+            self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            if delay:
+                time.sleep(delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def start_server(config, host="127.0.0.1", port=0):
+    """Démarre le serveur dans un thread ; retourne (server, url de l'endpoint)."""
+    handler = type("ConfiguredMockHandler", (MockHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/chat/completions"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serveur chat-completions local imitant DeepSeek")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="Latence fixe par requête (s)")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Tokens/s générés (0 = instantané)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Proportion de réponses 500")
+    args = parser.parse_args()
+
+    server, url = start_server(MockConfig(args.latency, args.token_rate, args.error_rate), port=args.port)
+    print(f"🧪 Mock DeepSeek prêt : {url}")
+    print(f"   export DEEP_SEEK_API_URL={url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,313 @@
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+
+import pandas as pd
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SRC_DIR = os.path.join(ROOT_DIR, 'src')
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+sys.path.append(os.path.dirname(__file__))
+
+from mock_deepseek import MockConfig, start_server
+
+SCENARIOS = ["anomaly", "optimizer", "security", "backup", "chat"]
+DEFAULT_SIZES = [100, 1000, 10000]
+
+
+# --- JEUX DE DONNÉES SYNTHÉTIQUES ---
+
+def generate_dataset(workspace, size, seed=42):
+    """
+    Crée datav1/ (mêmes colonnes que real_data_extractor.py) et data/prompts.yaml dans le workspace.
+    `size` = nombre de lignes d'audit et de requêtes SQL ; les autres tables sont proportionnelles.
+    """
+    rnd = random.Random(seed)
+    data_dir = os.path.join(workspace, 'datav1')
+    os.makedirs(data_dir, exist_ok=True)
+    os.makedirs(os.path.join(workspace, 'data'), exist_ok=True)
+    shutil.copy(os.path.join(ROOT_DIR, 'data', 'prompts.yaml'), os.path.join(workspace, 'data', 'prompts.yaml'))
+
+    users = [f"APP_USER_{i}" for i in range(max(5, size // 50))]
+    audit = [{
+        "OS_USERNAME": "oracle", "USERNAME": rnd.choice(users + ["SYS"]),
+        "USERHOST": f"host{rnd.randint(1, 20)}", "TERMINAL": "pts/1",
+        "TIMESTAMP": f"2026-01-13 {rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}:00",
+        "OWNER": "HR", "OBJ_NAME": rnd.choice(["EMPLOYEES", "ORDERS", "USERS' OR '1'='1"]),
+        "ACTION_NAME": rnd.choice(["SELECT", "UPDATE", "LOGON", "GRANT"]),
+        "RETURNCODE": rnd.choice([0, 0, 0, 955, 1017]), "SQL_TEXT": "SELECT * FROM EMPLOYEES"
+    } for _ in range(size)]
+    pd.DataFrame(audit).to_csv(os.path.join(data_dir, 'audit_logs.csv'), index=False)
+
+    sql_ids = [f"bench{i:08d}" for i in range(size)]
+    perf = [{
+        "SQL_ID": sql_id, "SQL_TEXT": f"SELECT * FROM T{i % 50} WHERE C = :1",
+        "ELAPSED_TIME": rnd.randint(1_000, 50_000_000), "CPU_TIME": rnd.randint(500, 40_000_000),
+        "EXECUTIONS": rnd.randint(1, 10_000), "DISK_READS": rnd.randint(0, 1_000_000),
+        "BUFFER_GETS": rnd.randint(10, 5_000_000), "OPTIMIZER_COST": rnd.randint(1, 10_000)
+    } for i, sql_id in enumerate(sql_ids)]
+    pd.DataFrame(perf).sort_values("ELAPSED_TIME", ascending=False).to_csv(
+        os.path.join(data_dir, 'performance_metrics.csv'), index=False)
+
+    plans = [{
+        "SQL_ID": sql_id, "PLAN_HASH_VALUE": 1000 + i, "ID": step,
+        "OPERATION": rnd.choice(["TABLE ACCESS", "INDEX", "HASH JOIN", "SORT"]),
+        "OPTIONS": rnd.choice(["FULL", "RANGE SCAN", "BY INDEX ROWID", ""]),
+        "OBJECT_NAME": f"T{i % 50}", "OPTIMIZER": "ALL_ROWS", "COST": rnd.randint(1, 5000),
+        "CPU_COST": rnd.randint(1, 10_000_000), "IO_COST": rnd.randint(1, 5000), "TIME": rnd.randint(1, 100)
+    } for i, sql_id in enumerate(sql_ids) for step in range(5)]
+    pd.DataFrame(plans).to_csv(os.path.join(data_dir, 'execution_plans.csv'), index=False)
+
+    pd.DataFrame([{
+        "USERNAME": u, "ACCOUNT_STATUS": rnd.choice(["OPEN", "LOCKED"]), "LOCK_DATE": "",
+        "EXPIRY_DATE": "", "PROFILE": rnd.choice(["DEFAULT", "APP_PROFILE"]), "LAST_LOGIN": "2026-01-13 08:00"
+    } for u in users]).to_csv(os.path.join(data_dir, 'dba_users.csv'), index=False)
+    pd.DataFrame([{
+        "ROLE": r, "PASSWORD_REQUIRED": "NO", "AUTHENTICATION_TYPE": "NONE"
+    } for r in ["DBA", "CONNECT", "RESOURCE"] + [f"APP_ROLE_{i}" for i in range(len(users) // 5)]]
+    ).to_csv(os.path.join(data_dir, 'dba_roles.csv'), index=False)
+    pd.DataFrame([{
+        "GRANTEE": u, "PRIVILEGE": rnd.choice(["CREATE SESSION", "DROP ANY TABLE", "SELECT ANY TABLE"]),
+        "ADMIN_OPTION": "NO"
+    } for u in users]).to_csv(os.path.join(data_dir, 'dba_sys_privs.csv'), index=False)
+    pd.DataFrame([{
+        "EVENT": f"event {i}", "TOTAL_WAITS": rnd.randint(1, 100_000),
+        "TIME_WAITED": rnd.randint(1, 100_000), "AVERAGE_WAIT": round(rnd.random(), 2)
+    } for i in range(100)]).to_csv(os.path.join(data_dir, 'system_events.csv'), index=False)
+
+
+# --- EXÉCUTION D'UN SCÉNARIO (processus fils : RSS de pointe isolé) ---
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux : Ko ; macOS : octets
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def _agent_op(scenario):
+    """Construit l'agent et retourne la fonction à chronométrer."""
+    if scenario == "anomaly":
+        from anomaly_detector import AnomalyDetector
+        agent = AnomalyDetector()
+        return lambda: agent.analyze_logs("datav1/audit_logs.csv")
+    if scenario == "optimizer":
+        from query_optimizer import QueryOptimizer
+        agent = QueryOptimizer()
+        return lambda: agent.analyze_slow_queries("datav1/performance_metrics.csv")
+    if scenario == "security":
+        from security_audit import SecurityAuditor
+        agent = SecurityAuditor()
+        return agent.run_audit
+    if scenario == "backup":
+        from backup_recommender import BackupRecommender
+        agent = BackupRecommender()
+        return lambda: agent.generate_full_plan(user_reqs={"rpo": "24h", "rto": "4h", "budget": "Moyen"})
+    raise ValueError(scenario)
+
+
+def _publish_chat_results(data_dir, size, seed=42):
+    """Résultats d'agents de taille N (contexte système du chatbot), publiés dans le store du workspace."""
+    from result_store import ResultStore
+    rnd = random.Random(seed)
+    store = ResultStore(data_dir)
+    store.publish("security", {"score": rnd.randint(20, 90), "recommandations": [],
+                               "risques": [{"nom": f"Risque {i}"} for i in range(max(3, size // 100))]})
+    store.publish("optimizer", [{"sql_id": f"bench{i:08d}", "probleme": "FULL SCAN"} for i in range(size)])
+    store.publish("anomaly", [{
+        "timestamp": f"2026-01-13 {rnd.randint(0, 23):02d}:00:00",
+        "classification": rnd.choice(["NORMAL", "SUSPECT", "CRITIQUE"]),
+        "severite": rnd.randint(1, 10), "justification": "benchmark"
+    } for _ in range(size)])
+
+
+def _chat_op(workspace, size):
+    """Client de test Flask sur /api/chat ; résultats, snapshots et sessions lus et écrits dans le workspace."""
+    import importlib.util
+    data_dir = os.path.join(workspace, 'datav1')
+    _publish_chat_results(data_dir, size)
+    # Lu à l'import du webapp : contexte système tiré des résultats du workspace (taille N)
+    os.environ["WEBAPP_DATA_DIR"] = data_dir
+    sys.path.append(os.path.join(SRC_DIR, 'webapp'))
+    spec = importlib.util.spec_from_file_location("bench_webapp", os.path.join(SRC_DIR, 'webapp', 'app.py'))
+    webapp = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = webapp  # Flask en déduit root_path (dossier des templates)
+    spec.loader.exec_module(webapp)
+    # Le moteur IA est préchauffé en arrière-plan : on attend qu'il soit prêt (inclus dans init_s)
+    webapp.get_ai_services()
+    client = webapp.app.test_client()
+    state = {"session_id": None}
+
+    def op():
+        payload = {"message": "Y a-t-il une tentative d'intrusion ?"}
+        if state["session_id"]:
+            payload["session_id"] = state["session_id"]
+        response = client.post('/api/chat', json=payload)
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        state["session_id"] = response.get_json()["session_id"]
+    return op
+
+
+def run_worker(scenario, size, repeat, workspace):
+    os.chdir(workspace)
+    sys.path.insert(0, SRC_DIR)
+
+    # Index RAG du workspace (hors chronométrage)
+    from rag_setup import OracleRAG
+    rag = OracleRAG()
+    if rag.collection.count() == 0:
+        rag.add_documents(os.path.join(ROOT_DIR, 'data', 'knowledge'))
+
+    start = time.perf_counter()
+    if scenario == "chat":
+        op = _chat_op(workspace, size)
+        # Taille = longueur de la conversation (l'historique croît à chaque tour)
+        repeat = max(repeat, size // 100)
+    else:
+        op = _agent_op(scenario)
+    init_s = time.perf_counter() - start
+
+    latencies, errors = [], 0
+    wall_start = time.perf_counter()
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        try:
+            result = op()
+            if isinstance(result, dict) and 'error' in result:
+                errors += 1
+        except Exception as e:
+            print(f"⚠️ {scenario}: {e}", file=sys.stderr)
+            errors += 1
+        latencies.append(time.perf_counter() - t0)
+    wall_s = time.perf_counter() - wall_start
+
+    return {
+        "scenario": scenario, "size": size, "ops": len(latencies), "errors": errors,
+        "init_s": round(init_s, 4), "wall_s": round(wall_s, 4),
+        "ops_per_s": round(len(latencies) / wall_s, 4) if wall_s else None,
+        "p50_s": round(percentile(latencies, 50), 4), "p95_s": round(percentile(latencies, 95), 4),
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+# --- ORCHESTRATION ET RAPPORT ---
+
+def run_suite(args):
+    config = MockConfig(args.latency, args.token_rate, args.error_rate, seed=args.seed)
+    server, url = start_server(config)
+    env = dict(os.environ, DEEP_SEEK_API_KEY="benchmark", DEEP_SEEK_API_URL=url)
+    # La même question est répétée : sans cela, /api/chat mesurerait le cache de réponses
+    env.setdefault("ANSWER_CACHE_SIZE", "0")
+    print(f"🧪 Mock DeepSeek : {url} (latence {args.latency}s, {args.token_rate or '∞'} tokens/s, "
+          f"erreurs {args.error_rate:.0%})")
+
+    results = []
+    try:
+        for size in args.sizes:
+            workspace = tempfile.mkdtemp(prefix=f"oracle_bench_{size}_")
+            generate_dataset(workspace, size, seed=args.seed)
+            for scenario in args.scenarios:
+                before = config.requests
+                cmd = [sys.executable, os.path.abspath(__file__), "--worker", scenario,
+                       "--size", str(size), "--repeat", str(args.repeat), "--workspace", workspace]
+                proc = subprocess.run(cmd, env=env, capture_output=True, text=True)
+                if proc.returncode != 0:
+                    print(f"❌ {scenario} (taille {size}) en échec :\n{proc.stderr[-2000:]}")
+                    results.append({"scenario": scenario, "size": size, "failed": True})
+                    continue
+                result = json.loads(proc.stdout.strip().splitlines()[-1])
+                result["llm_requests"] = config.requests - before
+                result["llm_requests_per_s"] = round(result["llm_requests"] / result["wall_s"], 4) if result["wall_s"] else None
+                results.append(result)
+                print(f"  {scenario:<10} taille={size:<6} wall={result['wall_s']:.2f}s "
+                      f"p95={result['p95_s']:.3f}s llm_req/s={result['llm_requests_per_s']} "
+                      f"rss={result['peak_rss_mb']}Mo")
+            if not args.keep_workspace:
+                shutil.rmtree(workspace, ignore_errors=True)
+    finally:
+        server.shutdown()
+
+    return {
+        "label": args.label,
+        "created_at": datetime.now().isoformat(),
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "mock": {"latency": args.latency, "token_rate": args.token_rate, "error_rate": args.error_rate},
+        "repeat": args.repeat,
+        "results": results
+    }
+
+
+def compare(current, baseline_path):
+    """Affiche l'écart (wall, p95, RSS) par rapport à un fichier de résultats précédent."""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    previous = {(r["scenario"], r["size"]): r for r in baseline["results"] if not r.get("failed")}
+    print(f"\n--- COMPARAISON AVEC {baseline.get('label')} ---")
+    for r in current["results"]:
+        old = previous.get((r["scenario"], r["size"]))
+        if r.get("failed") or not old:
+            continue
+        deltas = []
+        for key in ("wall_s", "p95_s", "peak_rss_mb"):
+            if r.get(key) is not None and old.get(key):
+                deltas.append(f"{key} {100 * (r[key] - old[key]) / old[key]:+.1f}%")
+        print(f"  {r['scenario']:<10} taille={r['size']:<6} " + ", ".join(deltas))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de bout en bout avec un DeepSeek local simulé")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)))
+    parser.add_argument("--repeat", type=int, default=3, help="Exécutions par scénario")
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--token-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--label", default=datetime.now().strftime("%Y%m%d_%H%M%S"))
+    parser.add_argument("--compare", help="Fichier de résultats de référence")
+    parser.add_argument("--keep-workspace", action="store_true")
+    # Usage interne (processus fils)
+    parser.add_argument("--worker", choices=SCENARIOS)
+    parser.add_argument("--size", type=int)
+    parser.add_argument("--workspace")
+    args = parser.parse_args(argv)
+    args.scenarios = [s for s in args.scenarios.split(",") if s]
+    args.sizes = [int(s) for s in args.sizes.split(",") if s]
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.worker:
+        result = run_worker(args.worker, args.size, args.repeat, args.workspace)
+        print(json.dumps(result))
+        sys.exit(0)
+
+    report = run_suite(args)
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    out_path = os.path.join(RESULTS_DIR, f"{args.label}.json")
+    with open(out_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4, ensure_ascii=False)
+    print(f"\n✅ Résultats : {out_path}")
+    if args.compare:
+        compare(report, args.compare)
@@ -3,15 +3,25 @@ import json
 import os
 from llm_engine import LLMEngine
 from rag_setup import OracleRAG
+from result_store import ResultStore
+from fleet import selected_target, target_data_dir
+from llm_scheduler import raise_if_cancelled
 from data_extractor import OracleSimulator
+import metrics
+import profiling
 
 class AnomalyDetector:
-    def __init__(self):
+    def __init__(self, data_dir="datav1"):
         self.engine = LLMEngine() 
         self.rag = OracleRAG()     
+        # Dossier de la base analysée (datav1/ ou datav1/targets/<nom>/ en mode flotte)
+        self.data_dir = data_dir
 
-    def analyze_logs(self, logs_file="datav1/audit_logs.csv"):
-        """Analyse les logs d'audit Oracle """
+    @metrics.track_agent("anomaly")
+    @profiling.profiled("analyze_logs")
+    def analyze_logs(self, logs_file=None):
+        """Analyse les logs d'audit Oracle (défaut : <data_dir>/audit_logs.csv)"""
+        logs_file = logs_file or os.path.join(self.data_dir, "audit_logs.csv")
         if not os.path.exists(logs_file):
             return {"error": "Fichier de logs introuvable."}
 
@@ -21,7 +31,7 @@ class AnomalyDetector:
         logs_text = df.tail(20).to_string(index=False)
         
         # 2. Récupération du contexte RAG 
-        context_docs, _ = self.rag.retrieve_context("patterns injection SQL, escalade privilèges, accès hors heures")
+        context_docs, _ = self.rag.retrieve_context("patterns injection SQL, escalade privilèges, accès hors heures", domain="anom")
         context_text = "\n".join(context_docs)
         
         # 3. Analyse par Gemini 
@@ -30,14 +40,14 @@ class AnomalyDetector:
         analysis_raw = self.engine.generate(
             user_message=prompt_template.format(logs=logs_text, context=context_text)
         )
+        raise_if_cancelled()
         
         try:
             # Nettoyage et conversion JSON [cite: 127-129]
             clean_json = analysis_raw.replace("```json", "").replace("```", "").strip()
             results = json.loads(clean_json)
             
-            with open("datav1/detected_anomalies.json", "w", encoding='utf-8') as f:
-                json.dump(results, f, indent=4, ensure_ascii=False)
+            ResultStore(self.data_dir).publish("anomaly", results)
                 
             return results
         except Exception as e:
@@ -45,25 +55,23 @@ class AnomalyDetector:
 
     def validate_chatbot(self, question):
         """Réponse aux questions d'intrusion (Livrable Validation) """
-        try:
-            with open("datav1/detected_anomalies.json", "r", encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # On cherche s'il y a des anomalies critiques ou suspectes
-            alerts = [a for a in data if a.get('classification') in ['CRITIQUE', 'SUSPECT']]
-            if alerts:
-                return f"Oui, j'ai détecté {len(alerts)} anomalie(s). Exemple : {alerts[0]['justification']}"
-            return "Aucune intrusion détectée dans les logs récents."
-        except FileNotFoundError:
+        store = ResultStore(self.data_dir)
+        if store.latest_run_id("anomaly") is None:
             return "Veuillez d'abord lancer l'analyse des logs."
 
+        # On cherche s'il y a des anomalies critiques ou suspectes (requête indexée)
+        alerts = store.anomalies(classifications=['CRITIQUE', 'SUSPECT'])
+        if alerts:
+            return f"Oui, j'ai détecté {len(alerts)} anomalie(s). Exemple : {alerts[0]['justification']}"
+        return "Aucune intrusion détectée dans les logs récents."
+
 if __name__ == "__main__":
     # Étape 1 : S'assurer que le dataset de 70 logs existe 
     sim = OracleSimulator()
     sim.generate_audit_logs() 
     
     # Étape 2 : Lancer la détection
-    detector = AnomalyDetector()
+    detector = AnomalyDetector(data_dir=target_data_dir(selected_target()))
     print("\n--- DÉTECTION D'ANOMALIES ---")
     results = detector.analyze_logs()
     
@@ -0,0 +1,89 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import metrics
+
+ANSWER_CACHE_REQUESTS = metrics.counter("answer_cache_requests_total", "Accès au cache sémantique des réponses", ("cache", "result"))
+
+
+def context_key(*parts):
+    """Empreinte courte de l'état dont dépend une réponse (données live, configuration...)."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(str(part).encode('utf-8'))
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+
+class SemanticAnswerCache:
+    """
+    Cache des réponses du chatbot indexé par similarité des questions.
+    Une entrée est servie si sa question a une similarité cosinus >= `threshold` avec la
+    nouvelle question ET si elle a été produite dans le même contexte (`context_key`) :
+    dès que les données live changent, les anciennes réponses ne sont plus servies.
+    Éviction LRU au-delà de `max_entries` et expiration après `ttl` secondes.
+    Configuration par défaut : ANSWER_CACHE_THRESHOLD (0.92), ANSWER_CACHE_SIZE (256,
+    0 = désactivé) et ANSWER_CACHE_TTL (3600).
+    """
+
+    def __init__(self, name="chat", threshold=None, max_entries=None, ttl=None):
+        self.name = name
+        self.threshold = threshold if threshold is not None else float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+        self._entries = OrderedDict()  # id -> (context_key, vecteur normalisé, réponse, date de création)
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _purge_expired(self, now):
+        expired = [k for k, (_, _, _, created) in self._entries.items() if now - created > self.ttl]
+        for k in expired:
+            del self._entries[k]
+
+    def lookup(self, embedding, key):
+        """Réponse en cache la plus proche pour ce contexte, ou None."""
+        if not self.enabled:
+            return None
+        query = self._normalize(embedding)
+        with self._lock:
+            self._purge_expired(time.time())
+            candidates = [(k, vec) for k, (ctx, vec, _, _) in self._entries.items() if ctx == key]
+            if candidates:
+                scores = np.stack([vec for _, vec in candidates]) @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry_id = candidates[best][0]
+                    self._entries.move_to_end(entry_id)
+                    ANSWER_CACHE_REQUESTS.inc(cache=self.name, result="hit")
+                    return self._entries[entry_id][2]
+        ANSWER_CACHE_REQUESTS.inc(cache=self.name, result="miss")
+        return None
+
+    def store(self, embedding, key, answer):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[self._next_id] = (key, self._normalize(embedding), answer, time.time())
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
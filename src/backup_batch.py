@@ -0,0 +1,145 @@
+import argparse
+import os
+import sys
+import time
+import yaml
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from llm_engine import LLMEngine
+from backup_recommender import BackupRecommender
+from fleet import TARGETS_DIR, list_targets, select_targets, target_data_dir
+from llm_scheduler import current_context, request_context
+import metrics
+
+DEFAULT_POLICY = {"rpo": "24h", "rto": "4h", "budget": "Moyen"}
+# Appels LLM simultanés (chaque plan = une génération DeepSeek)
+DEFAULT_WORKERS = int(os.getenv("BACKUP_BATCH_WORKERS", "4"))
+# Politiques des tâches du webapp (configuration serveur ; absent : politique par défaut par cible)
+POLICY_FILE = os.getenv("BACKUP_POLICY_FILE") or None
+
+BATCH_PLANS = metrics.counter("backup_batch_plans_total", "Plans de sauvegarde générés en mode batch", ("status",))
+
+
+def load_policies(path):
+    """
+    Lit le fichier de politiques (YAML) :
+        defaults: {rpo, rto, budget, fenetre}
+        targets:
+          PROD1: {rpo: 15min, rto: 1h, budget: Haut, fenetre: 6}
+          DEV: {budget: Bas, data_dir: /chemin/vers/les/csv}
+    Retourne {nom: politique complète}, les valeurs absentes étant reprises des défauts.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f) or {}
+    defaults = dict(DEFAULT_POLICY)
+    defaults.update(config.get("defaults") or {})
+
+    policies = {}
+    for name, overrides in (config.get("targets") or {}).items():
+        policy = dict(defaults)
+        policy.update(overrides or {})
+        policy.setdefault("data_dir", target_data_dir(str(name)))
+        policies[str(name)] = policy
+    return policies
+
+
+def discover_targets(targets_dir=TARGETS_DIR):
+    """Politique par défaut pour chaque sous-dossier de targets_dir (sans fichier de politiques)."""
+    return {
+        name: dict(DEFAULT_POLICY, data_dir=os.path.join(targets_dir, name))
+        for name in list_targets(targets_dir)
+    }
+
+
+def _user_reqs(policy):
+    reqs = {key: str(policy[key]) for key in ("rpo", "rto", "budget")}
+    if policy.get("fenetre"):
+        reqs["fenetre"] = float(policy["fenetre"])
+    return reqs
+
+
+def generate_plan(name, policy, engine, on_section=None):
+    """
+    Plan d'une cible : génération en streaming puis écriture de backup_plan.json /
+    backup_script.rman dans son dossier. Rien n'est écrit si la réponse n'est pas exploitable.
+    """
+    data_dir = policy["data_dir"]
+    if not os.path.isdir(data_dir):
+        raise FileNotFoundError(f"Dossier de données introuvable : {data_dir}")
+    recommender = BackupRecommender(data_dir=data_dir, engine=engine)
+    strategy, rman = recommender.generate_full_plan(_user_reqs(policy), on_section=on_section)
+    # Échec LLM ou plan incomplet : {"error": ...} et aucun script (capacité non injectée)
+    if "error" in strategy or not rman:
+        raise RuntimeError(strategy.get("error") or "Réponse LLM non exploitable (aucun script RMAN)")
+    json_path, rman_path = recommender.save_plan(strategy, rman, data_dir)
+    return {"plan": json_path, "script": rman_path, "parallelisme": strategy.get("parallelisme")}
+
+
+def generate_plans(policies, max_workers=None, engine=None, progress_callback=None):
+    """
+    Génère les plans de toutes les cibles avec au plus `max_workers` appels LLM simultanés.
+    Une cible en échec n'interrompt pas les autres. Retourne {nom: {"status", "duration_s", ...}}.
+    progress_callback(pourcentage, message) : même signature que Job.report.
+    """
+    engine = engine or LLMEngine()
+    workers = max(1, max_workers or DEFAULT_WORKERS)
+    results = {}
+    total = len(policies)
+    # Priorité, appelant et annulation de l'appelant (tâche du webapp) valent aussi dans le pool
+    context = dict({"caller": "backup_batch"}, **current_context())
+
+    def run(name):
+        start = time.perf_counter()
+        sections = []
+        try:
+            with request_context(**context):
+                entry = generate_plan(name, policies[name], engine,
+                                      on_section=lambda section, _: sections.append(section))
+            entry["status"] = "ok"
+        except Exception as e:
+            entry = {"status": "failed", "error": str(e), "sections_recues": sections}
+        entry["duration_s"] = round(time.perf_counter() - start, 3)
+        return entry
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backup-batch") as pool:
+        futures = {pool.submit(run, name): name for name in policies}
+        for future in as_completed(futures):
+            name = futures[future]
+            results[name] = future.result()
+            BATCH_PLANS.inc(status=results[name]["status"])
+            if results[name]["status"] == "ok":
+                print(f"✅ {name} : plan généré ({results[name]['duration_s']} s)")
+            else:
+                print(f"❌ {name} : {results[name]['error']}")
+            if progress_callback:
+                progress_callback(int(len(results) * 100 / total), f"{len(results)}/{total} cibles traitées ({name})")
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Plans de sauvegarde RMAN pour plusieurs bases, sans interaction")
+    parser.add_argument("--policy", help="Fichier YAML des politiques par base (défaut : une entrée par dossier de datav1/targets/)")
+    parser.add_argument("--targets", default="", help="Sous-ensemble de cibles (ex : PROD1,PROD2)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Appels LLM simultanés")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    policies = load_policies(args.policy) if args.policy else discover_targets()
+    try:
+        policies = select_targets(policies, [t for t in args.targets.split(",") if t])
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    if not policies:
+        print("❌ Aucune cible : fournissez --policy ou créez des dossiers dans datav1/targets/")
+        sys.exit(1)
+
+    results = generate_plans(policies, max_workers=args.workers)
+
+    print("\n--- RÉSUMÉ DES PLANS DE SAUVEGARDE ---")
+    for name in sorted(results):
+        entry = results[name]
+        detail = entry.get("plan") if entry["status"] == "ok" else entry.get("error")
+        print(f"{name:<20} {entry['status']:<8} {entry['duration_s']:>8} s  {detail}")
+    sys.exit(0 if all(e["status"] == "ok" for e in results.values()) else 1)
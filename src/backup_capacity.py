@@ -0,0 +1,243 @@
+import os
+import re
+import pandas as pd
+
+GB = 1024 ** 3
+MB = 1024 ** 2
+
+# Débits par défaut (octets/s et par canal RMAN) si l'historique RMAN ne permet pas de les mesurer
+DEFAULT_CHANNEL_THROUGHPUT = float(os.getenv("BACKUP_CHANNEL_MBPS", "150")) * MB
+DEFAULT_RESTORE_THROUGHPUT = float(os.getenv("RESTORE_CHANNEL_MBPS", "200")) * MB
+# Débit d'application du redo pendant le recover (mono-processus de récupération)
+REDO_APPLY_THROUGHPUT = float(os.getenv("REDO_APPLY_MBPS", "40")) * MB
+# Fenêtre de sauvegarde disponible (heures)
+DEFAULT_BACKUP_WINDOW_HOURS = float(os.getenv("BACKUP_WINDOW_HOURS", "8"))
+# Part du volume de redo qui correspond à des blocs distincts modifiés (incrémentale niveau 1)
+REDO_TO_CHANGED_BLOCKS = 0.5
+# Nombre maximal de canaux selon le budget déclaré
+MAX_CHANNELS_BY_BUDGET = {"bas": 2, "moyen": 4, "haut": 8}
+
+_DURATION_UNITS = [
+    (("semaine", "semaines", "sem", "w", "week", "weeks"), 168.0),
+    (("j", "jour", "jours", "d", "day", "days"), 24.0),
+    (("h", "heure", "heures", "hr", "hrs", "hour", "hours"), 1.0),
+    (("min", "mins", "minute", "minutes", "mn", "m"), 1 / 60),
+    (("s", "sec", "secs", "seconde", "secondes"), 1 / 3600),
+]
+
+
+def parse_duration_hours(value):
+    """'15min' / '4h' / '2 jours' / '1 semaine' -> durée en heures ; None si illisible."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.match(r"^\s*(\d+(?:[.,]\d+)?)?\s*([a-zA-Zéè]*)", str(value or ""))
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    amount = float((match.group(1) or "1").replace(",", "."))
+    unit = match.group(2).lower() or "h"
+    for names, hours in _DURATION_UNITS:
+        if unit in names:
+            return amount * hours
+    return None
+
+
+def _read_csv(data_dir, filename):
+    path = os.path.join(data_dir, filename)
+    if not os.path.exists(path):
+        return None
+    try:
+        return pd.read_csv(path)
+    except (OSError, ValueError):
+        return None
+
+
+class BackupCapacityModel:
+    """
+    Modèle déterministe de fenêtre de sauvegarde et de capacité de restauration.
+    Les durées RMAN sont bornées par le débit agrégé des canaux et par le plus gros datafile
+    (un datafile est lu par un seul canal sans SECTION SIZE).
+    """
+
+    def __init__(self, db_bytes, datafile_count, largest_datafile_bytes, redo_bytes_per_hour,
+                 peak_redo_bytes_per_hour=None, bct_enabled=False, archivelog_mode=True,
+                 channel_throughput=DEFAULT_CHANNEL_THROUGHPUT, restore_throughput=DEFAULT_RESTORE_THROUGHPUT,
+                 throughput_source="défaut"):
+        self.db_bytes = float(db_bytes)
+        self.datafile_count = max(1, int(datafile_count))
+        self.largest_datafile_bytes = float(largest_datafile_bytes or 0)
+        self.redo_bytes_per_hour = float(redo_bytes_per_hour or 0)
+        self.peak_redo_bytes_per_hour = float(peak_redo_bytes_per_hour or self.redo_bytes_per_hour)
+        self.bct_enabled = bct_enabled
+        self.archivelog_mode = archivelog_mode
+        self.channel_throughput = float(channel_throughput)
+        self.restore_throughput = float(restore_throughput)
+        self.throughput_source = throughput_source
+
+    # --- CONSTRUCTION DEPUIS LES CSV DU MODULE 1 ---
+
+    @classmethod
+    def from_extracted_data(cls, data_dir="datav1"):
+        """
+        Construit le modèle à partir de segment_sizes.csv, datafiles.csv, archive_rates.csv,
+        database_info.csv et rman_jobs.csv (optionnel). None si la volumétrie est inconnue.
+        """
+        segments = _read_csv(data_dir, "segment_sizes.csv")
+        datafiles = _read_csv(data_dir, "datafiles.csv")
+        if datafiles is not None and 'BYTES' in datafiles.columns and len(datafiles):
+            datafile_bytes = pd.to_numeric(datafiles['BYTES'], errors='coerce').fillna(0)
+            allocated, count, largest = datafile_bytes.sum(), len(datafiles), datafile_bytes.max()
+        else:
+            allocated, count, largest = 0, 0, 0
+        used = 0
+        if segments is not None and 'BYTES' in segments.columns:
+            used = pd.to_numeric(segments['BYTES'], errors='coerce').fillna(0).sum()
+        # RMAN (backupset) ne lit que les blocs utilisés : taille des segments, sinon taille allouée
+        db_bytes = used or allocated
+        if not db_bytes:
+            return None
+
+        redo_avg = redo_peak = 0
+        archives = _read_csv(data_dir, "archive_rates.csv")
+        if archives is not None and 'BYTES' in archives.columns and len(archives):
+            hourly = pd.to_numeric(archives['BYTES'], errors='coerce').fillna(0)
+            hours_observed = max(1, int(archives['HOURS_OBSERVED'].iloc[0])) if 'HOURS_OBSERVED' in archives.columns else len(hourly)
+            redo_avg = hourly.sum() / hours_observed
+            redo_peak = hourly.quantile(0.95)
+
+        bct, archivelog = False, True
+        info = _read_csv(data_dir, "database_info.csv")
+        if info is not None and len(info):
+            row = info.iloc[0]
+            bct = str(row.get('BCT_STATUS', '')).upper() == 'ENABLED'
+            archivelog = str(row.get('LOG_MODE', 'ARCHIVELOG')).upper() == 'ARCHIVELOG'
+
+        throughput, source = DEFAULT_CHANNEL_THROUGHPUT, "défaut"
+        jobs = _read_csv(data_dir, "rman_jobs.csv")
+        if jobs is not None and 'INPUT_BYTES_PER_SEC' in jobs.columns:
+            throughput, source = cls.measured_channel_throughput(jobs) or (throughput, source)
+
+        return cls(db_bytes, count or 1, largest, redo_avg, redo_peak, bct, archivelog,
+                   channel_throughput=throughput, throughput_source=source)
+
+    @staticmethod
+    def measured_channel_throughput(jobs):
+        """
+        Débit médian par canal des jobs RMAN (rman_jobs.csv) : débit agrégé de chaque job divisé par
+        ses canaux (PARALLELISM, 1 si absent). Retourne (débit, source) ou None sans mesure exploitable.
+        """
+        if jobs is None or 'INPUT_BYTES_PER_SEC' not in jobs.columns:
+            return None
+        rates = pd.to_numeric(jobs['INPUT_BYTES_PER_SEC'], errors='coerce')
+        channels = pd.Series(1.0, index=jobs.index)
+        if 'PARALLELISM' in jobs.columns:
+            channels = pd.to_numeric(jobs['PARALLELISM'], errors='coerce').fillna(1).clip(lower=1)
+        per_channel = (rates / channels)[rates > 0]
+        if not len(per_channel):
+            return None
+        return per_channel.median(), "historique RMAN"
+
+    # --- CALCULS ---
+
+    def effective_channels(self, channels):
+        return max(1, min(int(channels), self.datafile_count))
+
+    def _transfer_seconds(self, total_bytes, throughput, channels, largest_unit=0):
+        channels = self.effective_channels(channels)
+        return max(total_bytes / (throughput * channels), largest_unit / throughput)
+
+    def daily_changed_bytes(self):
+        return min(self.db_bytes, self.redo_bytes_per_hour * 24 * REDO_TO_CHANGED_BLOCKS)
+
+    def full_backup_seconds(self, channels):
+        return self._transfer_seconds(self.db_bytes, self.channel_throughput, channels, self.largest_datafile_bytes)
+
+    def incremental_backup_seconds(self, channels):
+        """Niveau 1 : avec BCT seuls les blocs modifiés sont lus, sinon toute la base est parcourue."""
+        changed = self.daily_changed_bytes()
+        if self.bct_enabled:
+            return self._transfer_seconds(changed, self.channel_throughput, channels)
+        return self._transfer_seconds(self.db_bytes, self.channel_throughput, channels, self.largest_datafile_bytes)
+
+    def archive_bytes_per_interval(self, hours):
+        """
+        Volume d'archivelogs à sauvegarder par intervalle RPO : débit de pointe pour les intervalles
+        courts (pire cas), débit moyen au-delà d'une heure.
+        """
+        return max(self.redo_bytes_per_hour * hours, self.peak_redo_bytes_per_hour * min(hours, 1))
+
+    def restore_seconds(self, channels, redo_hours_to_apply=24):
+        """Restore de la dernière full + application d'une incrémentale + redo depuis la dernière sauvegarde."""
+        restore = self._transfer_seconds(self.db_bytes, self.restore_throughput, channels, self.largest_datafile_bytes)
+        incremental = self._transfer_seconds(self.daily_changed_bytes(), self.restore_throughput, channels)
+        redo = self.redo_bytes_per_hour * redo_hours_to_apply / REDO_APPLY_THROUGHPUT
+        return restore + incremental + redo
+
+    def recommend_channels(self, window_hours, rto_hours, max_channels):
+        """Plus petit parallélisme qui tient la fenêtre de sauvegarde et le RTO ; max_channels sinon."""
+        limit = self.effective_channels(max_channels)
+        for channels in range(1, limit + 1):
+            fits_window = self.full_backup_seconds(channels) <= window_hours * 3600
+            fits_rto = rto_hours is None or self.restore_seconds(channels) <= rto_hours * 3600
+            if fits_window and fits_rto:
+                return channels
+        return limit
+
+    def report(self, rpo="24h", rto="4h", budget="Moyen", window_hours=None):
+        """Chiffres injectés dans le prompt du BackupRecommender (tailles en Go, durées en heures)."""
+        rpo_hours = parse_duration_hours(rpo)
+        rto_hours = parse_duration_hours(rto)
+        window_hours = window_hours or DEFAULT_BACKUP_WINDOW_HOURS
+        max_channels = MAX_CHANNELS_BY_BUDGET.get(str(budget).strip().lower(), 4)
+        channels = self.recommend_channels(window_hours, rto_hours, max_channels)
+        restore_h = self.restore_seconds(channels) / 3600
+        archive_interval = rpo_hours if rpo_hours else 24
+
+        return {
+            "taille_base_go": round(self.db_bytes / GB, 1),
+            "nb_datafiles": self.datafile_count,
+            "plus_gros_datafile_go": round(self.largest_datafile_bytes / GB, 1),
+            "redo_moyen_go_par_heure": round(self.redo_bytes_per_hour / GB, 2),
+            "redo_pointe_go_par_heure": round(self.peak_redo_bytes_per_hour / GB, 2),
+            "mode_archivelog": self.archivelog_mode,
+            "block_change_tracking": self.bct_enabled,
+            "debit_canal_mo_s": round(self.channel_throughput / MB),
+            "source_debit": self.throughput_source,
+            "parallelisme_recommande": channels,
+            "parallelisme_max_budget": max_channels,
+            "fenetre_sauvegarde_h": window_hours,
+            "duree_full_h": round(self.full_backup_seconds(channels) / 3600, 2),
+            "duree_incrementale_n1_h": round(self.incremental_backup_seconds(channels) / 3600, 2),
+            "volume_modifie_jour_go": round(self.daily_changed_bytes() / GB, 1),
+            "archivelogs_par_intervalle_rpo_go": round(self.archive_bytes_per_interval(archive_interval) / GB, 2),
+            "intervalle_rpo_h": round(archive_interval, 2),
+            "duree_restauration_h": round(restore_h, 2),
+            "rto_h": rto_hours,
+            "rto_respecte": rto_hours is None or restore_h <= rto_hours,
+            "fenetre_respectee": self.full_backup_seconds(channels) <= window_hours * 3600,
+        }
+
+
+def apply_parallelism(rman_script, channels):
+    """Impose le parallélisme calculé dans le script RMAN (remplace ou ajoute CONFIGURE ... PARALLELISM)."""
+    if re.search(r"PARALLELISM\s+\d+", rman_script, re.IGNORECASE):
+        return re.sub(r"(PARALLELISM\s+)\d+", rf"\g<1>{channels}", rman_script, flags=re.IGNORECASE)
+    device = "SBT" if re.search(r"\bSBT", rman_script, re.IGNORECASE) else "DISK"
+    return f"CONFIGURE DEVICE TYPE {device} PARALLELISM {channels};\n{rman_script}"
+
+
+# --- TEST DE VALIDATION DU MODULE ---
+if __name__ == "__main__":
+    # Débit agrégé de chaque job rapporté à ses canaux : 400 Mo/s sur 4 canaux -> 100 Mo/s par canal
+    test_jobs = pd.DataFrame({"INPUT_BYTES_PER_SEC": [400 * MB, 200 * MB, 90 * MB, 0],
+                              "PARALLELISM": [4, 2, None, 8]})
+    rate, _ = BackupCapacityModel.measured_channel_throughput(test_jobs)
+    without_channels, _ = BackupCapacityModel.measured_channel_throughput(test_jobs.drop(columns="PARALLELISM"))
+    model = BackupCapacityModel(400 * GB, 8, 10 * GB, 0, channel_throughput=rate)
+
+    print(f"🔍 Débit par canal mesuré : {rate / MB:.0f} Mo/s (sans PARALLELISM : {without_channels / MB:.0f} Mo/s)")
+    # Full de 400 Go sur 4 canaux à 100 Mo/s par canal : 1024 s
+    if round(rate / MB) == 100 and round(without_channels / MB) == 200 and round(model.full_backup_seconds(4)) == 1024:
+        print("✅ TEST RÉUSSI : le débit des jobs est divisé par leurs canaux avant d'être multiplié par le parallélisme.")
+    else:
+        print("❌ TEST ÉCHOUÉ : débit par canal incorrect.")
+        raise SystemExit(1)
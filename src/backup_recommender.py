@@ -1,16 +1,78 @@
+import argparse
 import json
 import os
 import pandas as pd
 import re
+import sys
 from llm_engine import LLMEngine
+from result_store import ResultStore
+from backup_capacity import BackupCapacityModel, apply_parallelism
+from fleet import selected_target, target_data_dir
+from llm_scheduler import raise_if_cancelled
+import metrics
+import profiling
+
+class PlanSectionParser:
+    """
+    Découpage incrémental de la réponse du LLM en sections ---JSON--- / ---RMAN---.
+    Alimenté morceau par morceau (streaming), il émet on_section(nom, texte) dès qu'une section
+    est complète : le JSON à l'arrivée du marqueur ---RMAN---, le script RMAN à la fin du flux.
+    Un marqueur coupé entre deux morceaux est reconnu.
+    """
+
+    MARKERS = (("json", "---JSON---"), ("rman", "---RMAN---"))
+
+    def __init__(self, on_section=None):
+        self.on_section = on_section
+        self.sections = {}
+        self._buffer = ""
+        self._current = None
+        self._start = 0
+        self._scan = 0
+        self._overlap = max(len(marker) for _, marker in self.MARKERS) - 1
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        while True:
+            found = None
+            for name, marker in self.MARKERS:
+                if name in self.sections or name == self._current:
+                    continue
+                idx = self._buffer.find(marker, self._scan)
+                if idx != -1 and (found is None or idx < found[1]):
+                    found = (name, idx, len(marker))
+            if found is None:
+                # On ne re-scanne que la fin du tampon, qui peut contenir un début de marqueur
+                self._scan = max(self._scan, len(self._buffer) - self._overlap)
+                return
+            name, idx, length = found
+            self._emit(idx)
+            self._current = name
+            self._start = self._scan = idx + length
+
+    def _emit(self, end):
+        if self._current is None:
+            return
+        name, text = self._current, self._buffer[self._start:end].strip()
+        self.sections[name] = text
+        self._current = None
+        if self.on_section:
+            self.on_section(name, text)
+
+    def close(self):
+        """Fin du flux : émet la section en cours et retourne la réponse complète."""
+        self._emit(len(self._buffer))
+        return self._buffer
+
 
 class BackupRecommender:
-    def __init__(self):
-        # Initialisation du moteur IA 
-        self.engine = LLMEngine() 
+    def __init__(self, data_dir="datav1", engine=None):
+        # Initialisation du moteur IA (partageable entre plusieurs recommandeurs en mode batch)
+        self.engine = engine or LLMEngine()
         # Chemins vers les fichiers de métriques générés par le Module 1
-        self.metrics_path = "datav1/performance_metrics.csv"
-        self.roles_path = "datav1/dba_roles.csv" 
+        self.data_dir = data_dir
+        self.metrics_path = os.path.join(data_dir, "performance_metrics.csv")
+        self.roles_path = os.path.join(data_dir, "dba_roles.csv")
 
     def fetch_real_metrics(self):
         """
@@ -21,6 +83,12 @@ class BackupRecommender:
             "volume_transactions": "Faible", 
             "criticite": "Standard"
         }
+
+        # 0. Volumétrie réelle (segments, datafiles, redo) si extraite par le Module 1
+        model = BackupCapacityModel.from_extracted_data(self.data_dir)
+        if model:
+            metrics["taille"] = f"{model.db_bytes / 1024 ** 3:.1f} Go utilisés ({model.datafile_count} datafiles)"
+            metrics["redo_par_heure"] = f"{model.redo_bytes_per_hour / 1024 ** 3:.2f} Go (pointe {model.peak_redo_bytes_per_hour / 1024 ** 3:.2f} Go)"
         
         # 1. Volume de transactions (via V$SQLSTAT simulé)
         if os.path.exists(self.metrics_path):
@@ -55,38 +123,55 @@ class BackupRecommender:
         
         return {"rpo": rpo, "rto": rto, "budget": budget}
 
-    def generate_full_plan(self):
+    @metrics.track_agent("backup")
+    @profiling.profiled("generate_full_plan")
+    def generate_full_plan(self, user_reqs=None, on_section=None):
         """
         Génère la stratégie JSON et le script RMAN via l'IA avec découpage strict.
+        user_reqs : {"rpo", "rto", "budget"} ; si absent, les questions sont posées en console.
+        on_section(nom, texte) : si fourni, la réponse est lue en streaming et chaque section
+        ("json", "rman") est transmise dès qu'elle est complète.
+        Si l'appel LLM échoue ou si la stratégie JSON ou le script RMAN manque, retourne
+        ({"error": ...}, "") comme les autres agents : rien à enregistrer.
         """
         db_metrics = self.fetch_real_metrics()
-        user_reqs = self.ask_user_questions()
+        if user_reqs is None:
+            user_reqs = self.ask_user_questions()
+
+        # Modèle de capacité : durées et parallélisme calculés, pas laissés à l'appréciation du LLM
+        capacity = self.compute_capacity(user_reqs)
         
         # Construction du prompt
         template = self.engine.prompts['backup']['prompt']
         final_prompt = template.format(
             metrics=json.dumps(db_metrics, ensure_ascii=False),
-            user_inputs=json.dumps(user_reqs, ensure_ascii=False)
+            user_inputs=json.dumps(user_reqs, ensure_ascii=False),
+            capacity=json.dumps(capacity, ensure_ascii=False) if capacity else "Volumétrie non extraite (estimation impossible)."
         )
         
         print("\n🧠 L'IA analyse les contraintes et génère la stratégie...")
-        full_response = self.engine.generate(final_prompt)
-        
+        parser = PlanSectionParser(on_section)
+        if on_section:
+            for chunk in self.engine.generate_stream(final_prompt):
+                parser.feed(chunk)
+        else:
+            parser.feed(self.engine.generate(final_prompt))
+        full_response = parser.close()
+        # Échec de l'appel LLM, y compris en cours de flux (dernier morceau = message d'erreur)
+        failure = full_response.find("❌ Erreur DeepSeek")
+        if failure != -1:
+            return {"error": full_response[failure:]}, ""
+
         strategy_json = {}
         rman_script = ""
 
         # --- LOGIQUE D'EXTRACTION CORRIGÉE ---
-        
+
         # Cas 1 (Idéal) : L'IA a respecté les marqueurs demandés dans le prompt
-        if "---JSON---" in full_response and "---RMAN---" in full_response:
+        if "json" in parser.sections and "rman" in parser.sections:
             try:
-                # On coupe tout ce qui est entre ---JSON--- et ---RMAN---
-                parts = full_response.split("---RMAN---")
-                json_part = parts[0].split("---JSON---")[1].strip()
-                rman_script = parts[1].strip()
-                
-                # Parsing JSON
-                strategy_json = json.loads(json_part)
+                rman_script = parser.sections["rman"]
+                strategy_json = json.loads(parser.sections["json"])
             except Exception as e:
                 print(f"⚠️ Erreur parsing (Mode Marqueurs) : {e}")
                 # Si échec, on laisse le Cas 2 essayer
@@ -122,30 +207,71 @@ class BackupRecommender:
                 lines = [l for l in full_response.split('\n') if "BACKUP" in l or "CONFIGURE" in l or "DELETE" in l]
                 if lines:
                     rman_script = "RUN {\n" + "\n".join(lines) + "\n}"
-                else:
-                    rman_script = "/* Erreur : Aucun script RMAN valide détecté */"
+
+        # Plan incomplet : ni capacité à injecter ni fichier à écraser
+        if not strategy_json:
+            return {"error": "Réponse LLM non exploitable (aucune stratégie JSON)", "raw_sample": full_response[:100]}, ""
+        if "error" in strategy_json:
+            return strategy_json, ""
+        if not rman_script:
+            return {"error": "Réponse LLM non exploitable (aucun script RMAN valide)", "raw_sample": full_response[:100]}, ""
+
+        # Le parallélisme calculé fait foi dans le script et la stratégie
+        if capacity:
+            rman_script = apply_parallelism(rman_script, capacity["parallelisme_recommande"])
+            strategy_json["parallelisme"] = capacity["parallelisme_recommande"]
+            strategy_json["capacite"] = capacity
 
         return strategy_json, rman_script
 
+    def compute_capacity(self, user_reqs):
+        """
+        Chiffres du modèle de capacité pour les besoins RPO/RTO/budget (None sans volumétrie extraite).
+        user_reqs peut préciser "fenetre" (heures disponibles pour la sauvegarde).
+        """
+        model = BackupCapacityModel.from_extracted_data(self.data_dir)
+        if model is None:
+            return None
+        return model.report(
+            rpo=user_reqs.get("rpo", "24h"),
+            rto=user_reqs.get("rto", "4h"),
+            budget=user_reqs.get("budget", "Moyen"),
+            window_hours=user_reqs.get("fenetre")
+        )
+
+    def save_plan(self, strategy_json, rman_script, output_dir="datav1"):
+        """
+        Enregistre la stratégie et le script comme nouvelle version du store de résultats,
+        puis exporte backup_plan.json et backup_script.rman. Rien n'est écrit si la tâche est annulée.
+        """
+        raise_if_cancelled()
+        json_path, rman_path = ResultStore(output_dir).publish("backup", strategy_json, artifact=rman_script)
+        return json_path, rman_path
+
 if __name__ == "__main__":
-    recommender = BackupRecommender()
-    
+    parser = argparse.ArgumentParser(description="Stratégie de sauvegarde et script RMAN")
+    parser.add_argument("--data-dir", help="Dossier des métriques et des résultats (défaut : datav1/)")
+    parser.add_argument("--target", help="Base de la flotte (dossier datav1/targets/<nom>/)")
+    parser.add_argument("--rpo", help="RPO requis (ex : 15min, 24h) ; sans --rpo/--rto/--budget, questions en console")
+    parser.add_argument("--rto", help="RTO requis (ex : 1h, 4h)")
+    parser.add_argument("--budget", help="Budget/Ressources (Bas, Moyen, Haut)")
+    args = parser.parse_args()
+
+    args.data_dir = args.data_dir or target_data_dir(args.target or selected_target([]))
+    recommender = BackupRecommender(data_dir=args.data_dir)
+    user_reqs = None
+    if args.rpo or args.rto or args.budget:
+        user_reqs = {"rpo": args.rpo or "24h", "rto": args.rto or "4h", "budget": args.budget or "Moyen"}
+
     # 1. Exécution du processus
-    json_res, rman_res = recommender.generate_full_plan()
-    
-    # 2. Sauvegarde des fichiers sur le disque (C'est ce qui manquait !)
-    output_dir = "datav1"
-    os.makedirs(output_dir, exist_ok=True) # Crée le dossier s'il n'existe pas
-
-    # Sauvegarde du JSON
-    json_path = os.path.join(output_dir, "backup_plan.json")
-    with open(json_path, "w", encoding='utf-8') as f:
-        json.dump(json_res, f, indent=4, ensure_ascii=False)
-    
-    # Sauvegarde du script RMAN
-    rman_path = os.path.join(output_dir, "backup_script.rman")
-    with open(rman_path, "w", encoding='utf-8') as f:
-        f.write(rman_res)
+    json_res, rman_res = recommender.generate_full_plan(user_reqs)
+    if "error" in json_res:
+        print(f"❌ Plan non généré : {json_res['error']}")
+        sys.exit(1)
+
+    # 2. Sauvegarde des fichiers sur le disque
+    output_dir = args.data_dir
+    json_path, rman_path = recommender.save_plan(json_res, rman_res, output_dir)
 
     # 3. Affichage de confirmation et des résultats
     print(f"\n✅ Fichiers générés avec succès dans '{output_dir}/' :")
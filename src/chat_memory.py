@@ -0,0 +1,157 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from llm_scheduler import estimate_tokens
+import metrics
+
+SUMMARY_RUNS = metrics.counter("chat_summary_runs_total", "Mises à jour des résumés de conversation", ("status",))
+SUMMARY_DURATION = metrics.histogram("chat_summary_duration_seconds", "Durée des mises à jour de résumé")
+
+SUMMARY_PROMPT = (
+    "Tu maintiens la mémoire d'une conversation entre un DBA et son assistant Oracle.\n"
+    "Mets à jour le RÉSUMÉ EXISTANT en y intégrant les NOUVEAUX ÉCHANGES.\n"
+    "Conserve les faits utiles pour la suite : base et objets concernés, problèmes signalés, "
+    "décisions prises, commandes déjà proposées (sans les recopier en entier), questions en suspens.\n"
+    "Réponds uniquement par le résumé, en français, {max_words} mots maximum."
+)
+
+
+def truncate_to_tokens(text, tokens):
+    max_chars = max(0, tokens * 4)
+    return text if len(text) <= max_chars else text[:max_chars].rstrip() + " [...]"
+
+
+def format_message(message):
+    role = "UTILISATEUR" if message['role'] == 'user' else "ASSISTANT"
+    return f"{role}: {message['content']}"
+
+
+class ChatMemory:
+    """
+    Mémoire par session du chatbot :
+    - les `recent_messages` derniers messages sont repris tels quels ;
+    - les messages plus anciens sont intégrés progressivement à un résumé persistant
+      (ChatStore.save_summary), calculé en arrière-plan après la réponse ; en attendant,
+      ils restent repris tels quels ;
+    - la section historique du prompt ne dépasse jamais `token_budget` tokens.
+    Configuration par défaut : CHAT_HISTORY_TOKEN_BUDGET (1200), CHAT_RECENT_MESSAGES (6)
+    et CHAT_SUMMARY_BATCH (4 messages minimum par mise à jour du résumé).
+    """
+
+    SUMMARY_MAX_WORDS = 150
+    # Part du budget réservée au résumé, et part maximale d'un message isolé (scripts RMAN...)
+    SUMMARY_SHARE = 0.4
+    MESSAGE_SHARE = 0.35
+    # Taille maximale d'un message transmis au résumeur
+    SUMMARIZER_MESSAGE_TOKENS = 500
+    # Messages non résumés lus au plus par requête (au-delà, le budget est de toute façon dépassé)
+    MAX_UNSUMMARIZED_MESSAGES = 50
+
+    def __init__(self, store, token_budget=None, recent_messages=None, summary_batch=None):
+        self.store = store
+        self.token_budget = token_budget or int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1200"))
+        self.recent_messages = recent_messages or int(os.getenv("CHAT_RECENT_MESSAGES", "6"))
+        self.summary_batch = summary_batch or int(os.getenv("CHAT_SUMMARY_BATCH", "4"))
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-summary")
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    # --- CHEMIN DE LA REQUÊTE ---
+
+    def build_history(self, session_id):
+        """
+        Section historique du prompt : résumé puis messages non encore résumés (du plus ancien au
+        plus récent), tronqués pour tenir dans le budget. Ne lit que l'index et la fin du journal.
+        Les messages sortis de la fenêtre récente mais pas encore intégrés au résumé (lot incomplet,
+        mise à jour en cours) restent ainsi dans le prompt.
+        """
+        memory = self.store.get_summary(session_id)
+        window = self.recent_messages
+        if memory:
+            unsummarized = memory['message_count'] - memory['summarized_count']
+            window = min(max(window, unsummarized), self.MAX_UNSUMMARIZED_MESSAGES)
+        recent = self.store.load_tail(session_id, window)
+        if not recent and not (memory and memory['summary']):
+            return "Aucun historique précédent."
+
+        budget = self.token_budget
+        sections = []
+        if memory and memory['summary']:
+            summary = truncate_to_tokens(memory['summary'], int(budget * self.SUMMARY_SHARE))
+            sections.append(f"RÉSUMÉ DES ÉCHANGES PRÉCÉDENTS : {summary}")
+            budget -= estimate_tokens(sections[0])
+
+        # Les messages les plus récents sont prioritaires : on remplit le budget à rebours
+        message_cap = int(self.token_budget * self.MESSAGE_SHARE)
+        lines = []
+        for message in reversed(recent):
+            line = truncate_to_tokens(format_message(message), message_cap)
+            cost = estimate_tokens(line)
+            if cost > budget:
+                if budget > 20:
+                    lines.append(truncate_to_tokens(line, budget))
+                break
+            lines.append(line)
+            budget -= cost
+        sections.extend(reversed(lines))
+        return "\n".join(sections)
+
+    # --- HORS CHEMIN DE LA REQUÊTE ---
+
+    def schedule_update(self, session_id, summarize):
+        """
+        Planifie (au plus une fois par session à la fois) l'intégration au résumé des messages
+        sortis de la fenêtre récente. `summarize(prompt) -> texte` est typiquement LLMEngine.generate.
+        """
+        memory = self.store.get_summary(session_id)
+        if memory is None:
+            return False
+        foldable = memory['message_count'] - self.recent_messages - memory['summarized_count']
+        if foldable < self.summary_batch:
+            return False
+        with self._lock:
+            if session_id in self._pending:
+                return False
+            self._pending.add(session_id)
+        self._executor.submit(self._update, session_id, summarize)
+        return True
+
+    def _update(self, session_id, summarize):
+        status = "error"
+        try:
+            with SUMMARY_DURATION.time():
+                status = self.update_summary(session_id, summarize)
+        except Exception as e:
+            print(f"⚠️ Résumé de la session {session_id} impossible : {e}")
+        finally:
+            SUMMARY_RUNS.inc(status=status)
+            with self._lock:
+                self._pending.discard(session_id)
+
+    def update_summary(self, session_id, summarize):
+        """Intègre au résumé les messages plus anciens que la fenêtre récente ; retourne le statut."""
+        memory = self.store.get_summary(session_id)
+        if memory is None:
+            return "skipped"
+        messages = self.store.load(session_id)
+        end = len(messages) - self.recent_messages
+        start = memory['summarized_count']
+        if end - start < 1:
+            return "skipped"
+
+        new_lines = "\n".join(
+            truncate_to_tokens(format_message(m), self.SUMMARIZER_MESSAGE_TOKENS) for m in messages[start:end]
+        )
+        prompt = (
+            f"{SUMMARY_PROMPT.format(max_words=self.SUMMARY_MAX_WORDS)}\n\n"
+            f"--- RÉSUMÉ EXISTANT ---\n{memory['summary'] or 'Aucun.'}\n\n"
+            f"--- NOUVEAUX ÉCHANGES ---\n{new_lines}"
+        )
+        summary = summarize(prompt).strip()
+        if not summary or summary.startswith("❌ Erreur"):
+            return "error"
+        self.store.save_summary(session_id, summary, end)
+        return "ok"
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,374 @@
+import os
+import json
+import glob
+import base64
+import sqlite3
+import threading
+from datetime import datetime
+
+try:
+    import fcntl  # Verrou inter-processus (POSIX)
+except ImportError:  # Windows : verrou limité au processus courant
+    fcntl = None
+
+
+class ChatStore:
+    """
+    Persistance des conversations du chatbot.
+    - Chaque session est un journal append-only session_<id>.jsonl (un message par ligne) :
+      un échange n'écrit que ses deux nouvelles lignes, sous verrou exclusif.
+    - Les anciens fichiers session_<id>.json sont toujours lisibles et migrés au premier ajout.
+    - Les métadonnées (id, titre, date, nb de messages) sont indexées dans SQLite (mode WAL),
+      maintenues à chaque ajout/suppression : lister les sessions ne lit jamais les messages.
+    - Le résumé glissant de la conversation (voir chat_memory.py) est stocké dans la même ligne.
+    """
+
+    INDEX_FILE = "sessions_index.sqlite3"
+    # Réécriture (compaction) du journal tous les N enregistrements ajoutés
+    COMPACT_EVERY = 50
+    # Taille des blocs lus depuis la fin du fichier pour load_tail()
+    TAIL_BLOCK_SIZE = 8192
+
+    def __init__(self, chats_dir):
+        self.chats_dir = chats_dir
+        os.makedirs(self.chats_dir, exist_ok=True)
+        self.index_path = os.path.join(self.chats_dir, self.INDEX_FILE)
+        self._local = threading.local()
+        self._thread_locks = {}
+        self._thread_locks_guard = threading.Lock()
+        self._init_index()
+
+    # --- INDEX SQLITE ---
+
+    def _conn(self):
+        """Une connexion par thread (les threads Flask ne partagent pas la connexion)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.index_path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_index(self):
+        conn = self._conn()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    last_update TEXT NOT NULL,
+                    message_count INTEGER NOT NULL DEFAULT 0,
+                    appends_since_compact INTEGER NOT NULL DEFAULT 0,
+                    summary TEXT NOT NULL DEFAULT '',
+                    summarized_count INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(sessions)")]
+            if 'appends_since_compact' not in columns:
+                conn.execute("ALTER TABLE sessions ADD COLUMN appends_since_compact INTEGER NOT NULL DEFAULT 0")
+            if 'summary' not in columns:
+                conn.execute("ALTER TABLE sessions ADD COLUMN summary TEXT NOT NULL DEFAULT ''")
+                conn.execute("ALTER TABLE sessions ADD COLUMN summarized_count INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_update ON sessions(last_update DESC, id DESC)")
+        # Migration : première ouverture sur un dossier contenant déjà des sessions
+        if conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] == 0:
+            self.rebuild_index()
+
+    def rebuild_index(self):
+        """Reconstruit l'index à partir des fichiers de session (opération ponctuelle)."""
+        session_ids = set()
+        for pattern in ("session_*.jsonl", "session_*.json"):
+            for fpath in glob.glob(os.path.join(self.chats_dir, pattern)):
+                name = os.path.basename(fpath)
+                session_ids.add(name[len("session_"):name.rindex(".json")])
+
+        conn = self._conn()
+        # Les résumés ne sont pas reconstructibles depuis les journaux : on les conserve
+        summaries = {r[0]: (r[1], r[2]) for r in conn.execute("SELECT id, summary, summarized_count FROM sessions")}
+        rows = []
+        for session_id in session_ids:
+            messages = self.load(session_id)
+            if not messages:
+                continue
+            last_update = messages[-1].get('ts') or self._legacy_last_update(session_id)
+            summary, summarized_count = summaries.get(session_id, ('', 0))
+            rows.append((session_id, self.make_title(messages), last_update, len(messages), 0,
+                         summary, min(summarized_count, len(messages))))
+        with conn:
+            conn.execute("DELETE FROM sessions")
+            conn.executemany(
+                """INSERT OR REPLACE INTO sessions
+                   (id, title, last_update, message_count, appends_since_compact, summary, summarized_count)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                rows
+            )
+        return len(rows)
+
+    def _record_append(self, session_id, title, last_update, added):
+        """Met à jour l'index après un ajout ; retourne le nb d'ajouts depuis la dernière compaction."""
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                """INSERT INTO sessions (id, title, last_update, message_count, appends_since_compact)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(id) DO UPDATE SET last_update=excluded.last_update,
+                       message_count=message_count + excluded.message_count,
+                       appends_since_compact=appends_since_compact + excluded.appends_since_compact""",
+                (session_id, title, last_update, added, added)
+            )
+            row = conn.execute("SELECT appends_since_compact FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    # --- FICHIERS DE SESSION ---
+
+    def _log_path(self, session_id):
+        return os.path.join(self.chats_dir, f"session_{session_id}.jsonl")
+
+    def _legacy_path(self, session_id):
+        return os.path.join(self.chats_dir, f"session_{session_id}.json")
+
+    def _load_legacy(self, session_id):
+        try:
+            with open(self._legacy_path(session_id), 'r', encoding='utf-8') as f:
+                return json.load(f).get('messages', [])
+        except (OSError, ValueError):
+            return []
+
+    def _legacy_last_update(self, session_id):
+        try:
+            with open(self._legacy_path(session_id), 'r', encoding='utf-8') as f:
+                return json.load(f).get('last_update', '')
+        except (OSError, ValueError):
+            return ''
+
+    @staticmethod
+    def _parse_lines(lines):
+        """Décode les lignes JSONL ; une ligne tronquée (écriture interrompue) est ignorée."""
+        messages = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('role') in ('user', 'assistant'):
+                messages.append(record)
+        return messages
+
+    @staticmethod
+    def _dump_lines(messages):
+        return "".join(json.dumps(m, ensure_ascii=False) + "\n" for m in messages)
+
+    @staticmethod
+    def make_title(messages):
+        """Titre basé sur le premier message utilisateur s'il existe."""
+        first_user_msg = next((m['content'] for m in messages if m['role'] == 'user'), None)
+        if not first_user_msg:
+            return "Nouvelle conversation"
+        return first_user_msg[:30] + "..." if len(first_user_msg) > 30 else first_user_msg
+
+    # --- VERROUILLAGE ---
+
+    def _thread_lock(self, path):
+        with self._thread_locks_guard:
+            return self._thread_locks.setdefault(path, threading.Lock())
+
+    def _open_locked(self, path):
+        """
+        Ouvre le journal en ajout sous verrou exclusif.
+        Si une compaction a remplacé le fichier pendant l'attente du verrou, on rouvre le nouveau.
+        """
+        while True:
+            f = open(path, 'a', encoding='utf-8')
+            if fcntl is None:
+                return f
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                if os.fstat(f.fileno()).st_ino == os.stat(path).st_ino:
+                    return f
+            except FileNotFoundError:
+                pass
+            f.close()
+
+    # --- API ---
+
+    def append(self, session_id, new_messages):
+        """
+        Ajoute uniquement les nouveaux messages à la fin du journal de la session.
+        Deux onglets sur la même session ne peuvent plus s'écraser mutuellement.
+        """
+        now = datetime.now().isoformat()
+        records = [dict(m, ts=m.get('ts', now)) for m in new_messages]
+        path = self._log_path(session_id)
+
+        with self._thread_lock(path):
+            f = self._open_locked(path)
+            try:
+                payload = ""
+                if f.tell() == 0 and os.path.exists(self._legacy_path(session_id)):
+                    # Migration d'une session au format JSON complet vers le journal
+                    payload = self._dump_lines(self._load_legacy(session_id))
+                f.write(payload + self._dump_lines(records))
+                f.flush()
+                os.fsync(f.fileno())
+                if payload:
+                    os.remove(self._legacy_path(session_id))
+            finally:
+                f.close()
+
+        first = records if payload == "" else self._parse_lines(payload.splitlines()) + records
+        appended = self._record_append(session_id, self.make_title(first), now, len(records))
+        if payload:
+            # L'index ne comptait pas encore les messages migrés
+            self._set_message_count(session_id)
+        if appended >= self.COMPACT_EVERY:
+            self.compact(session_id)
+
+    def _set_message_count(self, session_id):
+        conn = self._conn()
+        with conn:
+            conn.execute("UPDATE sessions SET message_count = ? WHERE id = ?",
+                         (len(self.load(session_id)), session_id))
+
+    def compact(self, session_id):
+        """
+        Réécrit le journal de manière atomique (fichier temporaire + os.replace) :
+        supprime les lignes tronquées ou invalides laissées par une écriture interrompue.
+        """
+        path = self._log_path(session_id)
+        if not os.path.exists(path):
+            return
+        with self._thread_lock(path):
+            f = self._open_locked(path)
+            try:
+                with open(path, 'r', encoding='utf-8') as src:
+                    messages = self._parse_lines(src)
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as tmp:
+                    tmp.write(self._dump_lines(messages))
+                    tmp.flush()
+                    os.fsync(tmp.fileno())
+                os.replace(tmp_path, path)
+            finally:
+                f.close()
+        conn = self._conn()
+        with conn:
+            conn.execute("UPDATE sessions SET message_count = ?, appends_since_compact = 0 WHERE id = ?",
+                         (len(messages), session_id))
+
+    def load(self, session_id):
+        """Charge tous les messages d'une session (liste vide si absente ou illisible)."""
+        path = self._log_path(session_id)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    return self._parse_lines(f)
+            except OSError:
+                return []
+        return self._load_legacy(session_id)
+
+    def load_tail(self, session_id, limit):
+        """
+        Charge uniquement les `limit` derniers messages, en lisant le journal par blocs
+        depuis la fin : le coût ne dépend pas de la longueur de la conversation.
+        """
+        path = self._log_path(session_id)
+        if not os.path.exists(path):
+            return self._load_legacy(session_id)[-limit:]
+        try:
+            with open(path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                pos = f.tell()
+                data = b""
+                # limit + 1 sauts de ligne : la première ligne du bloc peut être incomplète
+                while pos > 0 and data.count(b"\n") <= limit:
+                    step = min(self.TAIL_BLOCK_SIZE, pos)
+                    pos -= step
+                    f.seek(pos)
+                    data = f.read(step) + data
+        except OSError:
+            return []
+        lines = data.decode('utf-8', errors='ignore').splitlines()
+        if pos > 0:
+            lines = lines[1:]
+        return self._parse_lines(lines)[-limit:]
+
+    def get_summary(self, session_id):
+        """
+        Résumé glissant d'une session : {'summary', 'summarized_count', 'message_count'}
+        (summarized_count = nombre de premiers messages déjà intégrés au résumé). None si inconnue.
+        """
+        row = self._conn().execute(
+            "SELECT summary, summarized_count, message_count FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'summary': row[0], 'summarized_count': row[1], 'message_count': row[2]}
+
+    def save_summary(self, session_id, summary, summarized_count):
+        """Enregistre un résumé plus récent que celui en base (jamais de retour en arrière)."""
+        conn = self._conn()
+        with conn:
+            cur = conn.execute(
+                "UPDATE sessions SET summary = ?, summarized_count = ? WHERE id = ? AND summarized_count <= ?",
+                (summary, summarized_count, session_id, summarized_count)
+            )
+        return cur.rowcount > 0
+
+    def delete(self, session_id):
+        """Supprime une session. Retourne False si elle n'existe pas."""
+        existed = False
+        for path in (self._log_path(session_id), self._legacy_path(session_id)):
+            if os.path.exists(path):
+                os.remove(path)
+                existed = True
+        conn = self._conn()
+        with conn:
+            cur = conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        return existed or cur.rowcount > 0
+
+    # --- PAGINATION ---
+
+    @staticmethod
+    def encode_cursor(last_update, session_id):
+        raw = json.dumps([last_update, session_id]).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            last_update, session_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            return str(last_update), str(session_id)
+        except (ValueError, TypeError):
+            raise ValueError("Curseur de pagination invalide")
+
+    def list_sessions(self, limit=50, cursor=None):
+        """
+        Page de sessions triées par date décroissante (pagination par curseur / keyset).
+        Retourne (sessions, next_cursor) ; next_cursor vaut None sur la dernière page.
+        """
+        params = []
+        where = ""
+        if cursor:
+            last_update, session_id = self.decode_cursor(cursor)
+            where = "WHERE (last_update, id) < (?, ?)"
+            params.extend([last_update, session_id])
+        params.append(limit + 1)
+        rows = self._conn().execute(
+            f"SELECT id, title, last_update, message_count FROM sessions {where} "
+            "ORDER BY last_update DESC, id DESC LIMIT ?",
+            params
+        ).fetchall()
+
+        sessions = [
+            {'id': r[0], 'title': r[1], 'last_update': r[2], 'message_count': r[3]}
+            for r in rows[:limit]
+        ]
+        next_cursor = None
+        if len(rows) > limit:
+            last = sessions[-1]
+            next_cursor = self.encode_cursor(last['last_update'], last['id'])
+        return sessions, next_cursor
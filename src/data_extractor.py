@@ -2,6 +2,7 @@ import pandas as pd
 import os
 import random
 from datetime import datetime, timedelta
+from snapshot_store import SnapshotStore
 
 class OracleSimulator:
     def __init__(self, output_dir='data'):
@@ -67,8 +68,8 @@ class OracleSimulator:
         """Livrable : V$SQLSTAT, V$SQL_PLAN, V$SYSTEM_EVENT [cite: 49, 51]"""
         # 1. V$SQLSTAT & V$SQL_PLAN
         perf = [
-            {"SQL_ID": "sql_slow_001", "SQL_TEXT": "SELECT * FROM SALES...", "ELAPSED_TIME": 15000, "CPU_TIME": 14500, "EXECUTIONS": 1, "DISK_READS": 80000, "OPTIMIZER_COST": 4500, "PLAN_OPERATION": "TABLE ACCESS FULL", "OBJECT_NAME": "SALES"},
-            {"SQL_ID": "sql_fast_002", "SQL_TEXT": "SELECT name FROM EMP...", "ELAPSED_TIME": 10, "CPU_TIME": 8, "EXECUTIONS": 100, "DISK_READS": 2, "OPTIMIZER_COST": 2, "PLAN_OPERATION": "INDEX UNIQUE SCAN", "OBJECT_NAME": "EMP_PK"}
+            {"SQL_ID": "sql_slow_001", "PLAN_HASH_VALUE": 3956160932, "SQL_TEXT": "SELECT * FROM SALES...", "ELAPSED_TIME": 15000, "CPU_TIME": 14500, "EXECUTIONS": 1, "DISK_READS": 80000, "OPTIMIZER_COST": 4500, "PLAN_OPERATION": "TABLE ACCESS FULL", "OBJECT_NAME": "SALES"},
+            {"SQL_ID": "sql_fast_002", "PLAN_HASH_VALUE": 1257643108, "SQL_TEXT": "SELECT name FROM EMP...", "ELAPSED_TIME": 10, "CPU_TIME": 8, "EXECUTIONS": 100, "DISK_READS": 2, "OPTIMIZER_COST": 2, "PLAN_OPERATION": "INDEX UNIQUE SCAN", "OBJECT_NAME": "EMP_PK"}
         ]
         pd.DataFrame(perf).to_csv(f"{self.output_dir}/performance_metrics.csv", index=False)
 
@@ -82,10 +83,48 @@ class OracleSimulator:
         pd.DataFrame(events).to_csv(f"{self.output_dir}/system_events.csv", index=False)
         print("✅ Métriques de performance générées (SQL Stat + System Events).")
 
+    def generate_capacity_metrics(self):
+        """Livrable : DBA_SEGMENTS, DBA_DATA_FILES, V$LOG_HISTORY, V$DATABASE (modèle de sauvegarde)"""
+        gb = 1024 ** 3
+        # 1. Segments (≈ 480 Go utilisés)
+        segments = [
+            {"OWNER": "SALES", "SEGMENT_TYPE": "TABLE", "TABLESPACE_NAME": "SALES_DATA", "SEGMENTS": 120, "BYTES": 260 * gb},
+            {"OWNER": "SALES", "SEGMENT_TYPE": "INDEX", "TABLESPACE_NAME": "SALES_IDX", "SEGMENTS": 340, "BYTES": 95 * gb},
+            {"OWNER": "HR", "SEGMENT_TYPE": "TABLE", "TABLESPACE_NAME": "USERS", "SEGMENTS": 40, "BYTES": 45 * gb},
+            {"OWNER": "FINANCE", "SEGMENT_TYPE": "TABLE PARTITION", "TABLESPACE_NAME": "FIN_DATA", "SEGMENTS": 96, "BYTES": 70 * gb},
+            {"OWNER": "SYS", "SEGMENT_TYPE": "TABLE", "TABLESPACE_NAME": "SYSTEM", "SEGMENTS": 900, "BYTES": 10 * gb},
+        ]
+        pd.DataFrame(segments).to_csv(f"{self.output_dir}/segment_sizes.csv", index=False)
+
+        # 2. Datafiles (18 fichiers de 32 Go)
+        datafiles = [
+            {"FILE_ID": i + 1, "TABLESPACE_NAME": ts, "BYTES": 32 * gb, "MAXBYTES": 32 * gb, "AUTOEXTENSIBLE": "NO"}
+            for i, ts in enumerate(["SYSTEM", "SYSAUX", "USERS", "FIN_DATA", "FIN_DATA"] + ["SALES_DATA"] * 9 + ["SALES_IDX"] * 4)
+        ]
+        pd.DataFrame(datafiles).to_csv(f"{self.output_dir}/datafiles.csv", index=False)
+
+        # 3. Redo par heure sur 7 jours : ~2 Go/h en journée, pointe à 6 Go/h pendant les batchs de nuit
+        start = datetime(2026, 1, 7)
+        redo = []
+        for h in range(168):
+            hour = start + timedelta(hours=h)
+            size = 6 * gb if hour.hour in (1, 2) else 2 * gb if 8 <= hour.hour <= 18 else gb // 2
+            redo.append({"HOUR": hour.strftime("%Y-%m-%d %H:00:00"), "LOG_SWITCHES": size // (512 * 1024 ** 2),
+                         "BYTES": size, "HOURS_OBSERVED": 168})
+        pd.DataFrame(redo).to_csv(f"{self.output_dir}/archive_rates.csv", index=False)
+
+        # 4. V$DATABASE
+        info = [{"NAME": "ORCLSIM", "LOG_MODE": "ARCHIVELOG", "DATABASE_ROLE": "PRIMARY", "BCT_STATUS": "DISABLED",
+                 "STARTUP_TIME": "2026-01-01 06:00:00"}]
+        pd.DataFrame(info).to_csv(f"{self.output_dir}/database_info.csv", index=False)
+        print("✅ Métriques de capacité générées (Segments, Datafiles, Redo, Base).")
+
     def run_all(self):
         self.generate_audit_logs()
         self.generate_security_config()
         self.generate_performance_metrics()
+        self.generate_capacity_metrics()
+        SnapshotStore(self.output_dir).capture()
         print("\nModule 1 : Toutes les données (simulées) sont normalisées en CSV.")
 
 if __name__ == "__main__":
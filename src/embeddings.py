@@ -0,0 +1,170 @@
+import abc
+import os
+import numpy as np
+from chromadb.api.types import EmbeddingFunction
+from chromadb.utils.embedding_functions import register_embedding_function
+import metrics
+
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+# Signature des index construits avant l'introduction des backends (SentenceTransformer PyTorch)
+LEGACY_SIGNATURE = f"sentence-transformers:{DEFAULT_MODEL}"
+
+EMBED_LATENCY = metrics.histogram("embedding_duration_seconds", "Durée des appels d'embedding", ("backend",))
+EMBED_TEXTS = metrics.counter("embedding_texts_total", "Textes vectorisés", ("backend",))
+
+
+@register_embedding_function
+class EmbeddingBackend(EmbeddingFunction, abc.ABC):
+    """
+    Interface commune (EmbeddingFunction de ChromaDB) : __call__(textes) -> vecteurs.
+    `signature` identifie le modèle et le runtime : un index construit avec une autre signature
+    doit être reconstruit (les espaces vectoriels ne sont pas comparables).
+    Enregistrée auprès de ChromaDB sous le nom "oracle_rag" : la configuration persistée
+    avec la collection (get_config) permet de reconstruire le backend (build_from_config).
+    """
+    runtime = ""
+    # Clé de BACKENDS qui reconstruit ce backend
+    backend = ""
+
+    def __init__(self, batch_size=32, num_threads=0):
+        self.batch_size = batch_size
+        self.num_threads = num_threads
+
+    @staticmethod
+    def name():
+        return "oracle_rag"
+
+    def get_config(self):
+        return {"backend": self.backend, "batch_size": self.batch_size, "num_threads": self.num_threads}
+
+    @staticmethod
+    def build_from_config(config):
+        return create_embedding_backend(config.get("backend"), config.get("batch_size"), config.get("num_threads"))
+
+    @property
+    def signature(self):
+        return f"{self.runtime}:{DEFAULT_MODEL}"
+
+    @abc.abstractmethod
+    def embed(self, texts):
+        """Vecteurs (listes de floats) des textes, dans l'ordre."""
+
+    def __call__(self, input):
+        texts = list(input)
+        with EMBED_LATENCY.time(backend=self.runtime):
+            vectors = self.embed(texts)
+        EMBED_TEXTS.inc(len(texts), backend=self.runtime)
+        return vectors
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """Backend historique : sentence-transformers en PyTorch (float32, CPU)."""
+    runtime = "sentence-transformers"
+    backend = "sentence-transformers"
+
+    def __init__(self, batch_size=32, num_threads=0):
+        super().__init__(batch_size, num_threads)
+        import torch
+        from sentence_transformers import SentenceTransformer
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.model = SentenceTransformer(DEFAULT_MODEL, device="cpu")
+
+    def embed(self, texts):
+        return self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True).tolist()
+
+
+class OnnxBackend(EmbeddingBackend):
+    """
+    Même modèle exécuté par ONNX Runtime sur CPU, quantifié dynamiquement en int8 au premier usage.
+    Les fichiers du modèle sont ceux du cache ONNX de ChromaDB (téléchargés si absents).
+    Si la quantification est impossible (paquet `onnx` absent), le modèle float32 est utilisé
+    et la signature l'indique.
+    """
+    MAX_LENGTH = 256
+
+    def __init__(self, batch_size=32, num_threads=0, quantize=True):
+        super().__init__(batch_size, num_threads)
+        self.backend = "onnx-int8" if quantize else "onnx"
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+
+        reference = ONNXMiniLM_L6_V2()
+        reference(["warm-up"])  # Déclenche le téléchargement du modèle dans le cache Chroma
+        model_dir = os.path.join(str(reference.DOWNLOAD_PATH), reference.EXTRACTED_FOLDER_NAME)
+        model_path = os.path.join(model_dir, "model.onnx")
+
+        self.precision = "fp32"
+        if quantize:
+            quantized_path = self._quantize(model_path)
+            if quantized_path:
+                model_path = quantized_path
+                self.precision = "int8"
+        self.runtime = f"onnx-{self.precision}"
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.MAX_LENGTH)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+    @staticmethod
+    def _quantize(model_path):
+        """Quantification dynamique int8 (poids), mise en cache à côté du modèle d'origine."""
+        quantized_path = model_path.replace(".onnx", "_int8.onnx")
+        if os.path.exists(quantized_path):
+            return quantized_path
+        try:
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+            return quantized_path
+        except Exception as e:
+            print(f"⚠️ Quantification int8 impossible ({e}), utilisation du modèle float32.")
+            return None
+
+    def embed(self, texts):
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            encoded = self.tokenizer.encode_batch(texts[start:start + self.batch_size])
+            input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+            feeds = {
+                "input_ids": input_ids,
+                "attention_mask": attention_mask,
+                "token_type_ids": np.zeros_like(input_ids),
+            }
+            hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+            # Mean pooling sur les tokens réels puis normalisation L2 (comme sentence-transformers)
+            mask = attention_mask[..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            vectors.extend(pooled.tolist())
+        return vectors
+
+
+BACKENDS = {
+    "sentence-transformers": SentenceTransformerBackend,
+    "onnx-int8": OnnxBackend,
+    "onnx": lambda batch_size, num_threads: OnnxBackend(batch_size, num_threads, quantize=False),
+}
+
+
+def create_embedding_backend(name=None, batch_size=None, num_threads=None):
+    """
+    Construit le backend d'embedding.
+    Configuration par défaut : RAG_EMBEDDING_BACKEND (sentence-transformers | onnx-int8 | onnx),
+    RAG_EMBEDDING_BATCH_SIZE (32) et RAG_EMBEDDING_THREADS (0 = choix du runtime).
+    """
+    name = name or os.getenv("RAG_EMBEDDING_BACKEND", "sentence-transformers")
+    if name not in BACKENDS:
+        raise ValueError(f"Backend d'embedding inconnu : {name} (disponibles : {', '.join(BACKENDS)})")
+    batch_size = batch_size or int(os.getenv("RAG_EMBEDDING_BATCH_SIZE", "32"))
+    num_threads = num_threads if num_threads is not None else int(os.getenv("RAG_EMBEDDING_THREADS", "0"))
+    return BACKENDS[name](batch_size=batch_size, num_threads=num_threads)
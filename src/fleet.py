@@ -0,0 +1,228 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import threading
+import yaml
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+import metrics
+
+DATA_DIR = "datav1"
+# Une base par sous-dossier : datav1/targets/<nom>/ (CSV extraits et résultats des agents)
+TARGETS_DIR = os.path.join(DATA_DIR, "targets")
+INVENTORY_FILE = os.getenv("FLEET_INVENTORY", "data/fleet.yaml")
+MANIFEST_FILE = os.path.join(TARGETS_DIR, "fleet_manifest.json")
+# Connexions simultanées sur une même base, et sur l'ensemble de la flotte
+DEFAULT_PER_TARGET = int(os.getenv("FLEET_CONNECTIONS_PER_TARGET", "2"))
+DEFAULT_MAX_CONNECTIONS = int(os.getenv("FLEET_MAX_CONNECTIONS", "8"))
+
+TARGET_TYPES = ("oracle", "simulator")
+_TARGET_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+
+FLEET_EXTRACTIONS = metrics.counter("fleet_extractions_total", "Extractions de la flotte par cible et statut", ("status",))
+FLEET_ACTIVE = metrics.gauge("fleet_extractions_active", "Cibles en cours d'extraction")
+
+
+def target_data_dir(target=None, data_dir=DATA_DIR):
+    """Dossier de données d'une cible (datav1/targets/<nom>/) ; datav1/ sans cible."""
+    if not target:
+        return data_dir
+    if not _TARGET_NAME.match(str(target)):
+        raise ValueError(f"Nom de cible invalide : {target}")
+    return os.path.join(data_dir, "targets", str(target))
+
+
+def selected_target(argv=None):
+    """Cible choisie en ligne de commande (--target NOM) ou par ORACLE_TARGET ; None = datav1/."""
+    argv = sys.argv if argv is None else argv
+    for i, arg in enumerate(argv):
+        if arg == "--target" and i + 1 < len(argv):
+            return argv[i + 1]
+        if arg.startswith("--target="):
+            return arg.split("=", 1)[1]
+    return os.getenv("ORACLE_TARGET") or None
+
+
+def list_targets(targets_dir=TARGETS_DIR):
+    """Cibles disposant d'un dossier de données."""
+    if not os.path.isdir(targets_dir):
+        return []
+    return sorted(name for name in os.listdir(targets_dir)
+                  if os.path.isdir(os.path.join(targets_dir, name)) and _TARGET_NAME.match(name))
+
+
+def load_inventory(path=INVENTORY_FILE):
+    """
+    Lit l'inventaire (YAML) :
+        defaults: {port: 1521, username: SYS, max_connections: 2}
+        targets:
+          PROD1: {host: db1, service_name: PROD1, password_env: ORACLE_PASSWORD_PROD1}
+          DEMO: {type: simulator}
+    Les mots de passe ne figurent jamais dans le fichier : ils sont lus dans la variable
+    d'environnement `password_env` (défaut : ORACLE_PASSWORD_<NOM>).
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f) or {}
+    defaults = config.get("defaults") or {}
+
+    inventory = {}
+    for name, overrides in (config.get("targets") or {}).items():
+        name = str(name)
+        entry = dict(defaults)
+        entry.update(overrides or {})
+        target_data_dir(name)
+        if "password" in entry:
+            raise ValueError(f"{name} : mot de passe en clair interdit dans l'inventaire, utilisez password_env")
+        entry.setdefault("type", "oracle")
+        if entry["type"] not in TARGET_TYPES:
+            raise ValueError(f"{name} : type inconnu '{entry['type']}' ({', '.join(TARGET_TYPES)})")
+        if entry["type"] == "oracle" and not entry.get("host"):
+            raise ValueError(f"{name} : 'host' manquant")
+        inventory[name] = entry
+    return inventory
+
+
+def select_targets(inventory, names):
+    """Restreint aux cibles demandées ; lève ValueError pour un nom inconnu."""
+    if not names:
+        return inventory
+    unknown = set(names) - set(inventory)
+    if unknown:
+        raise ValueError(f"Cibles inconnues : {', '.join(sorted(unknown))}")
+    return {name: inventory[name] for name in names}
+
+
+def connection_config(name, entry):
+    """Paramètres de connexion de OracleDataExtractor pour une entrée d'inventaire."""
+    password_env = entry.get("password_env") or "ORACLE_PASSWORD_" + re.sub(r"\W", "_", name.upper())
+    config = {
+        "username": entry.get("username", "SYS"),
+        "password": os.getenv(password_env, ""),
+        "host": entry["host"],
+        "port": str(entry.get("port", 1521)),
+        "service_name": entry.get("service_name", name),
+    }
+    if "sysdba" in entry:
+        config["sysdba"] = bool(entry["sysdba"])
+    return config
+
+
+def extract_target(name, entry, connection_slots, per_target=DEFAULT_PER_TARGET, data_dir=DATA_DIR):
+    """Extraction d'une cible dans son dossier ; lève une exception si la base est injoignable."""
+    output_dir = target_data_dir(name, data_dir)
+    if entry["type"] == "simulator":
+        # Base de substitution locale : occupe un créneau de connexion comme une vraie base
+        from data_extractor import OracleSimulator
+        with connection_slots:
+            OracleSimulator(output_dir=output_dir).run_all()
+        return {"fichiers": sorted(f for f in os.listdir(output_dir) if f.endswith(".csv")), "echecs": []}
+
+    from real_data_extractor import OracleDataExtractor
+    extractor = OracleDataExtractor(
+        config=connection_config(name, entry),
+        output_dir=output_dir,
+        max_connections=min(per_target, int(entry.get("max_connections", per_target))),
+        connection_slots=connection_slots,
+        name=name
+    )
+    return extractor.run_full_extraction()
+
+
+def extract_fleet(inventory, per_target=None, max_connections=None, progress_callback=None,
+                  data_dir=DATA_DIR, manifest_path=None):
+    """
+    Extrait toutes les cibles de l'inventaire en parallèle :
+    - au plus `per_target` connexions sur une même base et `max_connections` sur l'ensemble ;
+    - une base injoignable est notée en échec sans interrompre les autres ;
+    - le statut de chaque cible est conservé dans le manifeste de la flotte.
+    progress_callback(pourcentage, message) : même signature que Job.report.
+    """
+    per_target = max(1, per_target or DEFAULT_PER_TARGET)
+    max_connections = max(1, max_connections or DEFAULT_MAX_CONNECTIONS)
+    manifest_path = manifest_path or os.path.join(data_dir, "targets", "fleet_manifest.json")
+    slots = threading.BoundedSemaphore(max_connections)
+    results = {}
+    total = len(inventory)
+
+    def run(name):
+        start = time.perf_counter()
+        FLEET_ACTIVE.inc()
+        try:
+            outcome = extract_target(name, inventory[name], slots, per_target, data_dir)
+            entry = {"status": "partial" if outcome.get("echecs") else "ok", **outcome}
+        except Exception as e:
+            entry = {"status": "failed", "error": str(e)}
+        finally:
+            FLEET_ACTIVE.dec()
+        entry["duration_s"] = round(time.perf_counter() - start, 3)
+        entry["finished_at"] = datetime.now().isoformat()
+        return entry
+
+    # Chaque cible occupe au moins une connexion : plus de workers que de créneaux serait inutile
+    with ThreadPoolExecutor(max_workers=min(max_connections, max(1, total)), thread_name_prefix="fleet") as pool:
+        futures = {pool.submit(run, name): name for name in inventory}
+        for future in as_completed(futures):
+            name = futures[future]
+            results[name] = future.result()
+            FLEET_EXTRACTIONS.inc(status=results[name]["status"])
+            if results[name]["status"] == "failed":
+                print(f"❌ {name} : {results[name]['error']}")
+            else:
+                print(f"✅ {name} : {len(results[name]['fichiers'])} fichiers ({results[name]['duration_s']} s)")
+            if progress_callback:
+                progress_callback(int(len(results) * 100 / total), f"{len(results)}/{total} cibles extraites ({name})")
+
+    _write_manifest(manifest_path, results)
+    return results
+
+
+def load_manifest(manifest_path=MANIFEST_FILE):
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"targets": {}}
+
+
+def _write_manifest(manifest_path, results):
+    """Les cibles absentes de ce run conservent leur dernier état."""
+    manifest = load_manifest(manifest_path)
+    manifest.setdefault("targets", {}).update(results)
+    manifest["run_at"] = datetime.now().isoformat()
+    manifest["run"] = {name: results[name]["status"] for name in sorted(results)}
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Extraction de toutes les bases d'un inventaire")
+    parser.add_argument("--inventory", default=INVENTORY_FILE, help="Fichier YAML des cibles (défaut : data/fleet.yaml)")
+    parser.add_argument("--targets", default="", help="Sous-ensemble de cibles (ex : PROD1,PROD2)")
+    parser.add_argument("--per-target", type=int, default=DEFAULT_PER_TARGET, help="Connexions simultanées par base")
+    parser.add_argument("--max-connections", type=int, default=DEFAULT_MAX_CONNECTIONS,
+                        help="Connexions simultanées sur l'ensemble de la flotte")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        inventory = select_targets(load_inventory(args.inventory), [t for t in args.targets.split(",") if t])
+    except (OSError, ValueError) as e:
+        print(f"❌ Inventaire : {e}")
+        sys.exit(1)
+
+    results = extract_fleet(inventory, per_target=args.per_target, max_connections=args.max_connections)
+
+    print("\n--- RÉSUMÉ DE L'EXTRACTION ---")
+    for name in sorted(results):
+        entry = results[name]
+        detail = entry.get("error") or ", ".join(entry.get("echecs", [])) or f"{len(entry['fichiers'])} fichiers"
+        print(f"{name:<20} {entry['status']:<8} {entry['duration_s']:>8} s  {detail}")
+    sys.exit(0 if all(e["status"] != "failed" for e in results.values()) else 1)
@@ -0,0 +1,168 @@
+import os
+import json
+import uuid
+import inspect
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+
+class Job:
+    """Une exécution d'agent en arrière-plan (statut, progression, résultat)."""
+
+    def __init__(self, kind, params):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.params = params
+        self.status = "queued"  # queued -> running -> done / error / cancelled
+        self.progress = 0
+        self.message = "En attente d'un worker..."
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        # Annulation coopérative : la tâche (et ses appels LLM en file) consulte cet événement
+        self.cancel_event = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def key(self):
+        """Clé de déduplication : même type d'agent et mêmes paramètres."""
+        return (self.kind, json.dumps(self.params, sort_keys=True, ensure_ascii=False))
+
+    def report(self, progress, message=""):
+        """Appelé par la tâche pour publier sa progression (0-100)."""
+        with self._lock:
+            self.progress = max(0, min(100, int(progress)))
+            if message:
+                self.message = message
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'id': self.id,
+                'type': self.kind,
+                'params': self.params,
+                'status': self.status,
+                'progress': self.progress,
+                'message': self.message,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'result': self.result,
+                'error': self.error
+            }
+
+
+class JobQueue:
+    """
+    File de tâches en arrière-plan pour les agents d'analyse (pipelines LLM de plusieurs minutes).
+    - Pool de workers borné (max_workers) : les threads de requête Flask ne bloquent jamais.
+    - Une tâche identique déjà en attente ou en cours n'est pas dupliquée.
+    - Historique borné des tâches terminées pour les endpoints de statut.
+    """
+
+    def __init__(self, max_workers=None, history_size=100):
+        self.max_workers = max_workers or int(os.getenv("AGENT_JOBS_MAX_WORKERS", "2"))
+        self.history_size = history_size
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="agent-job")
+        self._tasks = {}             # type de tâche -> fonction(job, **params)
+        self._jobs = OrderedDict()   # id -> Job (ordre de création)
+        self._active = {}            # clé de déduplication -> Job en attente/en cours
+        self._lock = threading.Lock()
+
+    def register(self, kind, func):
+        """Déclare un type de tâche. `func(job, **params)` retourne un résumé JSON-sérialisable."""
+        self._tasks[kind] = func
+
+    @property
+    def kinds(self):
+        return sorted(self._tasks)
+
+    def submit(self, kind, params=None):
+        """
+        Met une tâche en file. Retourne (job, deduplicated).
+        Lève KeyError si le type de tâche est inconnu, TypeError si les paramètres ne correspondent pas.
+        """
+        if kind not in self._tasks:
+            raise KeyError(kind)
+        params = params or {}
+        inspect.signature(self._tasks[kind]).bind(None, **params)
+        job = Job(kind, params)
+        with self._lock:
+            existing = self._active.get(job.key)
+            if existing is not None:
+                return existing, True
+            self._active[job.key] = job
+            self._jobs[job.id] = job
+            self._trim_history()
+        self._executor.submit(self._run, job)
+        return job, False
+
+    def _run(self, job):
+        if job.cancel_event.is_set():
+            with job._lock:
+                job.status = "cancelled"
+                job.message = "Annulée avant démarrage"
+                job.finished_at = datetime.now().isoformat()
+            with self._lock:
+                self._active.pop(job.key, None)
+            return
+        with job._lock:
+            job.status = "running"
+            job.started_at = datetime.now().isoformat()
+            job.message = "Exécution en cours..."
+        try:
+            result = self._tasks[job.kind](job, **job.params)
+            with job._lock:
+                job.status = "done"
+                job.progress = 100
+                job.message = "Terminé"
+                job.result = result
+        except Exception as e:
+            traceback.print_exc()
+            with job._lock:
+                job.status = "cancelled" if job.cancel_event.is_set() else "error"
+                job.message = "Annulée" if job.cancel_event.is_set() else "Échec"
+                job.error = str(e)
+        finally:
+            with job._lock:
+                job.finished_at = datetime.now().isoformat()
+            with self._lock:
+                self._active.pop(job.key, None)
+
+    def _trim_history(self):
+        """Oublie les plus anciennes tâches terminées au-delà de history_size."""
+        while len(self._jobs) > self.history_size:
+            oldest = next((j for j in self._jobs.values() if j.status in ("done", "error", "cancelled")), None)
+            if oldest is None:
+                break
+            del self._jobs[oldest.id]
+
+    def cancel(self, job_id):
+        """
+        Demande l'annulation d'une tâche : en attente, elle ne démarrera pas ; en cours, ses appels
+        LLM encore en file sont abandonnés. Retourne le Job, None s'il est inconnu.
+        """
+        job = self.get(job_id)
+        if job is not None and job.status in ("queued", "running"):
+            job.cancel_event.set()
+            with job._lock:
+                job.message = "Annulation demandée..."
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self, limit=50):
+        """Tâches les plus récentes en premier."""
+        with self._lock:
+            jobs = list(self._jobs.values())[-limit:]
+        return [j.to_dict() for j in reversed(jobs)]
+
+    def shutdown(self, wait=False):
+        self._executor.shutdown(wait=wait)
@@ -2,19 +2,29 @@ import os
 import yaml
 import requests
 import json
+import time
 from dotenv import load_dotenv
+from llm_scheduler import get_scheduler, RequestCancelled, RequestExpired
+import metrics
 
 load_dotenv()
 
+LLM_LATENCY = metrics.histogram("llm_request_duration_seconds", "Latence des appels DeepSeek")
+LLM_REQUESTS = metrics.counter("llm_requests_total", "Appels DeepSeek par statut", ("status",))
+LLM_TOKENS = metrics.counter("llm_tokens_total", "Tokens consommés (usage renvoyé par l'API)", ("type",))
+
 class LLMEngine:
-    def __init__(self):
+    def __init__(self, scheduler=None):
         """Initialisation de DeepSeek engine"""
         self.api_key = os.getenv("DEEP_SEEK_API_KEY")
         if not self.api_key:
             raise ValueError("❌ Clé API DeepSeek manquante dans le fichier .env (DEEP_SEEK_API_KEY)")
         
-        self.api_url = "https://api.deepseek.com/chat/completions"
+        # Surchargeable pour pointer vers un serveur compatible (ex : benchmarks/mock_deepseek.py)
+        self.api_url = os.getenv("DEEP_SEEK_API_URL", "https://api.deepseek.com/chat/completions")
         self.model_name = "deepseek-chat"
+        # File d'attente partagée : priorités, limites de débit DeepSeek et appels simultanés
+        self.scheduler = scheduler or get_scheduler()
         
         # Chargement du fichier prompts.yaml
         try:
@@ -25,38 +35,114 @@ class LLMEngine:
             print("❌ Erreur : Fichier data/prompts.yaml introuvable.")
             self.prompts = {}
 
-    def generate(self, user_message, system_context=""):
-        """Méthode de base pour l'appel au LLM via DeepSeek API"""
-        try:
-            system_role = self.prompts.get('system_role', 'You are a helpful assistant.')
-            # Combine system context if provided
-            if system_context:
-                system_content = f"{system_role}\n\nCONTEXTE :\n{system_context}"
-            else:
-                system_content = system_role
+    def _payload(self, user_message, system_context="", stream=False):
+        system_role = self.prompts.get('system_role', 'You are a helpful assistant.')
+        # Combine system context if provided
+        if system_context:
+            system_content = f"{system_role}\n\nCONTEXTE :\n{system_context}"
+        else:
+            system_content = system_role
+
+        payload = {
+            "model": self.model_name,
+            "messages": [
+                {"role": "system", "content": system_content},
+                {"role": "user", "content": user_message}
+            ],
+            "stream": stream
+        }
+        if stream:
+            # Demande l'usage (tokens) dans le dernier événement du flux
+            payload["stream_options"] = {"include_usage": True}
+        return payload
 
-            payload = {
-                "model": self.model_name,
-                "messages": [
-                    {"role": "system", "content": system_content},
-                    {"role": "user", "content": user_message}
-                ],
-                "stream": False
-            }
+    def _headers(self):
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
 
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
+    @staticmethod
+    def _record_usage(usage):
+        LLM_TOKENS.inc(usage.get('prompt_tokens', 0), type="prompt")
+        LLM_TOKENS.inc(usage.get('completion_tokens', 0), type="completion")
+        return usage.get('total_tokens') or usage.get('prompt_tokens', 0) + usage.get('completion_tokens', 0)
+
+    def generate(self, user_message, system_context="", priority=None, caller=None, deadline=None, cancel_event=None):
+        """
+        Méthode de base pour l'appel au LLM via DeepSeek API.
+        priority ("interactive" / "batch"), caller, deadline (attente maximale en file, secondes) et
+        cancel_event : voir LLMScheduler.slot ; absents, ils sont repris de llm_scheduler.request_context.
+        Lève RequestCancelled si la requête est annulée ; les autres échecs sont retournés sous la
+        forme "❌ Erreur DeepSeek : ...".
+        """
+        start = time.perf_counter()
+        try:
+            with self.scheduler.slot(system_context + user_message, priority, caller, deadline, cancel_event) as settle:
+                response = requests.post(self.api_url, headers=self._headers(),
+                                         json=self._payload(user_message, system_context))
+                response.raise_for_status()
 
-            response = requests.post(self.api_url, headers=headers, json=payload)
-            response.raise_for_status()
-            
-            data = response.json()
+                data = response.json()
+                settle(self._record_usage(data.get('usage') or {}))
+            LLM_REQUESTS.inc(status="ok")
             return data['choices'][0]['message']['content']
 
+        except RequestCancelled:
+            # Annulation de la tâche : remonte à l'agent, qui s'arrête sans enregistrer de résultat
+            LLM_REQUESTS.inc(status="cancelled")
+            raise
+        except RequestExpired as e:
+            LLM_REQUESTS.inc(status="rejected")
+            return f"❌ Erreur DeepSeek : {str(e)}"
         except Exception as e:
+            LLM_REQUESTS.inc(status="error")
             return f"❌ Erreur DeepSeek : {str(e)}"
+        finally:
+            LLM_LATENCY.observe(time.perf_counter() - start)
+
+    def generate_stream(self, user_message, system_context="", priority=None, caller=None, deadline=None,
+                        cancel_event=None):
+        """
+        Variante en streaming (SSE) : génère les morceaux de texte au fil de leur arrivée.
+        Le créneau de l'ordonnanceur est tenu jusqu'à la fin du flux.
+        En cas d'échec, le dernier morceau est le message "❌ Erreur DeepSeek : ..." (comme generate) ;
+        une annulation lève RequestCancelled.
+        """
+        start = time.perf_counter()
+        try:
+            with self.scheduler.slot(system_context + user_message, priority, caller, deadline, cancel_event) as settle, \
+                    requests.post(self.api_url, headers=self._headers(),
+                                  json=self._payload(user_message, system_context, stream=True), stream=True) as response:
+                response.raise_for_status()
+                # SSE est toujours en UTF-8 (sans charset, requests supposerait ISO-8859-1)
+                response.encoding = "utf-8"
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    event = json.loads(data)
+                    if event.get('usage'):
+                        settle(self._record_usage(event['usage']))
+                    for choice in event.get('choices', []):
+                        content = (choice.get('delta') or {}).get('content')
+                        if content:
+                            yield content
+            LLM_REQUESTS.inc(status="ok")
+        except RequestCancelled:
+            # Annulation de la tâche : remonte à l'agent, qui s'arrête sans enregistrer de résultat
+            LLM_REQUESTS.inc(status="cancelled")
+            raise
+        except RequestExpired as e:
+            LLM_REQUESTS.inc(status="rejected")
+            yield f"❌ Erreur DeepSeek : {str(e)}"
+        except Exception as e:
+            LLM_REQUESTS.inc(status="error")
+            yield f"❌ Erreur DeepSeek : {str(e)}"
+        finally:
+            LLM_LATENCY.observe(time.perf_counter() - start)
 
     def analyze_query(self, sql, plan, context):
         """Module 5 : Optimisation de requêtes"""
@@ -0,0 +1,314 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+import metrics
+
+# Classes de priorité, dans l'ordre de service : le chatbot passe avant les analyses de fond
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = (INTERACTIVE, BATCH)
+
+# Limites du compte DeepSeek (0 = pas de limite) et appels simultanés
+RATE_RPM = float(os.getenv("LLM_RATE_RPM", "0"))
+RATE_TPM = float(os.getenv("LLM_RATE_TPM", "0"))
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# Capacité que les requêtes batch ne peuvent pas prendre : appels simultanés et part des jetons
+INTERACTIVE_RESERVE = int(os.getenv("LLM_INTERACTIVE_RESERVE", "1"))
+INTERACTIVE_RESERVE_RATIO = float(os.getenv("LLM_INTERACTIVE_RESERVE_RATIO", "0.2"))
+# Tokens de réponse prévus par appel (la différence avec l'usage réel est régularisée après l'appel)
+EXPECTED_COMPLETION_TOKENS = int(os.getenv("LLM_EXPECTED_COMPLETION_TOKENS", "500"))
+# Attente maximale en file d'une requête interactive (secondes)
+INTERACTIVE_DEADLINE = float(os.getenv("LLM_INTERACTIVE_DEADLINE", "30"))
+
+QUEUE_DEPTH = metrics.gauge("llm_scheduler_queue_depth", "Requêtes LLM en attente par priorité", ("priority",))
+IN_FLIGHT = metrics.gauge("llm_scheduler_in_flight", "Appels LLM en cours", ("priority",))
+QUEUE_WAIT = metrics.histogram("llm_scheduler_wait_seconds", "Attente en file avant l'appel LLM", ("priority",))
+SCHEDULED = metrics.counter("llm_scheduler_requests_total", "Requêtes LLM par priorité et issue", ("priority", "outcome"))
+
+
+def estimate_tokens(text):
+    """Approximation (~4 caractères par token), suffisante pour borner la taille du prompt."""
+    return len(text) // 4 + 1
+
+
+class RequestExpired(TimeoutError):
+    """L'échéance de la requête est passée avant qu'un créneau ne se libère."""
+
+
+class RequestCancelled(Exception):
+    """La requête a été annulée pendant son attente en file."""
+
+
+class TokenBucket:
+    """Seau à jetons rempli en continu (`per_minute` jetons par minute, capacité d'une minute)."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self._rate = self.capacity / 60.0
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def wait_time(self, amount, now, reserve=0.0):
+        """0 si `amount` jetons sont disponibles au-delà de `reserve`, sinon secondes avant qu'ils le soient."""
+        self._refill(now)
+        needed = min(amount, self.capacity - reserve) + reserve
+        return max(0.0, (needed - self.level) / self._rate)
+
+    def take(self, amount):
+        """Consomme (ou restitue si négatif) ; le niveau peut devenir négatif (dette remboursée par le remplissage)."""
+        self.level = min(self.capacity, self.level - amount)
+
+
+class _Ticket:
+    def __init__(self, priority, caller, tokens, deadline, cancel_event):
+        self.priority = priority
+        self.caller = caller
+        self.tokens = tokens
+        self.deadline = deadline
+        self.cancel_event = cancel_event
+        self.enqueued_at = time.monotonic()
+        self.state = "queued"  # queued -> granted / expired / cancelled
+
+
+_context = threading.local()
+
+
+@contextmanager
+def request_context(priority=None, caller=None, deadline=None, cancel_event=None):
+    """
+    Valeurs par défaut des appels LLM du thread courant (priorité, appelant pour le partage
+    équitable, durée d'attente maximale en secondes, événement d'annulation) :
+        with request_context(priority=BATCH, caller="optimizer"):
+            agent.analyze_slow_queries()
+    """
+    previous = getattr(_context, "values", {})
+    _context.values = dict(previous, **{k: v for k, v in (("priority", priority), ("caller", caller),
+                                                          ("deadline", deadline), ("cancel_event", cancel_event))
+                                        if v is not None})
+    try:
+        yield
+    finally:
+        _context.values = previous
+
+
+def current_context():
+    """Valeurs de request_context() du thread courant, à reprendre dans les threads d'un pool."""
+    return dict(getattr(_context, "values", {}))
+
+
+def raise_if_cancelled():
+    """
+    Lève RequestCancelled si l'annulation du contexte courant (request_context) est demandée :
+    à appeler avant d'enregistrer un résultat, l'appel LLM en cours ayant pu se terminer.
+    """
+    cancel_event = getattr(_context, "values", {}).get("cancel_event")
+    if cancel_event is not None and cancel_event.is_set():
+        raise RequestCancelled("tâche annulée")
+
+
+def _default_caller():
+    # Threads d'un même pool (agent-job_0, backup-batch_3...) : un seul appelant
+    return re.sub(r"[_-]\d+$", "", threading.current_thread().name)
+
+
+class LLMScheduler:
+    """
+    Ordonnanceur des appels DeepSeek, partagé par le chatbot et les agents :
+    - priorité stricte des requêtes interactives sur les requêtes batch ;
+    - limites par minute en requêtes et en tokens (seaux à jetons), et appels simultanés bornés,
+      une partie de la capacité restant réservée aux requêtes interactives ;
+    - à priorité égale, service à tour de rôle entre appelants (une longue analyse ne
+      monopolise pas la file) ;
+    - échéance et annulation des requêtes en attente.
+    L'appel HTTP lui-même s'exécute dans le thread appelant, dans le bloc `with scheduler.slot(...)`.
+    """
+
+    def __init__(self, rpm=RATE_RPM, tpm=RATE_TPM, max_concurrency=MAX_CONCURRENCY,
+                 interactive_reserve=INTERACTIVE_RESERVE, reserve_ratio=INTERACTIVE_RESERVE_RATIO):
+        self.max_concurrency = max(1, max_concurrency)
+        self.interactive_reserve = min(max(0, interactive_reserve), self.max_concurrency - 1)
+        self.reserve_ratio = reserve_ratio
+        self._requests = TokenBucket(rpm) if rpm > 0 else None
+        self._tokens = TokenBucket(tpm) if tpm > 0 else None
+        self._queues = {p: OrderedDict() for p in PRIORITIES}  # priorité -> appelant -> file de tickets
+        self._running = {p: 0 for p in PRIORITIES}
+        self._cond = threading.Condition()
+
+    # --- API ---
+
+    @contextmanager
+    def slot(self, prompt="", priority=None, caller=None, deadline=None, cancel_event=None):
+        """
+        Attend un créneau pour un appel LLM puis le libère à la sortie du bloc. Les paramètres
+        absents sont repris de request_context() (défaut : batch, appelant = nom du thread).
+        deadline : attente maximale en secondes. Lève RequestExpired / RequestCancelled.
+        Le bloc reçoit une fonction settle(tokens_reels) pour régulariser l'estimation.
+        """
+        defaults = getattr(_context, "values", {})
+        priority = priority or defaults.get("priority", BATCH)
+        if priority not in PRIORITIES:
+            raise ValueError(f"Priorité inconnue : {priority}")
+        wait = deadline if deadline is not None else defaults.get("deadline")
+        if wait is None and priority == INTERACTIVE:
+            wait = INTERACTIVE_DEADLINE
+        ticket = _Ticket(priority, caller or defaults.get("caller") or _default_caller(),
+                         estimate_tokens(prompt) + EXPECTED_COMPLETION_TOKENS,
+                         time.monotonic() + wait if wait is not None else None,
+                         cancel_event or defaults.get("cancel_event"))
+        self._acquire(ticket)
+        try:
+            yield lambda used: self._settle(ticket, used)
+        finally:
+            with self._cond:
+                self._running[ticket.priority] -= 1
+                IN_FLIGHT.dec(priority=ticket.priority)
+                self._cond.notify_all()
+
+    def cancel(self, caller):
+        """Annule les requêtes en attente d'un appelant ; retourne leur nombre."""
+        with self._cond:
+            cancelled = 0
+            for queues in self._queues.values():
+                for ticket in queues.pop(caller, ()):
+                    ticket.state = "cancelled"
+                    cancelled += 1
+            self._update_depth()
+            self._cond.notify_all()
+        return cancelled
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queued": {p: sum(len(q) for q in self._queues[p].values()) for p in PRIORITIES},
+                "running": dict(self._running),
+                "requests_available": round(self._requests.level, 1) if self._requests else None,
+                "tokens_available": round(self._tokens.level) if self._tokens else None,
+            }
+
+    # --- INTERNE ---
+
+    def _acquire(self, ticket):
+        with self._cond:
+            self._queues[ticket.priority].setdefault(ticket.caller, deque()).append(ticket)
+            self._update_depth()
+            while True:
+                # Annulation et échéance avant toute attribution : même avec de la capacité libre
+                if ticket.state == "queued":
+                    if ticket.cancel_event is not None and ticket.cancel_event.is_set():
+                        self._drop(ticket, "cancelled")
+                    elif ticket.deadline is not None and time.monotonic() >= ticket.deadline:
+                        self._drop(ticket, "expired")
+                wake = self._dispatch() if ticket.state == "queued" else None
+                if ticket.state == "granted":
+                    break
+                if ticket.state == "cancelled":
+                    SCHEDULED.inc(priority=ticket.priority, outcome="cancelled")
+                    raise RequestCancelled("requête LLM annulée")
+                if ticket.state == "expired":
+                    SCHEDULED.inc(priority=ticket.priority, outcome="expired")
+                    raise RequestExpired("aucun créneau LLM disponible avant l'échéance")
+                timeout = wake
+                if ticket.deadline is not None:
+                    timeout = min(timeout or float("inf"), max(0.0, ticket.deadline - time.monotonic()))
+                if ticket.cancel_event is not None:
+                    # L'événement d'annulation n'est pas lié à la condition : vérification périodique
+                    timeout = min(timeout or float("inf"), 0.5)
+                self._cond.wait(timeout)
+        QUEUE_WAIT.observe(time.monotonic() - ticket.enqueued_at, priority=ticket.priority)
+        SCHEDULED.inc(priority=ticket.priority, outcome="granted")
+
+    def _dispatch(self):
+        """
+        Accorde des créneaux aux tickets en tête de file tant que la capacité le permet
+        (appelé sous verrou). Retourne le délai avant le prochain essai utile, None s'il suffit
+        d'attendre une libération.
+        """
+        while True:
+            ticket = None
+            for priority in PRIORITIES:
+                if self._queues[priority]:
+                    ticket = self._head(priority)
+                    break
+            if ticket is None:
+                return None
+            wait = self._capacity_wait(ticket)
+            if wait != 0.0:
+                # Priorité stricte : rien ne double une requête plus prioritaire en attente
+                return wait
+            self._pop_head(ticket)
+            ticket.state = "granted"
+            self._running[ticket.priority] += 1
+            IN_FLIGHT.inc(priority=ticket.priority)
+            if self._requests:
+                self._requests.take(1)
+            if self._tokens:
+                self._tokens.take(ticket.tokens)
+            self._update_depth()
+            self._cond.notify_all()
+
+    def _capacity_wait(self, ticket):
+        """0.0 si le ticket peut partir, None s'il attend une fin d'appel, sinon secondes d'attente."""
+        batch = ticket.priority == BATCH
+        limit = self.max_concurrency - (self.interactive_reserve if batch else 0)
+        if sum(self._running.values()) >= self.max_concurrency or (batch and self._running[BATCH] >= limit):
+            return None
+        now = time.monotonic()
+        wait = 0.0
+        for bucket, amount in ((self._requests, 1), (self._tokens, ticket.tokens)):
+            if bucket is not None:
+                reserve = bucket.capacity * self.reserve_ratio if batch else 0.0
+                wait = max(wait, bucket.wait_time(amount, now, reserve))
+        return wait
+
+    def _head(self, priority):
+        """Premier ticket de l'appelant dont c'est le tour (les appelants tournent à chaque service)."""
+        return next(iter(self._queues[priority].values()))[0]
+
+    def _pop_head(self, ticket):
+        queues = self._queues[ticket.priority]
+        tickets = queues.pop(ticket.caller)
+        tickets.popleft()
+        if tickets:
+            # L'appelant repasse en fin de tour
+            queues[ticket.caller] = tickets
+
+    def _drop(self, ticket, state):
+        queues = self._queues[ticket.priority]
+        tickets = queues.get(ticket.caller)
+        if tickets is not None:
+            tickets.remove(ticket)
+            if not tickets:
+                del queues[ticket.caller]
+        ticket.state = state
+        self._update_depth()
+        self._cond.notify_all()
+
+    def _settle(self, ticket, used):
+        """Usage réel connu après l'appel : corrige la consommation estimée du seau de tokens."""
+        if self._tokens and used:
+            with self._cond:
+                self._tokens.take(used - ticket.tokens)
+
+    def _update_depth(self):
+        for priority in PRIORITIES:
+            QUEUE_DEPTH.set(sum(len(q) for q in self._queues[priority].values()), priority=priority)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Ordonnanceur du processus (les limites DeepSeek s'appliquent à la clé API, pas à un moteur)."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+        return _scheduler
@@ -0,0 +1,286 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import profiling
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from functools import partial
+from datetime import datetime
+
+DATA_DIR = "datav1"
+PROMPTS_FILE = "data/prompts.yaml"
+MANIFEST_FILE = os.path.join(DATA_DIR, "pipeline_manifest.json")
+
+
+def data_file(name, data_dir=DATA_DIR):
+    return os.path.join(data_dir, name)
+
+
+def file_hash(path):
+    """Empreinte SHA-256 du contenu (None si le fichier n'existe pas)."""
+    if not os.path.exists(path):
+        return None
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class Stage:
+    """Étape du pipeline : fichiers lus, fichiers produits et fonction d'exécution."""
+
+    def __init__(self, name, inputs, outputs, run, always_run=False):
+        self.name = name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.run = run
+        # Étape sans entrée fichier (ex : extraction depuis Oracle) : exécutée à chaque fois
+        self.always_run = always_run
+
+
+# --- FONCTIONS DES ÉTAPES (imports différés : seules les étapes exécutées chargent leurs dépendances) ---
+
+def _check_result(result):
+    """Les agents retournent {"error": ...} au lieu de lever une exception."""
+    if isinstance(result, dict) and ('error' in result or 'raw_report' in result):
+        raise RuntimeError(result.get('error') or "Réponse LLM non structurée (raw_report)")
+    return result
+
+
+def run_oracle_extraction(params, data_dir=DATA_DIR, config=None):
+    from real_data_extractor import OracleDataExtractor
+    OracleDataExtractor(config=config, output_dir=data_dir).run_full_extraction()
+
+
+def run_simulated_extraction(params, data_dir=DATA_DIR):
+    from data_extractor import OracleSimulator
+    OracleSimulator(output_dir=data_dir).run_all()
+
+
+def run_anomaly(params, data_dir=DATA_DIR):
+    from anomaly_detector import AnomalyDetector
+    _check_result(AnomalyDetector(data_dir).analyze_logs())
+
+
+def run_optimizer(params, data_dir=DATA_DIR):
+    from query_optimizer import QueryOptimizer
+    _check_result(QueryOptimizer(data_dir).analyze_slow_queries())
+
+
+def run_security(params, data_dir=DATA_DIR):
+    from security_audit import SecurityAuditor
+    _check_result(SecurityAuditor(data_dir).run_audit())
+
+
+def run_backup(params, data_dir=DATA_DIR):
+    from backup_recommender import BackupRecommender
+    recommender = BackupRecommender(data_dir)
+    strategy, rman = recommender.generate_full_plan(user_reqs=params["backup"])
+    recommender.save_plan(_check_result(strategy), rman, data_dir)
+
+
+CAPACITY_FILES = ["segment_sizes.csv", "datafiles.csv", "archive_rates.csv", "database_info.csv", "rman_jobs.csv"]
+
+EXTRACTED_FILES = [
+    "audit_logs.csv", "execution_plans.csv", "dba_users.csv", "dba_roles.csv",
+    "dba_sys_privs.csv", "performance_metrics.csv", "system_events.csv"
+] + CAPACITY_FILES
+
+# Fichiers non produits par le simulateur
+NOT_SIMULATED = {"execution_plans.csv", "rman_jobs.csv"}
+
+
+def build_stages(source="none", data_dir=DATA_DIR, oracle_config=None):
+    """
+    Déclare le DAG : extraction (optionnelle) -> 4 agents indépendants.
+    Les dépendances se déduisent des fichiers : une étape dépend de celles qui produisent ses entrées.
+    data_dir : datav1/ ou le dossier d'une cible de la flotte (oracle_config : sa connexion).
+    """
+    target_file = partial(data_file, data_dir=data_dir)
+    stages = []
+    if source == "oracle":
+        stages.append(Stage("extraction", [], [target_file(f) for f in EXTRACTED_FILES],
+                            partial(run_oracle_extraction, data_dir=data_dir, config=oracle_config), always_run=True))
+    elif source == "simulator":
+        stages.append(Stage("extraction", [], [target_file(f) for f in EXTRACTED_FILES if f not in NOT_SIMULATED],
+                            partial(run_simulated_extraction, data_dir=data_dir), always_run=True))
+
+    stages += [
+        Stage("anomaly",
+              [target_file("audit_logs.csv"), PROMPTS_FILE],
+              [target_file("detected_anomalies.json")], partial(run_anomaly, data_dir=data_dir)),
+        Stage("optimizer",
+              [target_file("performance_metrics.csv"), target_file("execution_plans.csv"), PROMPTS_FILE],
+              [target_file("query_analysis.json")], partial(run_optimizer, data_dir=data_dir)),
+        Stage("security",
+              [target_file("dba_users.csv"), target_file("dba_roles.csv"), target_file("dba_sys_privs.csv"), PROMPTS_FILE],
+              [target_file("last_audit.json")], partial(run_security, data_dir=data_dir)),
+        Stage("backup",
+              [target_file("performance_metrics.csv"), target_file("dba_roles.csv"), PROMPTS_FILE]
+              + [target_file(f) for f in CAPACITY_FILES],
+              [target_file("backup_plan.json"), target_file("backup_script.rman")], partial(run_backup, data_dir=data_dir)),
+    ]
+    return stages
+
+
+class PipelineRunner:
+    """
+    Orchestrateur incrémental :
+    - empreinte (SHA-256) des entrées de chaque étape, comparée au manifeste du dernier run ;
+    - une étape dont les entrées (et paramètres) n'ont pas changé et dont les sorties existent est sautée ;
+    - les étapes indépendantes (les agents) s'exécutent en parallèle ;
+    - le manifeste (empreintes, statut, durées) est persisté dans datav1/pipeline_manifest.json.
+    """
+
+    def __init__(self, stages, params=None, manifest_path=MANIFEST_FILE, max_workers=4):
+        self.stages = {s.name: s for s in stages}
+        self.params = params or {}
+        self.manifest_path = manifest_path
+        self.max_workers = max_workers
+        self.previous = self._load_manifest()
+        self.deps = self._compute_deps()
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('stages', {})
+        except (OSError, ValueError):
+            return {}
+
+    def _compute_deps(self):
+        producers = {out: s.name for s in self.stages.values() for out in s.outputs}
+        return {
+            s.name: {producers[i] for i in s.inputs if i in producers and producers[i] != s.name}
+            for s in self.stages.values()
+        }
+
+    def _fingerprint(self, stage):
+        """Empreinte des entrées + paramètres de l'étape, calculée juste avant son exécution."""
+        inputs = {path: file_hash(path) for path in stage.inputs}
+        params = self.params.get(stage.name)
+        return inputs, hashlib.sha256(json.dumps([inputs, params], sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _is_up_to_date(self, stage, fingerprint):
+        if stage.always_run:
+            return False
+        prev = self.previous.get(stage.name, {})
+        return (prev.get('fingerprint') == fingerprint
+                and prev.get('status') in ('ran', 'skipped')
+                and all(os.path.exists(out) for out in stage.outputs))
+
+    def _execute(self, stage, force):
+        inputs, fingerprint = self._fingerprint(stage)
+        entry = {'inputs': inputs, 'fingerprint': fingerprint, 'started_at': datetime.now().isoformat()}
+        start = time.perf_counter()
+        if not force and self._is_up_to_date(stage, fingerprint):
+            entry['status'] = 'skipped'
+            print(f"⏭️  {stage.name} : entrées inchangées, étape sautée.")
+        else:
+            print(f"▶️  {stage.name} : exécution...")
+            try:
+                stage.run(self.params)
+                entry['status'] = 'ran'
+                entry['outputs'] = {out: file_hash(out) for out in stage.outputs}
+            except Exception as e:
+                entry['status'] = 'failed'
+                entry['error'] = str(e)
+                print(f"❌ {stage.name} : {e}")
+        entry['duration_s'] = round(time.perf_counter() - start, 3)
+        entry['finished_at'] = datetime.now().isoformat()
+        return entry
+
+    def run(self, only=None, force=False):
+        """Exécute le DAG (ou le sous-ensemble `only`) et retourne le manifeste du run."""
+        selected = set(only) if only else set(self.stages)
+        results = {}
+        pending = set(selected)
+        running = {}
+        run_start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for name in sorted(pending):
+                    deps = self.deps[name] & selected
+                    if any(d in pending or d in running.values() for d in deps):
+                        continue
+                    pending.discard(name)
+                    if any(results[d]['status'] == 'failed' for d in deps):
+                        results[name] = {'status': 'failed', 'error': "Étape amont en échec", 'duration_s': 0}
+                        continue
+                    running[pool.submit(self._execute, self.stages[name], force)] = name
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+
+        # Les étapes non sélectionnées conservent leur état précédent dans le manifeste
+        stages_state = dict(self.previous)
+        stages_state.update(results)
+        manifest = {
+            'run_at': datetime.now().isoformat(),
+            'duration_s': round(time.perf_counter() - run_start, 3),
+            'run': {name: results[name]['status'] for name in sorted(results)},
+            'stages': stages_state
+        }
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+        self.previous = stages_state
+        return manifest
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Pipeline incrémental : extraction -> agents d'analyse")
+    parser.add_argument("--source", choices=["none", "oracle", "simulator"], default="none",
+                        help="Étape d'extraction à exécuter avant les agents (défaut : aucune)")
+    parser.add_argument("--stages", default="", help="Liste d'étapes à exécuter (ex : anomaly,security)")
+    parser.add_argument("--force", action="store_true", help="Ignore les empreintes et relance tout")
+    parser.add_argument("--target", help="Base de la flotte : données et résultats dans datav1/targets/<nom>/")
+    parser.add_argument("--inventory", help="Inventaire de la flotte (connexion de --target avec --source oracle)")
+    parser.add_argument("--workers", type=int, default=4, help="Nombre d'étapes exécutées en parallèle")
+    parser.add_argument("--rpo", default="24h")
+    parser.add_argument("--rto", default="4h")
+    parser.add_argument("--budget", default="Moyen")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profil CPU + mémoire des étapes (rapports dans datav1/profiles/)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.profile:
+        profiling.enable()
+    params = {"backup": {"rpo": args.rpo, "rto": args.rto, "budget": args.budget}}
+    data_dir, oracle_config = DATA_DIR, None
+    if args.target:
+        import fleet
+        data_dir = fleet.target_data_dir(args.target)
+        if args.source == "oracle":
+            inventory = fleet.load_inventory(args.inventory or fleet.INVENTORY_FILE)
+            entry = fleet.select_targets(inventory, [args.target])[args.target]
+            if entry["type"] == "simulator":
+                args.source = "simulator"
+            else:
+                oracle_config = fleet.connection_config(args.target, entry)
+    manifest_file = os.path.join(data_dir, "pipeline_manifest.json")
+    runner = PipelineRunner(build_stages(args.source, data_dir, oracle_config), params=params,
+                            manifest_path=manifest_file, max_workers=args.workers)
+    only = [s for s in args.stages.split(",") if s] or None
+
+    unknown = set(only or []) - set(runner.stages)
+    if unknown:
+        print(f"❌ Étapes inconnues : {', '.join(sorted(unknown))}")
+        sys.exit(1)
+
+    manifest = runner.run(only=only, force=args.force)
+
+    print("\n--- RÉSUMÉ DU PIPELINE ---")
+    for name, status in manifest['run'].items():
+        print(f"  {name:<12} {status:<8} {manifest['stages'][name].get('duration_s', 0)}s")
+    print(f"Durée totale : {manifest['duration_s']}s (manifeste : {manifest_file})")
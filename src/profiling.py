@@ -0,0 +1,163 @@
+import os
+import io
+import sys
+import time
+import pstats
+import cProfile
+import functools
+import threading
+import tracemalloc
+from datetime import datetime
+import metrics
+
+# Activation : variable d'environnement AGENT_PROFILE=1 ou option --profile en ligne de commande
+_enabled = os.getenv("AGENT_PROFILE", "") == "1" or "--profile" in sys.argv
+PROFILE_DIR = os.getenv("AGENT_PROFILE_DIR", os.path.join("datav1", "profiles"))
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 20
+# Intervalle d'échantillonnage de la mémoire (secondes) pour capturer l'instantané au pic
+SAMPLE_INTERVAL = 0.25
+
+# cProfile et tracemalloc sont globaux au processus : un seul run profilé à la fois
+_active = threading.Lock()
+# Runs exécutés sans profil pendant le run profilé en cours (signalés dans son rapport)
+_skipped = []
+_skipped_lock = threading.Lock()
+
+SKIPPED_RUNS = metrics.counter("agent_profile_skipped_total", "Runs non profilés car un autre run profilé était en cours", ("name",))
+
+
+def enable(enabled=True):
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled():
+    return _enabled
+
+
+def profiled(name):
+    """
+    Décorateur des points d'entrée des agents.
+    Désactivé : appel direct de la fonction (un simple test booléen).
+    Activé : profil CPU (cProfile) + instantané mémoire (tracemalloc), écrits dans un rapport horodaté.
+    Un appel qui chevauche un run profilé s'exécute sans profil : il est journalisé, compté
+    (agent_profile_skipped_total) et mentionné dans le rapport du run en cours.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            if not _active.acquire(blocking=False):
+                _record_skip(name)
+                return func(*args, **kwargs)
+            try:
+                return _run_profiled(name, func, args, kwargs)
+            finally:
+                _active.release()
+        return wrapper
+    return decorator
+
+
+def _record_skip(name):
+    SKIPPED_RUNS.inc(name=name)
+    with _skipped_lock:
+        _skipped.append(name)
+    print(f"⚠️ {name} non profilé : un run profilé est déjà en cours (profil global au processus).")
+
+
+class _PeakSampler(threading.Thread):
+    """
+    Échantillonne la mémoire tracée pendant le run et garde l'instantané tracemalloc
+    pris au plus haut niveau observé : donne la répartition du pic par site d'allocation.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.stop_event = threading.Event()
+        self.peak_size = 0
+        self.peak_snapshot = None
+
+    def sample(self):
+        current, _ = tracemalloc.get_traced_memory()
+        # Nouvel instantané seulement si la mémoire a crû de plus de 10 % (take_snapshot est coûteux)
+        if current > self.peak_size * 1.1:
+            self.peak_size = current
+            self.peak_snapshot = tracemalloc.take_snapshot()
+
+    def run(self):
+        while not self.stop_event.wait(SAMPLE_INTERVAL):
+            self.sample()
+
+
+def _run_profiled(name, func, args, kwargs):
+    with _skipped_lock:
+        _skipped.clear()
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    sampler = _PeakSampler()
+    sampler.start()
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profiler.disable()
+        elapsed = time.perf_counter() - start
+        sampler.stop_event.set()
+        sampler.join()
+        sampler.sample()
+        current, peak = tracemalloc.get_traced_memory()
+        if not was_tracing:
+            tracemalloc.stop()
+        with _skipped_lock:
+            skipped = list(_skipped)
+        # Un échec du rapport ne doit ni masquer le résultat ni remplacer l'exception de l'agent
+        try:
+            path = write_report(name, profiler, sampler.peak_snapshot, elapsed, current, peak, skipped)
+            print(f"🔬 Rapport de profilage ({name}) : {path}")
+        except Exception as e:
+            print(f"⚠️ Rapport de profilage ({name}) impossible : {e}")
+
+
+def write_report(name, profiler, snapshot, elapsed, current, peak, skipped=()):
+    """
+    Écrit le rapport texte : top fonctions (temps cumulé) et mémoire au pic par site d'allocation.
+    skipped : runs concurrents non profilés (leur activité dans d'autres threads n'est pas mesurée).
+    """
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = os.path.join(PROFILE_DIR, f"{name}_{stamp}.txt")
+
+    stats_out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stats_out)
+    stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+
+    top_allocs = []
+    if snapshot is not None:
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        top_allocs = snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"=== PROFIL : {name} ({datetime.now().isoformat()}) ===\n")
+        f.write(f"Durée totale : {elapsed:.3f}s\n")
+        f.write(f"Mémoire tracée : actuelle {current / 1024 / 1024:.1f} Mo, pic {peak / 1024 / 1024:.1f} Mo\n")
+        if skipped:
+            f.write(f"⚠️ Runs concurrents non profilés : {len(skipped)} ({', '.join(sorted(set(skipped)))})\n")
+        f.write("\n")
+        f.write(f"--- TOP {TOP_FUNCTIONS} FONCTIONS (temps cumulé) ---\n")
+        f.write(stats_out.getvalue())
+        f.write(f"\n--- TOP {TOP_ALLOCATIONS} SITES D'ALLOCATION (instantané au pic échantillonné) ---\n")
+        if snapshot is None:
+            f.write("(aucun instantané mémoire échantillonné)\n")
+        for stat in top_allocs:
+            frame = stat.traceback[0]
+            f.write(f"{stat.size / 1024:10.1f} Ko  {stat.count:7d} blocs  {frame.filename}:{frame.lineno}\n")
+    return path
@@ -3,15 +3,30 @@ import json
 import os
 from llm_engine import LLMEngine
 from rag_setup import OracleRAG
+from result_store import ResultStore
+from regression_detector import RegressionDetector, format_regression
+from fleet import selected_target, target_data_dir
+from llm_scheduler import raise_if_cancelled
+import metrics
+import profiling
 
 class QueryOptimizer:
-    def __init__(self):
+    def __init__(self, data_dir="datav1"):
         # Initialisation des briques précédentes
         self.engine = LLMEngine() # Module 3
         self.rag = OracleRAG()     # Module 2
+        # Dossier de la base analysée (datav1/ ou datav1/targets/<nom>/ en mode flotte)
+        self.data_dir = data_dir
 
-    def analyze_slow_queries(self, metrics_file="datav1/performance_metrics.csv"):
-        """Analyse toutes les requêtes lentes détectées dans le Module 1 """
+    @metrics.track_agent("optimizer")
+    @profiling.profiled("analyze_slow_queries")
+    def analyze_slow_queries(self, metrics_file=None, progress_callback=None):
+        """
+        Analyse toutes les requêtes lentes détectées dans le Module 1
+        metrics_file : défaut <data_dir>/performance_metrics.csv
+        progress_callback(pourcentage, message) : optionnel, appelé après chaque requête analysée
+        """
+        metrics_file = metrics_file or os.path.join(self.data_dir, "performance_metrics.csv")
         if not os.path.exists(metrics_file):
             return {"error": "Fichier de métriques introuvable. Relancez le Module 1."}
 
@@ -19,7 +34,7 @@ class QueryOptimizer:
         df_metrics = pd.read_csv(metrics_file)
         
         # Chargement des plans pour avoir l'opération
-        plans_file = "datav1/execution_plans.csv"
+        plans_file = os.path.join(self.data_dir, "execution_plans.csv")
         if os.path.exists(plans_file):
             df_plans = pd.read_csv(plans_file)
             # On cherche l'opération la plus coûteuse ou la première significative
@@ -28,11 +43,18 @@ class QueryOptimizer:
                 df_plans['COST'] = pd.to_numeric(df_plans['COST'], errors='coerce').fillna(0)
                 df_plans = df_plans.sort_values(by=['SQL_ID', 'COST'], ascending=[True, False])
             
-            # On garde une seule ligne par SQL_ID (celle avec le coût le plus élevé ou la première)
-            df_plans_unique = df_plans.drop_duplicates(subset=['SQL_ID'])
+            # Plans extraits par couple SQL_ID / PLAN_HASH_VALUE : chaque curseur reçoit son propre plan
+            keys = ['SQL_ID', 'PLAN_HASH_VALUE'] if 'PLAN_HASH_VALUE' in df_plans.columns \
+                and 'PLAN_HASH_VALUE' in df_metrics.columns else ['SQL_ID']
+            # On garde une seule ligne par plan (celle avec le coût le plus élevé ou la première)
+            df_plans_unique = df_plans.drop_duplicates(subset=keys).copy()
+            if 'OPTIONS' in df_plans_unique.columns:
+                # "TABLE ACCESS" + "FULL" -> "TABLE ACCESS FULL"
+                options = df_plans_unique['OPTIONS'].fillna('').astype(str)
+                df_plans_unique['OPERATION'] = (df_plans_unique['OPERATION'].astype(str) + ' ' + options).str.strip()
             
             # Fusion
-            df = pd.merge(df_metrics, df_plans_unique[['SQL_ID', 'OPERATION', 'OBJECT_NAME']], on='SQL_ID', how='left')
+            df = pd.merge(df_metrics, df_plans_unique[keys + ['OPERATION', 'OBJECT_NAME']], on=keys, how='left')
             df.rename(columns={'OPERATION': 'PLAN_OPERATION'}, inplace=True)
         else:
             df = df_metrics
@@ -47,17 +69,31 @@ class QueryOptimizer:
         # Comme l'extraction trie par ELAPSED_TIME DESC, head(3) sont les plus lentes.
         # Le code précédent utilisait tail(3)... on garde tail(3) pour la cohérence demandée ("3 derniers")
         slow_queries = df.tail(3)
+
+        # Les SQL_ID en régression d'après l'historique des snapshots passent en priorité
+        regressions = self.find_regressions()
+        if regressions:
+            rank = df['SQL_ID'].astype(str).map({r["sql_id"]: i for i, r in enumerate(regressions)})
+            candidates = df[rank.notna()].assign(_rank=rank).sort_values('_rank')
+            candidates = candidates.drop_duplicates(subset=['SQL_ID']).drop(columns='_rank')
+            others = slow_queries[rank.loc[slow_queries.index].isna()]
+            slow_queries = pd.concat([candidates, others]).head(max(3, len(candidates)))
+        regressions = {r["sql_id"]: r for r in regressions}
         
         results = []
 
-        for _, row in slow_queries.iterrows():
+        total = len(slow_queries)
+        for i, (_, row) in enumerate(slow_queries.iterrows()):
             sql_text = row['SQL_TEXT']
             plan_op = row['PLAN_OPERATION']
             sql_id = row['SQL_ID']
 
             # 2. Récupération du contexte d'optimisation via le RAG (Module 2) [cite: 65]
-            context_docs, _ = self.rag.retrieve_context(f"Comment optimiser une opération {plan_op} sur la table {row.get('OBJECT_NAME', '')}")
+            context_docs, _ = self.rag.retrieve_context(f"Comment optimiser une opération {plan_op} sur la table {row.get('OBJECT_NAME', '')}", domain="opt")
             context_text = "\n".join(context_docs)
+            regression = regressions.get(str(sql_id))
+            if regression:
+                context_text = f"{format_regression(regression)}\n{context_text}"
 
             # 3. Génération de l'analyse via Gemini (Module 3) 
             print(f"⚡ Analyse de la requête {sql_id} en cours...")
@@ -68,19 +104,32 @@ class QueryOptimizer:
                 clean_json = analysis_raw.replace("```json", "").replace("```", "").strip()
                 analysis_data = json.loads(clean_json)
                 analysis_data["sql_id"] = sql_id
-                results.append(analysis_data)
             except Exception as e:
                 print(f"⚠️ Erreur de parsing pour {sql_id}: {e}")
-                results.append({"sql_id": sql_id, "raw_response": analysis_raw})
+                analysis_data = {"sql_id": sql_id, "raw_response": analysis_raw}
+            if regression:
+                analysis_data["regression"] = regression
+            results.append(analysis_data)
+
+            if progress_callback:
+                progress_callback(100 * (i + 1) / total, f"Requête {sql_id} analysée ({i + 1}/{total})")
 
-        # 4. Sauvegarde des analyses pour le Dashboard (Module 9)
-        with open("datav1/query_analysis.json", "w", encoding='utf-8') as f:
-            json.dump(results, f, indent=4, ensure_ascii=False)
+        # 4. Sauvegarde des analyses pour le Dashboard (Module 9) : nouvelle version + export JSON
+        raise_if_cancelled()
+        ResultStore(self.data_dir).publish("optimizer", results)
 
         return results
 
+    def find_regressions(self, limit=5):
+        """Régressions détectées sur les snapshots V$SQL de la base (liste vide sans historique)."""
+        try:
+            return RegressionDetector(self.data_dir).detect(limit=limit)
+        except Exception as e:
+            print(f"⚠️ Détection des régressions impossible : {e}")
+            return []
+
 if __name__ == "__main__":
-    optimizer = QueryOptimizer()
+    optimizer = QueryOptimizer(data_dir=target_data_dir(selected_target()))
     print("\n--- ANALYSE D'OPTIMISATION SQL ---")
     analyses = optimizer.analyze_slow_queries()
     
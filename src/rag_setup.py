@@ -1,24 +1,140 @@
 import os
+import threading
+from contextlib import contextmanager
 import chromadb
-from chromadb.utils import embedding_functions
+import metrics
+
+try:
+    import fcntl  # Verrou inter-processus (POSIX)
+except ImportError:  # Windows : verrou limité au processus courant
+    fcntl = None
+from embeddings import create_embedding_backend, LEGACY_SIGNATURE
+
+RAG_LATENCY = metrics.histogram("rag_query_duration_seconds", "Latence des recherches ChromaDB (embedding + similarité)", ("domain",))
+RAG_QUERIES = metrics.counter("rag_queries_total", "Recherches RAG par statut", ("status",))
+
+# Domaines de la base de connaissances : préfixe du fichier (opt_index_usage.txt -> "opt")
+DOMAINS = {
+    "opt": "Optimisation SQL",
+    "sec": "Sécurité",
+    "anom": "Anomalies",
+    "bkp": "Sauvegarde",
+    "rec": "Récupération",
+}
+# Mots-clés du routeur du chatbot (comparés à la question en minuscules)
+DOMAIN_KEYWORDS = {
+    "opt": ("lent", "lente", "optimis", "index", "plan d'exécution", "explain", "hint", "statisti",
+            "full scan", "table access", "performance", "requête", "sql_id"),
+    "sec": ("privilège", "privilege", "mot de passe", "password", "profil", "rôle", "role", "grant",
+            "audit", "sécurité", "securite"),
+    "anom": ("anomalie", "intrusion", "injection", "suspect", "attaque", "escalade", "hors heures",
+             "nocturne", "ddl", "drop"),
+    "bkp": ("sauvegarde", "backup", "rman", "rpo", "rto", "rétention", "retention", "archivelog",
+            "incrémentale", "incrementale"),
+    "rec": ("restaur", "récupér", "recuper", "recover", "pitr", "flashback", "point-in-time",
+            "point dans le temps", "corrompu", "supprimé", "perdu"),
+}
+# Version du schéma d'indexation (métadonnées des documents) : un changement force la ré-indexation
+INDEX_SCHEMA = "2"
+# Ouverture / ré-indexation de la collection : chaque agent a son OracleRAG (pipeline et tâches en parallèle)
+_collection_guard = threading.Lock()
+
+
+@contextmanager
+def _collection_lock(db_path):
+    """Verrou exclusif sur la base vectorielle : threads du processus puis autres processus (fichier .lock)."""
+    with _collection_guard:
+        os.makedirs(db_path, exist_ok=True)
+        with open(os.path.join(db_path, "collection.lock"), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            yield  # Verrou fichier libéré à la fermeture
+
+
+def document_domain(filename):
+    """Domaine d'un document d'après le préfixe de son nom de fichier (None si inconnu)."""
+    prefix = filename.split("_", 1)[0].lower()
+    return prefix if prefix in DOMAINS else None
+
+
+def route_domain(query):
+    """
+    Routeur léger du chatbot : choisit le domaine dont les mots-clés apparaissent le plus
+    dans la question. None si aucun mot-clé ou égalité (recherche sur toute la base).
+    """
+    text = query.lower()
+    scores = {domain: sum(1 for k in keywords if k in text) for domain, keywords in DOMAIN_KEYWORDS.items()}
+    best = max(scores.values())
+    if best == 0:
+        return None
+    winners = [domain for domain, score in scores.items() if score == best]
+    return winners[0] if len(winners) == 1 else None
+
 
 class OracleRAG:
-    def __init__(self, db_path="datav1/chroma_db"):
-        """Initialise ChromaDB avec un modèle d'embedding local """
+    COLLECTION_NAME = "oracle_docs"
+
+    def __init__(self, db_path="datav1/chroma_db", backend=None, knowledge_dir="datav1/knowledge"):
+        """
+        Initialise ChromaDB avec un modèle d'embedding local
+        backend : sentence-transformers | onnx-int8 | onnx (défaut : RAG_EMBEDDING_BACKEND)
+        """
         if not os.path.exists("datav1"):
             os.makedirs("datav1")
 
         self.client = chromadb.PersistentClient(path=db_path)
+        self.knowledge_dir = knowledge_dir
         
-        self.emb_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="all-MiniLM-L6-v2"
-        )
-        
-        self.collection = self.client.get_or_create_collection(
-            name="oracle_docs", 
-            embedding_function=self.emb_fn
+        self.emb_fn = create_embedding_backend(backend)
+        # Sous verrou : la signature est relue après l'attente, une ré-indexation faite
+        # entre-temps par un autre agent n'est pas refaite
+        with _collection_lock(db_path):
+            self.collection = self._open_collection()
+        print(f"✅ Base Vectorielle ChromaDB prête (Mode Local, {self.emb_fn.signature}).")
+
+    def _open_collection(self):
+        """
+        Ouvre la collection ; si elle a été indexée avec un autre backend d'embedding, un autre
+        schéma de métadonnées ou persistée avec une autre fonction d'embedding ChromaDB (index
+        antérieurs aux backends : "sentence_transformer"), elle est supprimée puis ré-indexée
+        depuis knowledge_dir.
+        """
+        signature = self.emb_fn.signature
+        expected = {"embedding_backend": signature, "index_schema": INDEX_SCHEMA}
+        try:
+            collection = self.client.get_or_create_collection(
+                name=self.COLLECTION_NAME,
+                embedding_function=self.emb_fn,
+                metadata=expected
+            )
+        except ValueError as e:
+            # ChromaDB refuse d'associer une fonction d'embedding différente de celle persistée
+            if "Embedding function conflict" not in str(e):
+                raise
+            print("🔄 Fonction d'embedding ChromaDB persistée incompatible : ré-indexation...")
+            return self._rebuild_collection(expected)
+
+        current = collection.metadata or {}
+        indexed_with = current.get("embedding_backend", LEGACY_SIGNATURE)
+        if indexed_with == signature and current.get("index_schema") == INDEX_SCHEMA:
+            return collection
+
+        if indexed_with != signature:
+            print(f"🔄 Backend d'embedding modifié ({indexed_with} -> {signature}) : ré-indexation...")
+        else:
+            print("🔄 Schéma d'indexation modifié (domaines) : ré-indexation...")
+        return self._rebuild_collection(expected)
+
+    def _rebuild_collection(self, metadata):
+        """Supprime la collection puis la recrée avec le backend courant et ré-indexe knowledge_dir."""
+        self.client.delete_collection(self.COLLECTION_NAME)
+        self.collection = self.client.create_collection(
+            name=self.COLLECTION_NAME,
+            embedding_function=self.emb_fn,
+            metadata=metadata
         )
-        print("✅ Base Vectorielle ChromaDB prête (Mode Local).")
+        self.add_documents(self.knowledge_dir)
+        return self.collection
 
     def add_documents(self, folder_path):
         """Lit les fichiers .txt et les indexe dans la base """
@@ -36,18 +152,41 @@ class OracleRAG:
                 with open(file_path, 'r', encoding='utf-8') as f:
                     documents.append(f.read())
                     ids.append(filename)
-                    metadatas.append({"source": filename})
+                    metadata = {"source": filename}
+                    domain = document_domain(filename)
+                    if domain:
+                        metadata["domain"] = domain
+                    metadatas.append(metadata)
         
         if documents:
             self.collection.upsert(ids=ids, documents=documents, metadatas=metadatas)
             print(f"📖 {len(documents)} documents indexés/mis à jour avec succès.")
 
-    def retrieve_context(self, query, n_results=5):
-        """Recherche par similarité sémantique (TOP-5 requis) """
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=n_results
-        )
+    def embed_query(self, query):
+        """Vecteur d'une question (réutilisable pour retrieve_context et le cache de réponses)."""
+        return self.emb_fn([query])[0]
+
+    def retrieve_context(self, query, n_results=5, domain=None, query_embedding=None):
+        """
+        Recherche par similarité sémantique (TOP-5 requis)
+        domain : restreint la recherche aux documents d'un domaine (opt, sec, anom, bkp, rec)
+        query_embedding : vecteur déjà calculé de `query` (évite un second embedding)
+        """
+        if domain is not None and domain not in DOMAINS:
+            raise ValueError(f"Domaine inconnu : {domain} (disponibles : {', '.join(DOMAINS)})")
+        status = "error"
+        with RAG_LATENCY.time(domain=domain or "all"):
+            try:
+                if query_embedding is None:
+                    query_embedding = self.embed_query(query)
+                results = self.collection.query(
+                    query_embeddings=[query_embedding],
+                    n_results=n_results,
+                    where={"domain": domain} if domain else None
+                )
+                status = "ok"
+            finally:
+                RAG_QUERIES.inc(status=status)
         # Retourne les textes et les métadonnées pour le test
         return results['documents'][0], results['metadatas'][0]
 
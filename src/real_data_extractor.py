@@ -3,77 +3,174 @@ import pandas as pd
 import os
 import sys
 import datetime
+import time
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from snapshot_store import SnapshotStore
+import metrics
+import profiling
+
+EXTRACT_LATENCY = metrics.histogram("extraction_query_duration_seconds", "Durée des requêtes d'extraction Oracle", ("file",))
+EXTRACT_ROWS = metrics.counter("extraction_rows_total", "Lignes extraites par fichier CSV", ("file",))
+EXTRACT_ERRORS = metrics.counter("extraction_errors_total", "Requêtes d'extraction en échec", ("file",))
 
 # =============================================================================
 # CONFIGURATION DE LA CONNEXION (Docker / Local)
+# Surchargée par les variables d'environnement ; en mode flotte, par l'inventaire (src/fleet.py)
 # =============================================================================
 DB_CONFIG = {
-    "username": "SYS",  
-    "password": "Oradoc_password1",
-    "host": "localhost",
-    "port": "1521",
-    "service_name": "XE"
+    "username": os.getenv("ORACLE_USER", "SYS"),
+    "password": os.getenv("ORACLE_PASSWORD", ""),
+    "host": os.getenv("ORACLE_HOST", "localhost"),
+    "port": os.getenv("ORACLE_PORT", "1521"),
+    "service_name": os.getenv("ORACLE_SERVICE", "XE")
 }
-OUTPUT_DIR = 'dataV1'
+OUTPUT_DIR = 'datav1'
+
+# Couples (SQL_ID, PLAN_HASH_VALUE) liés par exécution (un aller-retour par lot) pour l'extraction des plans
+PLAN_BIND_BATCH = int(os.getenv("PLAN_BIND_BATCH", "100"))
+# Une ligne par plan, agrégée côté Oracle : l'opération la plus coûteuse (coût propre = coût
+# cumulé de la ligne moins celui de ses filles), le coût total (ligne 0) et le nombre de lignes.
+# Un seul curseur enfant par plan (les enfants d'un même PLAN_HASH_VALUE ont des lignes identiques).
+PLAN_QUERY = """
+    WITH plan_lines AS (
+        SELECT SQL_ID, PLAN_HASH_VALUE, ID, PARENT_ID, OPERATION, OPTIONS, OBJECT_NAME, OPTIMIZER,
+               COST, CPU_COST, IO_COST, TIME
+        FROM (
+            SELECT p.*, DENSE_RANK() OVER (PARTITION BY p.SQL_ID, p.PLAN_HASH_VALUE
+                                           ORDER BY p.CHILD_NUMBER, p.CHILD_ADDRESS) AS CHILD_RANK
+            FROM V$SQL_PLAN p
+            WHERE (p.SQL_ID, p.PLAN_HASH_VALUE) IN ({pairs})
+        )
+        WHERE CHILD_RANK = 1
+    ),
+    line_costs AS (
+        SELECT l.*,
+               NVL(l.COST, 0) - NVL((SELECT SUM(c.COST) FROM plan_lines c
+                                     WHERE c.SQL_ID = l.SQL_ID AND c.PLAN_HASH_VALUE = l.PLAN_HASH_VALUE
+                                       AND c.PARENT_ID = l.ID), 0) AS OWN_COST
+        FROM plan_lines l
+    )
+    SELECT SQL_ID, PLAN_HASH_VALUE, ID, OPERATION, OPTIONS, OBJECT_NAME, OPTIMIZER,
+           COST, CPU_COST, IO_COST, TIME, OWN_COST, TOTAL_COST, PLAN_LINES
+    FROM (
+        SELECT lc.*,
+               MAX(CASE WHEN lc.ID = 0 THEN lc.COST END) OVER (PARTITION BY lc.SQL_ID, lc.PLAN_HASH_VALUE) AS TOTAL_COST,
+               COUNT(*) OVER (PARTITION BY lc.SQL_ID, lc.PLAN_HASH_VALUE) AS PLAN_LINES,
+               ROW_NUMBER() OVER (PARTITION BY lc.SQL_ID, lc.PLAN_HASH_VALUE
+                                  ORDER BY CASE WHEN lc.ID = 0 THEN 1 ELSE 0 END, lc.OWN_COST DESC, lc.ID) AS RN
+        FROM line_costs lc
+    )
+    WHERE RN = 1
+"""
+
+
+class ExtractionError(Exception):
+    """Base injoignable ou authentification refusée."""
+
 
 class OracleDataExtractor:
-    def __init__(self):
+    def __init__(self, config=None, output_dir=OUTPUT_DIR, max_connections=1, connection_slots=None, name=None):
         """
         Module 1 : Extraction de Données & Infrastructure.
         Utilise le driver moderne 'oracledb' (Thin mode) - Pas d'Instant Client requis.
         
         Documentation pour connexion distante [Livrable 53]:
-        1. Changer 'host' par l'IP du serveur cible.
-        2. Changer 'service_name' par le SID/Service de la base.
+        1. Changer 'host' par l'IP du serveur cible (ORACLE_HOST ou inventaire).
+        2. Changer 'service_name' par le SID/Service de la base (ORACLE_SERVICE).
         3. Vérifier que le port 1521 est accessible.
+
+        max_connections : connexions ouvertes en parallèle sur cette base (requêtes concurrentes).
+        connection_slots : sémaphore partagé entre les cibles (borne globale des connexions, mode flotte).
         """
-        self.output_dir = OUTPUT_DIR
+        self.config = dict(DB_CONFIG, **(config or {}))
+        self.output_dir = output_dir
+        self.max_connections = max(1, int(max_connections))
+        self.connection_slots = connection_slots
+        self.prefix = f"[{name}] " if name else ""
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
             print(f"📂 Dossier '{self.output_dir}' prêt.")
         
-        print(f"🚀 Démarrage Module 1 avec python-oracledb (Mode Thin)")
-        self.conn = self._connect()
+        print(f"🚀 {self.prefix}Démarrage Module 1 avec python-oracledb (Mode Thin)")
 
     def _connect(self):
-        """Etablit la connexion en mode SYSDBA."""
+        """Etablit une connexion (mode SYSDBA pour SYS) ; lève ExtractionError en cas d'échec."""
+        dsn = oracledb.makedsn(self.config["host"], self.config["port"],
+                               service_name=self.config["service_name"])
+        username = self.config["username"]
+        sysdba = self.config.get("sysdba", username.upper() == "SYS")
         try:
-            dsn = oracledb.makedsn(DB_CONFIG["host"], DB_CONFIG["port"], 
-                                service_name=DB_CONFIG["service_name"])
-            
-            # Connexion avec SYSDBA nécessite parfois SYS au lieu de SYSTEM
             conn = oracledb.connect(
-                user="SYS",  # Changez SYSTEM par SYS
-                password=DB_CONFIG["password"],
+                user=username,
+                password=self.config["password"],
                 dsn=dsn,
-                mode=oracledb.AUTH_MODE_SYSDBA
+                mode=oracledb.AUTH_MODE_SYSDBA if sysdba else oracledb.AUTH_MODE_DEFAULT
             )
-            print(f"✅ Connexion SYSDBA réussie")
-            return conn
         except oracledb.Error as e:
             error_obj, = e.args
-            print(f"❌ Erreur : {error_obj.message}")
-            sys.exit(1)
-    def extract_query_to_csv(self, query, filename, description):
-        """Exécute SQL et sauvegarde en CSV normalisé."""
-        print(f"   ⏳ Extraction : {description}...")
+            raise ExtractionError(f"{dsn} : {error_obj.message}") from e
+        print(f"✅ {self.prefix}Connexion {'SYSDBA ' if sysdba else ''}réussie")
+        return conn
+
+    def _open_connections(self):
+        """
+        Ouvre jusqu'à max_connections connexions. La première attend un créneau global libre ;
+        les suivantes ne sont ouvertes que si un créneau est disponible immédiatement.
+        """
+        connections = []
+        while len(connections) < self.max_connections:
+            if self.connection_slots is not None and not self.connection_slots.acquire(blocking=not connections):
+                break
+            try:
+                connections.append(self._connect())
+            except ExtractionError as e:
+                if self.connection_slots is not None:
+                    self.connection_slots.release()
+                if not connections:
+                    raise
+                print(f"⚠️ {self.prefix}Connexion supplémentaire refusée ({e}), poursuite avec {len(connections)}.")
+                break
+        return connections
+
+    def _close_connections(self, connections):
+        for conn in connections:
+            try:
+                conn.close()
+            except oracledb.Error:
+                pass
+            finally:
+                if self.connection_slots is not None:
+                    self.connection_slots.release()
+
+    def extract_query_to_csv(self, query, filename, description, conn):
+        """Exécute SQL et sauvegarde en CSV normalisé. Retourne True si le fichier a été écrit."""
+        print(f"   ⏳ {self.prefix}Extraction : {description}...")
+        start = time.perf_counter()
         try:
             # Pandas supporte oracledb via SQLAlchemy ou connection directe
             # Ici on utilise la méthode directe simple
-            df = pd.read_sql(query, self.conn)
+            df = pd.read_sql(query, conn)
             
             # Normalisation [Livrable 52] : Colonnes en majuscules
             df.columns = [col.upper() for col in df.columns]
             
             path = os.path.join(self.output_dir, filename)
             df.to_csv(path, index=False)
-            print(f"      ✅ {filename} généré ({len(df)} lignes).")
+            print(f"      ✅ {self.prefix}{filename} généré ({len(df)} lignes).")
+            EXTRACT_ROWS.inc(len(df), file=filename)
+            return True
         except Exception as e:
-            print(f"      ⚠️ Erreur sur {filename}: {e}")
+            EXTRACT_ERRORS.inc(file=filename)
+            print(f"      ⚠️ {self.prefix}Erreur sur {filename}: {e}")
+            return False
+        finally:
+            EXTRACT_LATENCY.observe(time.perf_counter() - start, file=filename)
+
+    def extraction_plan(self):
+        """Requêtes des livrables demandés : liste de (requête, fichier CSV, description)."""
+        plan = []
 
-    def run_full_extraction(self):
-        """Exécute les extractions des livrables demandés."""
-        
         # 1. Logs d'audit (AUD$) [Livrable 48]
         # On utilise DBA_AUDIT_TRAIL pour lire AUD$
         q_audit = """
@@ -85,53 +182,48 @@ class OracleDataExtractor:
             ORDER BY TIMESTAMP DESC
             FETCH FIRST 2000 ROWS ONLY
         """
-        self.extract_query_to_csv(q_audit, "audit_logs.csv", "Logs d'audit")
+        plan.append((q_audit, "audit_logs.csv", "Logs d'audit"))
 
-        # 2. Plans d'exécution (V$SQL_PLAN) 
-        q_plans = """
-            SELECT 
-                SQL_ID, PLAN_HASH_VALUE, ID, OPERATION, OPTIONS, 
-                OBJECT_NAME, OPTIMIZER, COST, CPU_COST, IO_COST, TIME
-            FROM V$SQL_PLAN
-            WHERE ROWNUM <= 2000
-        """
-        self.extract_query_to_csv(q_plans, "execution_plans.csv", "Plans d'exécution")
+        # 2. Plans d'exécution (V$SQL_PLAN) : extraits après les statistiques SQL, pour leurs
+        #    seuls couples SQL_ID / PLAN_HASH_VALUE (voir extract_plans)
 
         # 3. Configurations de sécurité 
         # A. Users
-        self.extract_query_to_csv(
+        plan.append((
             "SELECT USERNAME, ACCOUNT_STATUS, LOCK_DATE, EXPIRY_DATE, PROFILE, LAST_LOGIN FROM DBA_USERS",
             "dba_users.csv", "Config Users"
-        )
+        ))
         # B. Roles
-        self.extract_query_to_csv(
+        plan.append((
             "SELECT ROLE, PASSWORD_REQUIRED, AUTHENTICATION_TYPE FROM DBA_ROLES",
             "dba_roles.csv", "Config Roles"
-        )
+        ))
         # C. Privilèges Système
-        self.extract_query_to_csv(
+        plan.append((
             "SELECT GRANTEE, PRIVILEGE, ADMIN_OPTION FROM DBA_SYS_PRIVS",
             "dba_sys_privs.csv", "Privilèges Système"
-        )
+        ))
 
-        # 4. Métriques de performance 
+        # 4. Métriques de performance (compteurs cumulés : les écarts par intervalle sont calculés par SnapshotStore)
         # A. SQL Stats
         q_sqlstat = """
             SELECT 
                 SQL_ID, 
+                PLAN_HASH_VALUE,
                 SUBSTR(SQL_TEXT, 1, 200) AS SQL_TEXT,
                 ELAPSED_TIME, 
                 CPU_TIME, 
                 EXECUTIONS, 
                 DISK_READS, 
                 BUFFER_GETS,
-                OPTIMIZER_COST
+                OPTIMIZER_COST,
+                FIRST_LOAD_TIME
             FROM V$SQL
             WHERE EXECUTIONS > 0
             ORDER BY ELAPSED_TIME DESC
             FETCH FIRST 500 ROWS ONLY
         """
-        self.extract_query_to_csv(q_sqlstat, "performance_metrics.csv", "Stats SQL")
+        plan.append((q_sqlstat, "performance_metrics.csv", "Stats SQL"))
 
         # B. System Events
         q_sysevent = """
@@ -139,11 +231,168 @@ class OracleDataExtractor:
             FROM V$SYSTEM_EVENT 
             ORDER BY TIME_WAITED DESC
         """
-        self.extract_query_to_csv(q_sysevent, "system_events.csv", "Events Système")
+        plan.append((q_sysevent, "system_events.csv", "Events Système"))
+
+        # 5. Capacité (modèle de fenêtre de sauvegarde du BackupRecommender)
+        # A. Volumétrie utilisée par segment (agrégée : RMAN ne lit que les blocs utilisés)
+        q_segments = """
+            SELECT OWNER, SEGMENT_TYPE, TABLESPACE_NAME, COUNT(*) AS SEGMENTS, SUM(BYTES) AS BYTES
+            FROM DBA_SEGMENTS
+            GROUP BY OWNER, SEGMENT_TYPE, TABLESPACE_NAME
+            ORDER BY BYTES DESC
+        """
+        plan.append((q_segments, "segment_sizes.csv", "Taille des segments"))
+
+        # B. Datafiles (nombre et taille : bornent le parallélisme RMAN)
+        plan.append((
+            "SELECT FILE_ID, TABLESPACE_NAME, BYTES, MAXBYTES, AUTOEXTENSIBLE FROM DBA_DATA_FILES",
+            "datafiles.csv", "Datafiles"
+        ))
+
+        # C. Génération de redo par heure sur 7 jours (historique des bascules, valable aussi en NOARCHIVELOG)
+        q_redo = """
+            SELECT TRUNC(h.FIRST_TIME, 'HH24') AS HOUR,
+                   COUNT(*) AS LOG_SWITCHES,
+                   COUNT(*) * (SELECT AVG(BYTES) FROM V$LOG) AS BYTES,
+                   168 AS HOURS_OBSERVED
+            FROM V$LOG_HISTORY h
+            WHERE h.FIRST_TIME > SYSDATE - 7
+            GROUP BY TRUNC(h.FIRST_TIME, 'HH24')
+            ORDER BY HOUR
+        """
+        plan.append((q_redo, "archive_rates.csv", "Débit de redo/archivelogs"))
+
+        # D. Mode d'archivage, Block Change Tracking et démarrage de l'instance (remise à zéro des V$)
+        q_dbinfo = """
+            SELECT d.NAME, d.LOG_MODE, d.DATABASE_ROLE,
+                   (SELECT STATUS FROM V$BLOCK_CHANGE_TRACKING) AS BCT_STATUS,
+                   (SELECT TO_CHAR(STARTUP_TIME, 'YYYY-MM-DD HH24:MI:SS') FROM V$INSTANCE) AS STARTUP_TIME
+            FROM V$DATABASE d
+        """
+        plan.append((q_dbinfo, "database_info.csv", "Infos base"))
+
+        # E. Débits RMAN mesurés (30 derniers jours) et canaux de chaque job : sessions distinctes
+        # des E/S de sauvegarde du job (V$BACKUP_ASYNC_IO / SYNC_IO, conservées depuis le démarrage),
+        # sinon parallélisme DISK configuré (V$RMAN_CONFIGURATION), sinon 1 (défaut RMAN)
+        q_rman = """
+            SELECT j.INPUT_TYPE, j.START_TIME, j.ELAPSED_SECONDS, j.INPUT_BYTES, j.OUTPUT_BYTES,
+                   j.INPUT_BYTES_PER_SEC, j.OUTPUT_BYTES_PER_SEC,
+                   COALESCE(
+                       NULLIF((SELECT COUNT(DISTINCT io.SID)
+                               FROM (SELECT SID, TYPE, RMAN_STATUS_RECID, RMAN_STATUS_STAMP FROM V$BACKUP_ASYNC_IO
+                                     UNION ALL
+                                     SELECT SID, TYPE, RMAN_STATUS_RECID, RMAN_STATUS_STAMP FROM V$BACKUP_SYNC_IO) io
+                               JOIN V$RMAN_STATUS s
+                                 ON s.RECID = io.RMAN_STATUS_RECID AND s.STAMP = io.RMAN_STATUS_STAMP
+                               WHERE io.TYPE = 'AGGREGATE'
+                                 AND s.SESSION_RECID = j.SESSION_RECID AND s.SESSION_STAMP = j.SESSION_STAMP), 0),
+                       (SELECT MAX(TO_NUMBER(REGEXP_SUBSTR(c.VALUE, 'PARALLELISM ([0-9]+)', 1, 1, NULL, 1)))
+                        FROM V$RMAN_CONFIGURATION c
+                        WHERE c.NAME = 'DEVICE TYPE' AND c.VALUE LIKE 'DISK%'),
+                       1) AS PARALLELISM
+            FROM V$RMAN_BACKUP_JOB_DETAILS j
+            WHERE j.START_TIME > SYSDATE - 30 AND j.STATUS = 'COMPLETED'
+              AND j.INPUT_TYPE IN ('DB FULL', 'DB INCR', 'DATAFILE FULL')
+            ORDER BY j.START_TIME DESC
+        """
+        plan.append((q_rman, "rman_jobs.csv", "Historique RMAN"))
+        return plan
+
+    @staticmethod
+    def plan_keys(metrics_path):
+        """Couples (SQL_ID, PLAN_HASH_VALUE) distincts des statistiques SQL extraites."""
+        df = pd.read_csv(metrics_path, usecols=["SQL_ID", "PLAN_HASH_VALUE"], dtype={"SQL_ID": str}).dropna()
+        df["PLAN_HASH_VALUE"] = df["PLAN_HASH_VALUE"].astype("int64")
+        return list(df.drop_duplicates().itertuples(index=False, name=None))
+
+    def extract_plans(self, conn, filename="execution_plans.csv", batch_size=PLAN_BIND_BATCH):
+        """
+        Plans d'exécution des seules requêtes de performance_metrics.csv, agrégés côté Oracle
+        (une ligne par SQL_ID / PLAN_HASH_VALUE, voir PLAN_QUERY). Les couples sont liés par lots
+        de `batch_size` ; le dernier lot est complété par des NULL pour que toutes les exécutions
+        partagent le même texte SQL (un seul curseur analysé). Retourne True si le fichier a été écrit.
+        """
+        print(f"   ⏳ {self.prefix}Extraction : Plans d'exécution (requêtes extraites)...")
+        start = time.perf_counter()
+        try:
+            keys = self.plan_keys(os.path.join(self.output_dir, "performance_metrics.csv"))
+            query = PLAN_QUERY.format(pairs=", ".join(f"(:s{i}, :h{i})" for i in range(batch_size)))
+            rows, columns = [], None
+            cursor = conn.cursor()
+            cursor.arraysize = 500
+            try:
+                for offset in range(0, len(keys), batch_size):
+                    batch = keys[offset:offset + batch_size]
+                    batch += [(None, None)] * (batch_size - len(batch))
+                    binds = {}
+                    for i, (sql_id, plan_hash) in enumerate(batch):
+                        binds[f"s{i}"], binds[f"h{i}"] = sql_id, plan_hash
+                    cursor.execute(query, binds)
+                    columns = [d[0].upper() for d in cursor.description]
+                    rows.extend(cursor.fetchall())
+            finally:
+                cursor.close()
+
+            df = pd.DataFrame(rows, columns=columns or ["SQL_ID", "PLAN_HASH_VALUE", "ID", "OPERATION", "OPTIONS",
+                                                        "OBJECT_NAME", "OPTIMIZER", "COST", "CPU_COST", "IO_COST",
+                                                        "TIME", "OWN_COST", "TOTAL_COST", "PLAN_LINES"])
+            df.to_csv(os.path.join(self.output_dir, filename), index=False)
+            covered = len(df[["SQL_ID", "PLAN_HASH_VALUE"]].drop_duplicates())
+            print(f"      ✅ {self.prefix}{filename} généré ({covered}/{len(keys)} plans, "
+                  f"{-(-len(keys) // batch_size)} lot(s)).")
+            EXTRACT_ROWS.inc(len(df), file=filename)
+            return True
+        except Exception as e:
+            EXTRACT_ERRORS.inc(file=filename)
+            print(f"      ⚠️ {self.prefix}Erreur sur {filename}: {e}")
+            return False
+        finally:
+            EXTRACT_LATENCY.observe(time.perf_counter() - start, file=filename)
+
+    @metrics.track_agent("extraction")
+    @profiling.profiled("run_full_extraction")
+    def run_full_extraction(self):
+        """
+        Exécute les extractions des livrables demandés, réparties sur les connexions ouvertes
+        (une requête à la fois par connexion). Lève ExtractionError si la base est injoignable.
+        """
+        plan = self.extraction_plan()
+        connections = self._open_connections()
+        try:
+            if len(connections) == 1:
+                written = [self.extract_query_to_csv(*item, connections[0]) for item in plan]
+            else:
+                available = queue.Queue()
+                for conn in connections:
+                    available.put(conn)
+
+                def run(item):
+                    conn = available.get()
+                    try:
+                        return self.extract_query_to_csv(*item, conn)
+                    finally:
+                        available.put(conn)
+
+                with ThreadPoolExecutor(max_workers=len(connections)) as pool:
+                    written = list(pool.map(run, plan))
+            # Les plans dépendent des SQL_ID / PLAN_HASH_VALUE qui viennent d'être extraits
+            metrics_written = written[[item[1] for item in plan].index("performance_metrics.csv")]
+            plan.append((None, "execution_plans.csv", "Plans d'exécution"))
+            written.append(metrics_written and self.extract_plans(connections[0]))
+        finally:
+            self._close_connections(connections)
 
-        print(f"\n✅ Extraction terminée. Fichiers disponibles dans '{self.output_dir}/'")
-        self.conn.close()
+        files = [item[1] for item, ok in zip(plan, written) if ok]
+        failed = [item[1] for item, ok in zip(plan, written) if not ok]
+        # Historisation des compteurs V$SQL / V$SYSTEM_EVENT (les CSV sont écrasés à chaque extraction)
+        if {"performance_metrics.csv", "system_events.csv"} & set(files):
+            SnapshotStore(self.output_dir).capture()
+        print(f"\n✅ {self.prefix}Extraction terminée. Fichiers disponibles dans '{self.output_dir}/'")
+        return {"fichiers": files, "echecs": failed, "connexions": len(connections)}
 
 if __name__ == "__main__":
-    extractor = OracleDataExtractor()
-    extractor.run_full_extraction()
\ No newline at end of file
+    try:
+        OracleDataExtractor().run_full_extraction()
+    except ExtractionError as e:
+        print(f"❌ Erreur : {e}")
+        sys.exit(1)
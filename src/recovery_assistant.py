@@ -1,36 +1,97 @@
+import re
 import json
 from llm_engine import LLMEngine
 from rag_setup import OracleRAG
+from answer_cache import SemanticAnswerCache, context_key
+import metrics
+
+RECOVERY_SCENARIOS = metrics.counter("recovery_scenarios_total", "Questions de récupération par scénario détecté", ("scenario",))
+
+# Scénario utilisé quand le classifieur ne tranche pas : toutes les instructions sont incluses
+GENERAL = "general"
+
+
+def compile_prompts(recovery_conf):
+    """
+    Compile une fois les instructions de prompts.yaml : un bloc par scénario (rôle système,
+    exemple du scénario, instruction du scénario) et un bloc général avec tous les scénarios.
+    Retourne (instructions par scénario, classifieur [(scénario, mots-clés, regex)]).
+    """
+    scenarios = recovery_conf['scenarios']
+    system_rules = recovery_conf['system_role']
+    few_shots = recovery_conf.get('few_shot', "")
+
+    compiled = {}
+    classifier = []
+    for name, conf in scenarios.items():
+        block = system_rules
+        if conf.get('example'):
+            block += f"\n\nEXEMPLE DE CAS :\n{conf['example']}\n"
+        block += f"\nINSTRUCTIONS DU SCÉNARIO :\n- {conf['instruction']}\n"
+        compiled[name] = block
+        keywords = tuple(k.lower() for k in conf.get('keywords', []))
+        patterns = tuple(re.compile(p) for p in conf.get('patterns', []))
+        classifier.append((name, keywords, patterns))
+
+    general = f"{system_rules}\n\nEXEMPLES DE CAS (FEW-SHOT) :\n{few_shots}\n"
+    general += "\nINSTRUCTIONS PAR SCÉNARIO :\n"
+    for conf in scenarios.values():
+        general += f"- {conf['instruction']}\n"
+    compiled[GENERAL] = general
+    return compiled, classifier
+
+
+def classify_scenario(question, classifier):
+    """Scénario dont les mots-clés/motifs apparaissent le plus ; GENERAL si aucun ou égalité."""
+    text = question.lower()
+    scores = {
+        name: sum(1 for k in keywords if k in text) + sum(1 for p in patterns if p.search(text))
+        for name, keywords, patterns in classifier
+    }
+    best = max(scores.values(), default=0)
+    winners = [name for name, score in scores.items() if score == best]
+    return winners[0] if best and len(winners) == 1 else GENERAL
+
 
 class RecoveryAssistant:
     def __init__(self):
         self.engine = LLMEngine()
         self.rag = OracleRAG()
+        self.answer_cache = SemanticAnswerCache(name="recovery")
+        # Prompts compilés au chargement (prompts.yaml n'est pas relu à chaque message)
+        self.instructions, self.classifier = compile_prompts(self.engine.prompts['recovery'])
+        self.prompt_keys = {name: context_key(block) for name, block in self.instructions.items()}
+
+    @metrics.track_agent("recovery")
+    def chat(self, user_input, return_cached=False):
+        """
+        Réponse de l'assistant ; les questions déjà posées (similarité sémantique) sont servies
+        depuis le cache. return_cached=True retourne (réponse, servie_depuis_le_cache).
+        """
+        # Routage vers un scénario : seules ses instructions sont envoyées au LLM
+        scenario = classify_scenario(user_input, self.classifier)
+        RECOVERY_SCENARIOS.inc(scenario=scenario)
 
-    def chat(self, user_input):
-        #Déballage du tuple (docs, metas)
-        context_docs, _ = self.rag.retrieve_context(user_input)
+        # Les réponses en cache ne valent que pour les instructions du scénario courant
+        query_embedding = self.rag.embed_query(user_input)
+        cache_key = self.prompt_keys[scenario]
+        cached = self.answer_cache.lookup(query_embedding, cache_key)
+        if cached is not None:
+            return (cached, True) if return_cached else cached
+
+        # Documentation de récupération uniquement (rec_*)
+        context_docs, _ = self.rag.retrieve_context(user_input, domain="rec", query_embedding=query_embedding)
         context_text = "\n".join(context_docs)
-        
-        # Récupération de la configuration depuis prompts.yaml
-        recovery_conf = self.engine.prompts['recovery']
-        scenarios = recovery_conf['scenarios']
-        system_rules = recovery_conf['system_role']
-        few_shots = recovery_conf.get('few_shot', "")
-        
-        # Construction des instructions dynamiques
-        full_instructions = f"{system_rules}\n\nEXEMPLES DE CAS (FEW-SHOT) :\n{few_shots}\n"
-        full_instructions += "\nINSTRUCTIONS PAR SCÉNARIO :\n"
-        for k, v in scenarios.items():
-            full_instructions += f"- {v['instruction']}\n"
 
         # Prompt final combinant Instructions + RAG + Question User
-        prompt_final = f"{full_instructions}\n\nCONTEXTE RAG (Documentation Oracle) :\n{context_text}\n\nUSER DBA : {user_input}"
+        prompt_final = f"{self.instructions[scenario]}\n\nCONTEXTE RAG (Documentation Oracle) :\n{context_text}\n\nUSER DBA : {user_input}"
         
         # Génération de la réponse
         response = self.engine.generate(prompt_final)
+        if not response.startswith("❌ Erreur"):
+            self.answer_cache.store(query_embedding, cache_key, response)
         
-        return response
+        return (response, False) if return_cached else response
 
 if __name__ == "__main__":
     assistant = RecoveryAssistant()
@@ -50,6 +111,7 @@ if __name__ == "__main__":
         try:
             user_msg = input("\n👤 DBA : ")
             if user_msg.lower() in ['exit', 'quit']: break
-            print(f"🤖 Assistant : {assistant.chat(user_msg)}")
+            reply, cached = assistant.chat(user_msg, return_cached=True)
+            print(f"🤖 Assistant{' (cache)' if cached else ''} : {reply}")
         except KeyboardInterrupt:
             break
\ No newline at end of file
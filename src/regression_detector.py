@@ -0,0 +1,221 @@
+import argparse
+import os
+import sys
+import warnings
+import numpy as np
+from snapshot_store import SnapshotStore, SNAPSHOT_SOURCES
+from fleet import selected_target, target_data_dir
+import metrics
+
+# Intervalles de référence (ligne de base glissante) et intervalles récents évalués
+BASELINE_INTERVALS = int(os.getenv("REGRESSION_BASELINE_INTERVALS", "24"))
+RECENT_INTERVALS = int(os.getenv("REGRESSION_RECENT_INTERVALS", "3"))
+# Intervalles avec exécutions requis dans la ligne de base pour juger un SQL_ID
+MIN_BASELINE_POINTS = int(os.getenv("REGRESSION_MIN_BASELINE_POINTS", "5"))
+# Score robuste (écart à la médiane / MAD) et rapport récent / médiane à dépasser
+THRESHOLD = float(os.getenv("REGRESSION_THRESHOLD", "4"))
+MIN_RATIO = float(os.getenv("REGRESSION_MIN_RATIO", "1.5"))
+
+# Indicateur par exécution -> compteur cumulé de V$SQL
+PER_EXECUTION = {
+    "elapsed_per_exec": "ELAPSED_TIME",
+    "buffer_gets_per_exec": "BUFFER_GETS",
+    "disk_reads_per_exec": "DISK_READS",
+}
+# MAD -> écart-type d'une loi normale ; plancher relatif pour les séries quasi constantes
+MAD_SCALE = 1.4826
+MIN_RELATIVE_SPREAD = 0.05
+# Plancher absolu de dispersion par indicateur (ligne de base nulle : une hausse négligeable
+# comme 0 -> 0.15 lecture disque par exécution n'est pas une régression)
+MIN_ABSOLUTE_SPREAD = {
+    "elapsed_per_exec": 1000.0,  # µs
+    "buffer_gets_per_exec": 10.0,
+    "disk_reads_per_exec": 1.0,
+}
+
+REGRESSIONS_FOUND = metrics.gauge("sql_regressions_detected", "SQL_ID en régression lors de la dernière détection")
+DETECTION_DURATION = metrics.histogram("sql_regression_detection_seconds", "Durée d'une détection de régressions")
+
+
+def _last_valid(values):
+    """Dernière valeur non NaN le long de l'axe 0 (T, K) -> (K,), NaN si aucune."""
+    valid = ~np.isnan(values)
+    if not len(values):
+        return np.full(values.shape[1:], np.nan)
+    last = values.shape[0] - 1 - np.argmax(valid[::-1], axis=0)
+    picked = np.take_along_axis(values, last[None, :], axis=0)[0]
+    return np.where(valid.any(axis=0), picked, np.nan)
+
+
+def detect_regressions(matrices, baseline_intervals=BASELINE_INTERVALS, recent_intervals=RECENT_INTERVALS,
+                       min_points=MIN_BASELINE_POINTS, threshold=THRESHOLD, min_ratio=MIN_RATIO):
+    """
+    Régressions de performance sur les matrices de SnapshotStore.matrices("sql"), vectorisé sur
+    tous les SQL_ID : pour chaque indicateur par exécution, la ligne de base est la médiane (et la
+    MAD) des `baseline_intervals` intervalles précédant les `recent_intervals` derniers, comparée
+    à la moyenne pondérée par les exécutions de la période récente.
+    Retourne la liste des régressions, triée par temps écoulé supplémentaire décroissant.
+    """
+    deltas, counters = matrices["deltas"], matrices["counters"]
+    if deltas.shape[0] <= recent_intervals or not deltas.shape[1]:
+        return []
+    window = deltas[-(baseline_intervals + recent_intervals):]
+    base, recent = window[:-recent_intervals], window[-recent_intervals:]
+    executions = counters.index("EXECUTIONS")
+    columns = [counters.index(c) for c in PER_EXECUTION.values()]
+
+    # Ligne de base : un point par intervalle avec exécutions (T, K, indicateurs)
+    base_execs = base[:, :, executions]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        base_per_exec = np.where((base_execs > 0)[:, :, None], base[:, :, columns] / base_execs[:, :, None], np.nan)
+    points = np.sum(base_execs > 0, axis=0)
+    with warnings.catch_warnings():
+        # SQL_ID sans exécution dans la ligne de base : médiane NaN, écartés plus bas
+        warnings.simplefilter("ignore", RuntimeWarning)
+        median = np.nanmedian(base_per_exec, axis=0)
+        mad = np.nanmedian(np.abs(base_per_exec - median[None]), axis=0)
+    floor = np.array([MIN_ABSOLUTE_SPREAD[m] for m in PER_EXECUTION])
+    spread = np.maximum(np.maximum(MAD_SCALE * mad, MIN_RELATIVE_SPREAD * median), floor[None, :])
+
+    # Période récente : total des écarts / total des exécutions
+    recent_execs = np.nansum(np.where(recent[:, :, executions] > 0, recent[:, :, executions], 0), axis=0)
+    recent_totals = np.nansum(np.where((recent[:, :, executions] > 0)[:, :, None], recent[:, :, columns], 0), axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        recent_per_exec = np.where((recent_execs > 0)[:, None], recent_totals / recent_execs[:, None], np.nan)
+        score = (recent_per_exec - median) / spread
+        # Rapport indéfini (None) pour une ligne de base nulle : seul le score (plancher absolu) décide
+        ratio = np.where(median > 0, recent_per_exec / median, np.nan)
+
+    judged = (points >= min_points) & (recent_execs > 0)
+    flagged = judged[:, None] & (score >= threshold) & ((ratio >= min_ratio) | (median == 0))
+    regressed = flagged.any(axis=1)
+
+    # Changement de plan : plan en fin de période récente différent du dernier plan de la ligne de base
+    plan_before = plan_now = plan_changed = None
+    if matrices["attribute"] is not None:
+        attribute = matrices["attribute"][-(baseline_intervals + recent_intervals):]
+        plan_before = _last_valid(attribute[:-recent_intervals])
+        plan_now = _last_valid(attribute[-recent_intervals:])
+        plan_changed = ~np.isnan(plan_before) & ~np.isnan(plan_now) & (plan_before != plan_now)
+
+    # Impact : temps écoulé supplémentaire (µs dans V$SQL) sur les exécutions récentes
+    elapsed = list(PER_EXECUTION).index("elapsed_per_exec")
+    extra = np.nan_to_num((recent_per_exec[:, elapsed] - median[:, elapsed]) * recent_execs)
+
+    keys = matrices["keys"]
+    found = []
+    for k in np.flatnonzero(regressed)[np.argsort(-extra[regressed], kind="stable")]:
+        entry = {
+            "sql_id": keys[k],
+            # Début de la période récente (fin du dernier intervalle de la ligne de base)
+            "since": matrices["ends"][-recent_intervals - 1],
+            "executions": float(recent_execs[k]),
+            "extra_elapsed_s": round(float(extra[k]) / 1e6, 3),
+            "regressed_metrics": [m for j, m in enumerate(PER_EXECUTION) if flagged[k, j]],
+            "metrics": {
+                m: {"baseline": _round(median[k, j]), "recent": _round(recent_per_exec[k, j]),
+                    "ratio": _round(ratio[k, j]), "score": _round(score[k, j])}
+                for j, m in enumerate(PER_EXECUTION)
+            },
+            "plan_changed": bool(plan_changed[k]) if plan_changed is not None else None,
+        }
+        if plan_changed is not None:
+            entry["previous_plan"] = None if np.isnan(plan_before[k]) else int(plan_before[k])
+            entry["current_plan"] = None if np.isnan(plan_now[k]) else int(plan_now[k])
+        found.append(entry)
+    return found
+
+
+def _round(value):
+    return None if not np.isfinite(value) else round(float(value), 3)
+
+
+class RegressionDetector:
+    def __init__(self, data_dir="datav1", store=None):
+        # Dossier de la base analysée (datav1/ ou datav1/targets/<nom>/ en mode flotte)
+        self.data_dir = data_dir
+        self.store = store or SnapshotStore(data_dir)
+
+    def detect(self, limit=None, end=None, **options):
+        """
+        Régressions des SQL_ID d'après les derniers snapshots (seuls les intervalles utiles sont lus),
+        triées par impact ; chaque entrée porte le libellé SQL. limit : nombre maximal d'entrées.
+        """
+        with DETECTION_DURATION.time():
+            baseline = options.get("baseline_intervals", BASELINE_INTERVALS)
+            recent = options.get("recent_intervals", RECENT_INTERVALS)
+            matrices = self.store.matrices("sql", end=end, last=baseline + recent)
+            found = detect_regressions(matrices, **options)
+        REGRESSIONS_FOUND.set(len(found))
+        found = found[:limit] if limit else found
+        labels = self.store.labels("sql", [r["sql_id"] for r in found])
+        for entry in found:
+            entry["sql_text"] = labels.get(entry["sql_id"])
+        return found
+
+
+def format_regression(entry):
+    """Résumé d'une régression pour les prompts (contexte de l'optimiseur)."""
+    parts = []
+    for m in entry["regressed_metrics"]:
+        values = entry["metrics"][m]
+        factor = f"x{values['ratio']}" if values["ratio"] is not None else "ligne de base nulle"
+        parts.append(f"{m} {factor} ({values['baseline']} -> {values['recent']})")
+    text = f"Régression depuis {entry['since']} : {', '.join(parts)}"
+    if entry.get("plan_changed"):
+        text += f" ; changement de plan {entry['previous_plan']} -> {entry['current_plan']}"
+    return text + "."
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Détection des régressions de performance SQL (snapshots V$SQL)")
+    parser.add_argument("--data-dir", help="Dossier des snapshots (défaut : datav1/)")
+    parser.add_argument("--target", help="Base de la flotte (dossier datav1/targets/<nom>/)")
+    parser.add_argument("--end", help="Fin de la période évaluée (AAAA-MM-JJ HH:MM:SS, défaut : dernier snapshot)")
+    parser.add_argument("--limit", type=int, default=20, help="Nombre de régressions affichées")
+    parser.add_argument("--validate", action="store_true", help="Test de validation sur des séries synthétiques")
+    return parser.parse_args(argv)
+
+
+def validate():
+    """
+    Test de validation sur des séries synthétiques (30 intervalles, 100 exécutions chacun) :
+    ligne de base nulle en lectures disque, hausse négligeable (0 -> 0.15/exéc) ignorée,
+    hausse réelle (0 -> 50/exéc) détectée, série stable ignorée. Retourne True si réussi.
+    """
+    counters = SNAPSHOT_SOURCES["sql"]["counters"]
+    deltas = np.zeros((30, 3, len(counters)))
+    deltas[:, :, counters.index("EXECUTIONS")] = 100
+    deltas[:, :, counters.index("ELAPSED_TIME")] = 100 * 2000.0
+    deltas[:, :, counters.index("BUFFER_GETS")] = 100 * 50.0
+    deltas[-3:, 0, counters.index("DISK_READS")] = 15   # 0.15 lecture disque par exécution
+    deltas[-3:, 1, counters.index("DISK_READS")] = 5000  # 50 lectures disque par exécution
+    matrices = {"keys": ["NEGLIGEABLE", "REGRESSION", "STABLE"], "ends": [str(t) for t in range(30)],
+                "counters": counters, "deltas": deltas, "attribute": None}
+    found = {r["sql_id"]: r for r in detect_regressions(matrices)}
+    ok = set(found) == {"REGRESSION"} and found["REGRESSION"]["regressed_metrics"] == ["disk_reads_per_exec"] \
+        and np.isfinite(found["REGRESSION"]["metrics"]["disk_reads_per_exec"]["score"] or np.nan)
+    print(f"🔍 Régressions détectées : {sorted(found)}")
+    print("✅ TEST RÉUSSI : ligne de base nulle traitée par le plancher absolu." if ok
+          else "❌ TEST ÉCHOUÉ : détection incorrecte sur ligne de base nulle.")
+    return ok
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.validate:
+        sys.exit(0 if validate() else 1)
+    data_dir = args.data_dir or target_data_dir(args.target or selected_target([]))
+    try:
+        regressions = RegressionDetector(data_dir).detect(limit=args.limit, end=args.end)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    print("\n--- RÉGRESSIONS DE PERFORMANCE SQL ---")
+    if not regressions:
+        print("✅ Aucune régression détectée.")
+    for r in regressions:
+        plan = " 🔀 plan modifié" if r["plan_changed"] else ""
+        print(f"⚠️ {r['sql_id']:<16} +{r['extra_elapsed_s']:>10.1f} s  {', '.join(r['regressed_metrics'])}{plan}")
+        print(f"   {format_regression(r)}  {(r['sql_text'] or '')[:80]}")
@@ -0,0 +1,90 @@
+import os
+import json
+import threading
+import metrics
+
+CACHE_REQUESTS = metrics.counter("cache_requests_total", "Accès au cache de résultats", ("cache", "result"))
+
+
+class ResultCache:
+    """
+    Cache mémoire (niveau processus) des fichiers de résultats de datav1/.
+    Chaque entrée est revalidée par un simple os.stat (mtime + taille) :
+    le fichier n'est relu et re-parsé que s'il a changé sur le disque.
+    Les objets retournés sont partagés entre les requêtes : ne pas les modifier.
+    """
+
+    def __init__(self):
+        self._files = {}    # chemin -> (signature, contenu parsé)
+        self._derived = {}  # clé -> (signatures des sources, valeur calculée)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def signature(path):
+        """Signature légère d'un fichier, None s'il n'existe pas."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _get(self, path, reader):
+        sig = self.signature(path)
+        if sig is None:
+            return None
+        with self._lock:
+            entry = self._files.get(path)
+            if entry and entry[0] == sig:
+                CACHE_REQUESTS.inc(cache="files", result="hit")
+                return entry[1]
+        CACHE_REQUESTS.inc(cache="files", result="miss")
+        try:
+            value = reader(path)
+        except (OSError, ValueError):
+            value = None
+        with self._lock:
+            self._files[path] = (sig, value)
+        return value
+
+    def load_json(self, path):
+        """Retourne le JSON parsé de `path` (None si absent ou invalide)."""
+        def reader(p):
+            with open(p, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return self._get(path, reader)
+
+    def load_text(self, path):
+        """Retourne le contenu texte de `path` (None si absent)."""
+        def reader(p):
+            with open(p, 'r', encoding='utf-8') as f:
+                return f.read()
+        return self._get(path, reader)
+
+    def derived(self, key, paths, builder):
+        """
+        Valeur calculée à partir de plusieurs fichiers (résumé dashboard, contexte chatbot...).
+        `builder` n'est rappelé que si la signature d'au moins une source a changé.
+        """
+        return self.derived_from(key, tuple(self.signature(p) for p in paths), builder)
+
+    def derived_from(self, key, versions, builder):
+        """
+        Variante de derived() pour des sources non fichiers : `versions` est un tuple comparable
+        (ex : ids des dernières versions du store de résultats) qui change avec les données.
+        """
+        sigs = tuple(versions)
+        with self._lock:
+            entry = self._derived.get(key)
+            if entry and entry[0] == sigs:
+                CACHE_REQUESTS.inc(cache=key, result="hit")
+                return entry[1]
+        CACHE_REQUESTS.inc(cache=key, result="miss")
+        value = builder()
+        with self._lock:
+            self._derived[key] = (sigs, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._files.clear()
+            self._derived.clear()
@@ -0,0 +1,378 @@
+import os
+import re
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+# Agent -> fichier JSON historique (même forme qu'avant le store, pour le pipeline et les outils externes)
+EXPORT_FILES = {
+    "security": "last_audit.json",
+    "optimizer": "query_analysis.json",
+    "anomaly": "detected_anomalies.json",
+    "backup": "backup_plan.json",
+}
+# Pièce jointe texte exportée à côté du JSON (script RMAN du plan de sauvegarde)
+ARTIFACT_FILES = {
+    "backup": "backup_script.rman",
+}
+
+
+def parse_gain(value):
+    """'60%' / '≈ 35 %' / 40 -> 60.0 / 35.0 / 40.0 ; None si aucun nombre."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.search(r"-?\d+(?:[.,]\d+)?", str(value or ""))
+    return float(match.group(0).replace(",", ".")) if match else None
+
+
+def atomic_write(path, content):
+    """Écrit un fichier via un temporaire + os.replace : un lecteur ne voit jamais de fichier tronqué."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class ResultStore:
+    """
+    Stockage transactionnel des résultats des agents (SQLite, mode WAL).
+    - Chaque exécution d'un agent crée une version (run) écrite en une seule transaction :
+      document complet (forme JSON d'origine) + lignes indexées (anomalies, requêtes, risques).
+    - Les lecteurs concurrents ne voient que des versions complètes ; la dernière version
+      d'un agent est une simple recherche d'index, et son document parsé est gardé en mémoire.
+    - L'historique des versions est conservé (graphes de tendance) ; export_json() régénère
+      les fichiers datav1/*.json historiques.
+    """
+
+    DB_FILE = "results.sqlite3"
+
+    def __init__(self, data_dir="datav1"):
+        self.data_dir = data_dir
+        os.makedirs(self.data_dir, exist_ok=True)
+        self.db_path = os.path.join(self.data_dir, self.DB_FILE)
+        self._local = threading.local()
+        self._latest = {}  # agent -> (run_id, document parsé)
+        self._latest_lock = threading.Lock()
+        self._init_db()
+
+    # --- BASE SQLITE ---
+
+    def _conn(self):
+        """Une connexion par thread ; isolation_level=None : transactions explicites (BEGIN IMMEDIATE)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                agent TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                artifact TEXT,
+                summary TEXT NOT NULL DEFAULT '{}'
+            );
+            CREATE INDEX IF NOT EXISTS idx_runs_agent ON runs(agent, id DESC);
+
+            CREATE TABLE IF NOT EXISTS anomalies (
+                run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+                position INTEGER NOT NULL,
+                timestamp TEXT,
+                classification TEXT,
+                severite INTEGER,
+                justification TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_anomalies_class ON anomalies(run_id, classification);
+
+            CREATE TABLE IF NOT EXISTS query_analyses (
+                run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+                position INTEGER NOT NULL,
+                sql_id TEXT,
+                gain REAL,
+                gain_text TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_queries_gain ON query_analyses(run_id, gain DESC);
+            CREATE INDEX IF NOT EXISTS idx_queries_sql ON query_analyses(sql_id, run_id);
+
+            CREATE TABLE IF NOT EXISTS audit_risks (
+                run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+                position INTEGER NOT NULL,
+                nom TEXT,
+                severite TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_risks_sev ON audit_risks(run_id, severite);
+        """)
+        # Migration : première ouverture sur un datav1/ contenant déjà des résultats JSON
+        if conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0] == 0:
+            self.import_legacy()
+
+    # --- ÉCRITURE ---
+
+    @staticmethod
+    def _summarize(agent, payload):
+        """Indicateurs par version, lus par history() sans re-parser les documents."""
+        if agent == "security" and isinstance(payload, dict):
+            return {"score": payload.get("score"), "risques": len(payload.get("risques", []))}
+        if agent == "anomaly" and isinstance(payload, list):
+            counts = {}
+            for a in payload:
+                counts[a.get("classification", "INCONNU")] = counts.get(a.get("classification", "INCONNU"), 0) + 1
+            return {"total": len(payload), "par_classification": counts}
+        if agent == "optimizer" and isinstance(payload, list):
+            gains = [g for g in (parse_gain(q.get("gain_estime")) for q in payload) if g is not None]
+            return {"requetes": len(payload), "gain_moyen": round(sum(gains) / len(gains), 1) if gains else None}
+        if agent == "backup" and isinstance(payload, dict):
+            return {"type": payload.get("type"), "retention_jours": payload.get("retention_jours")}
+        return {}
+
+    @staticmethod
+    def _index_rows(conn, agent, run_id, payload):
+        if agent == "anomaly" and isinstance(payload, list):
+            conn.executemany(
+                "INSERT INTO anomalies VALUES (?, ?, ?, ?, ?, ?)",
+                [(run_id, i, a.get("timestamp"), a.get("classification"), a.get("severite"), a.get("justification"))
+                 for i, a in enumerate(payload) if isinstance(a, dict)]
+            )
+        elif agent == "optimizer" and isinstance(payload, list):
+            conn.executemany(
+                "INSERT INTO query_analyses VALUES (?, ?, ?, ?, ?)",
+                [(run_id, i, q.get("sql_id"), parse_gain(q.get("gain_estime")), q.get("gain_estime"))
+                 for i, q in enumerate(payload) if isinstance(q, dict)]
+            )
+        elif agent == "security" and isinstance(payload, dict):
+            conn.executemany(
+                "INSERT INTO audit_risks VALUES (?, ?, ?, ?)",
+                [(run_id, i, r.get("nom"), r.get("severite"))
+                 for i, r in enumerate(payload.get("risques", [])) if isinstance(r, dict)]
+            )
+
+    def save_run(self, agent, payload, artifact=None):
+        """Enregistre une nouvelle version (document + lignes indexées) de manière atomique ; retourne son id."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = conn.execute(
+                "INSERT INTO runs (agent, created_at, payload, artifact, summary) VALUES (?, ?, ?, ?, ?)",
+                (agent, datetime.now().isoformat(), json.dumps(payload, ensure_ascii=False), artifact,
+                 json.dumps(self._summarize(agent, payload), ensure_ascii=False))
+            )
+            run_id = cur.lastrowid
+            self._index_rows(conn, agent, run_id, payload)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        with self._latest_lock:
+            self._latest[agent] = (run_id, payload)
+        return run_id
+
+    def publish(self, agent, payload, artifact=None):
+        """Enregistre la version puis régénère le fichier JSON historique ; retourne les chemins exportés."""
+        self.save_run(agent, payload, artifact)
+        return self.export_json(agent)
+
+    # --- LECTURE ---
+
+    def latest_run_id(self, agent):
+        row = self._conn().execute(
+            "SELECT id FROM runs WHERE agent = ? ORDER BY id DESC LIMIT 1", (agent,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def latest_versions(self, agents):
+        """Id de la dernière version de chaque agent (clé de cache des vues dérivées)."""
+        rows = dict(self._conn().execute("SELECT agent, MAX(id) FROM runs GROUP BY agent").fetchall())
+        return tuple(rows.get(agent) for agent in agents)
+
+    def latest(self, agent):
+        """Document de la dernière version (forme JSON d'origine), None si l'agent n'a jamais tourné."""
+        run_id = self.latest_run_id(agent)
+        if run_id is None:
+            return None
+        with self._latest_lock:
+            cached = self._latest.get(agent)
+            if cached and cached[0] == run_id:
+                return cached[1]
+        payload = self.get_run(run_id)["payload"]
+        with self._latest_lock:
+            self._latest[agent] = (run_id, payload)
+        return payload
+
+    def get_run(self, run_id):
+        row = self._conn().execute(
+            "SELECT id, agent, created_at, payload, artifact, summary FROM runs WHERE id = ?", (run_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"id": row[0], "agent": row[1], "created_at": row[2], "payload": json.loads(row[3]),
+                "artifact": row[4], "summary": json.loads(row[5])}
+
+    def latest_artifact(self, agent):
+        row = self._conn().execute(
+            "SELECT artifact FROM runs WHERE agent = ? ORDER BY id DESC LIMIT 1", (agent,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def history(self, agent, limit=50):
+        """Versions récentes (plus récente en premier) : id, date et indicateurs, sans les documents."""
+        rows = self._conn().execute(
+            "SELECT id, created_at, summary FROM runs WHERE agent = ? ORDER BY id DESC LIMIT ?", (agent, limit)
+        ).fetchall()
+        return [{"run_id": r[0], "created_at": r[1], **json.loads(r[2])} for r in rows]
+
+    def _resolve_run(self, agent, run_id):
+        return run_id if run_id is not None else self.latest_run_id(agent)
+
+    @staticmethod
+    def _anomaly_filter(run_id, classifications=None, min_severity=None):
+        sql = " FROM anomalies WHERE run_id = ?"
+        params = [run_id]
+        if classifications:
+            sql += f" AND classification IN ({', '.join('?' * len(classifications))})"
+            params.extend(classifications)
+        if min_severity is not None:
+            sql += " AND severite >= ?"
+            params.append(min_severity)
+        return sql, params
+
+    def anomalies(self, classifications=None, run_id=None, min_severity=None, limit=None, offset=0):
+        """Anomalies d'une version (défaut : la dernière), filtrées par classification / sévérité ; limit/offset : pagination."""
+        run_id = self._resolve_run("anomaly", run_id)
+        if run_id is None:
+            return []
+        where, params = self._anomaly_filter(run_id, classifications, min_severity)
+        sql = "SELECT timestamp, classification, severite, justification" + where + " ORDER BY position"
+        if limit:
+            sql += " LIMIT ? OFFSET ?"
+            params.extend([limit, offset])
+        rows = self._conn().execute(sql, params).fetchall()
+        return [{"timestamp": r[0], "classification": r[1], "severite": r[2], "justification": r[3]} for r in rows]
+
+    def count_anomalies(self, classifications=None, run_id=None, min_severity=None):
+        run_id = self._resolve_run("anomaly", run_id)
+        if run_id is None:
+            return 0
+        where, params = self._anomaly_filter(run_id, classifications, min_severity)
+        return self._conn().execute("SELECT COUNT(*)" + where, params).fetchone()[0]
+
+    # Tranches des graphes temporels : préfixe de timestamp "AAAA-MM-JJ HH:MM:SS"
+    TIME_BUCKETS = {"hour": 13, "day": 10}
+
+    def anomaly_summary(self, run_id=None, bucket="hour"):
+        """
+        Agrégats d'une version pour les graphes, calculés en SQL : nombre d'anomalies par
+        classification, par sévérité et par tranche de temps (bucket : "hour" ou "day").
+        """
+        run_id = self._resolve_run("anomaly", run_id)
+        summary = {"run_id": run_id, "total": 0, "par_classification": {}, "par_severite": {}, "par_periode": []}
+        if run_id is None:
+            return summary
+        conn = self._conn()
+        summary["par_classification"] = dict(conn.execute(
+            "SELECT COALESCE(classification, 'INCONNU'), COUNT(*) FROM anomalies WHERE run_id = ? GROUP BY 1",
+            (run_id,)
+        ).fetchall())
+        summary["par_severite"] = {str(k): v for k, v in conn.execute(
+            "SELECT severite, COUNT(*) FROM anomalies WHERE run_id = ? AND severite IS NOT NULL GROUP BY 1 ORDER BY 1",
+            (run_id,)
+        )}
+        summary["par_periode"] = [
+            {"periode": r[0], "total": r[1], "critiques": r[2]}
+            for r in conn.execute(
+                "SELECT SUBSTR(timestamp, 1, ?), COUNT(*), SUM(classification = 'CRITIQUE') FROM anomalies "
+                "WHERE run_id = ? AND timestamp IS NOT NULL GROUP BY 1 ORDER BY 1",
+                (self.TIME_BUCKETS[bucket], run_id)
+            )
+        ]
+        summary["total"] = sum(summary["par_classification"].values())
+        return summary
+
+    def queries_by_gain(self, min_gain=None, limit=None, run_id=None, offset=0):
+        """Requêtes analysées d'une version, triées par gain estimé décroissant."""
+        run_id = self._resolve_run("optimizer", run_id)
+        if run_id is None:
+            return []
+        sql = "SELECT sql_id, gain, gain_text FROM query_analyses WHERE run_id = ?"
+        params = [run_id]
+        if min_gain is not None:
+            sql += " AND gain >= ?"
+            params.append(min_gain)
+        sql += " ORDER BY gain IS NULL, gain DESC, position"
+        if limit:
+            sql += " LIMIT ? OFFSET ?"
+            params.extend([limit, offset])
+        return [{"sql_id": r[0], "gain": r[1], "gain_estime": r[2]} for r in self._conn().execute(sql, params)]
+
+    def query_stats(self, run_id=None):
+        """Nombre de requêtes analysées et gain moyen d'une version."""
+        run_id = self._resolve_run("optimizer", run_id)
+        if run_id is None:
+            return {"run_id": None, "total": 0, "gain_moyen": None}
+        total, mean = self._conn().execute(
+            "SELECT COUNT(*), AVG(gain) FROM query_analyses WHERE run_id = ?", (run_id,)
+        ).fetchone()
+        return {"run_id": run_id, "total": total, "gain_moyen": round(mean, 1) if mean is not None else None}
+
+    def audit_risks(self, severites=None, run_id=None):
+        run_id = self._resolve_run("security", run_id)
+        if run_id is None:
+            return []
+        sql = "SELECT nom, severite FROM audit_risks WHERE run_id = ?"
+        params = [run_id]
+        if severites:
+            sql += f" AND severite IN ({', '.join('?' * len(severites))})"
+            params.extend(severites)
+        return [{"nom": r[0], "severite": r[1]} for r in self._conn().execute(sql + " ORDER BY position", params)]
+
+    # --- EXPORT / MIGRATION ---
+
+    def export_json(self, agent, run_id=None, output_dir=None):
+        """Écrit (atomiquement) la version demandée au format des fichiers historiques ; retourne les chemins."""
+        run = self.get_run(self._resolve_run(agent, run_id) or -1)
+        if run is None:
+            return []
+        output_dir = output_dir or self.data_dir
+        os.makedirs(output_dir, exist_ok=True)
+        paths = []
+        if agent in EXPORT_FILES:
+            path = os.path.join(output_dir, EXPORT_FILES[agent])
+            atomic_write(path, json.dumps(run["payload"], indent=4, ensure_ascii=False))
+            paths.append(path)
+        if agent in ARTIFACT_FILES and run["artifact"] is not None:
+            path = os.path.join(output_dir, ARTIFACT_FILES[agent])
+            atomic_write(path, run["artifact"])
+            paths.append(path)
+        return paths
+
+    def import_legacy(self):
+        """Importe les fichiers JSON existants comme première version de chaque agent."""
+        imported = 0
+        for agent, filename in EXPORT_FILES.items():
+            if self.latest_run_id(agent) is not None:
+                continue
+            path = os.path.join(self.data_dir, filename)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    payload = json.load(f)
+            except (OSError, ValueError):
+                continue
+            artifact = None
+            if agent in ARTIFACT_FILES:
+                try:
+                    with open(os.path.join(self.data_dir, ARTIFACT_FILES[agent]), "r", encoding="utf-8") as f:
+                        artifact = f.read()
+                except OSError:
+                    pass
+            self.save_run(agent, payload, artifact)
+            imported += 1
+        return imported
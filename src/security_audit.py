@@ -3,13 +3,22 @@ import json
 import os
 from llm_engine import LLMEngine
 from rag_setup import OracleRAG
+from result_store import ResultStore
+from fleet import selected_target, target_data_dir
+from llm_scheduler import raise_if_cancelled
+import metrics
+import profiling
 
 class SecurityAuditor:
-    def __init__(self):
+    def __init__(self, data_dir="datav1"):
         """Initialisation des moteurs IA et RAG"""
         self.engine = LLMEngine() 
         self.rag = OracleRAG()     
+        # Dossier de la base auditée (datav1/ ou datav1/targets/<nom>/ en mode flotte)
+        self.data_dir = data_dir
 
+    @metrics.track_agent("security")
+    @profiling.profiled("run_audit")
     def run_audit(self):
         """
         Exécute l'audit de sécurité complet en agrégeant les fichiers CSV
@@ -17,9 +26,9 @@ class SecurityAuditor:
         """
         # Liste des fichiers extraits par le Module 1
         security_files = [
-            "datav1/dba_users.csv", 
-            "datav1/dba_roles.csv", 
-            "datav1/dba_sys_privs.csv"
+            os.path.join(self.data_dir, "dba_users.csv"),
+            os.path.join(self.data_dir, "dba_roles.csv"),
+            os.path.join(self.data_dir, "dba_sys_privs.csv")
         ]
         
         all_config_text = ""
@@ -35,16 +44,17 @@ class SecurityAuditor:
                 found_files += 1
         
         if found_files == 0:
-            return {"error": "Aucun fichier de configuration (users, roles, privs) trouvé dans datav1/."}
+            return {"error": f"Aucun fichier de configuration (users, roles, privs) trouvé dans {self.data_dir}/."}
 
         # 2. Récupération du contexte via le RAG (Top-5 docs)
         # Recherche basée sur les thèmes du Module 4
-        context_docs, _ = self.rag.retrieve_context("privilèges excessifs, sécurité des mots de passe, audit rôles")
+        context_docs, _ = self.rag.retrieve_context("privilèges excessifs, sécurité des mots de passe, audit rôles", domain="sec")
         context_text = "\n".join(context_docs)
         
         # 3. Génération du rapport via LLM
         print(f"🕵️ Analyse de {found_files} fichiers de sécurité en cours...")
         report_raw = self.engine.assess_security(all_config_text, context_text)
+        raise_if_cancelled()
         
         # 4. Conversion et validation du rapport JSON
         try:
@@ -53,9 +63,8 @@ class SecurityAuditor:
             report_data = json.loads(clean_json)
             
             # Sauvegarde pour le Dashboard final (Module 9)
-            os.makedirs("datav1", exist_ok=True)
-            with open("datav1/last_audit.json", "w", encoding='utf-8') as f:
-                json.dump(report_data, f, indent=4, ensure_ascii=False)
+            os.makedirs(self.data_dir, exist_ok=True)
+            ResultStore(self.data_dir).publish("security", report_data)
                 
             return report_data
         except Exception as e:
@@ -63,7 +72,7 @@ class SecurityAuditor:
             return {"raw_report": report_raw}
 
 if __name__ == "__main__":
-    auditor = SecurityAuditor()
+    auditor = SecurityAuditor(data_dir=target_data_dir(selected_target()))
     print("\n🛡️  LANCEMENT DE L'AUDIT DE SÉCURITÉ AUTOMATISÉ")
     
     # Exécution de l'audit multi-fichiers
@@ -0,0 +1,432 @@
+import os
+import sys
+import zlib
+import sqlite3
+import argparse
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+# Compteurs cumulés (depuis le démarrage de l'instance ou le chargement du curseur) par source.
+# complete : l'extraction liste toutes les clés (une clé absente du snapshot précédent y valait 0) ;
+# load_time : colonne de chargement du curseur (un curseur rechargé repart de zéro).
+SNAPSHOT_SOURCES = {
+    "sql": {
+        "file": "performance_metrics.csv",
+        "key": "SQL_ID",
+        "counters": ["ELAPSED_TIME", "CPU_TIME", "EXECUTIONS", "DISK_READS", "BUFFER_GETS"],
+        "label": "SQL_TEXT",
+        "load_time": "FIRST_LOAD_TIME",
+        # Plan du curseur enfant le plus exécuté (détection des changements de plan)
+        "attribute": "PLAN_HASH_VALUE",
+        "attribute_weight": "EXECUTIONS",
+        "complete": False,
+    },
+    "event": {
+        "file": "system_events.csv",
+        "key": "EVENT",
+        "counters": ["TOTAL_WAITS", "TIME_WAITED"],
+        "label": None,
+        "load_time": None,
+        "attribute": None,
+        "complete": True,
+    },
+}
+# Rétention des snapshots (jours), comme la rétention AWR ; appliquée à chaque capture (0 = illimitée)
+DEFAULT_RETENTION_DAYS = int(os.getenv("SNAPSHOT_RETENTION_DAYS", "35"))
+# Formats de date Oracle rencontrés (V$SQL.FIRST_LOAD_TIME, V$INSTANCE.STARTUP_TIME exporté)
+_TIME_FORMATS = ("%Y-%m-%d/%H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S")
+
+
+def parse_time(value):
+    """'2026-01-13/10:22:01', '2026-01-13 10:22:01' ou ISO -> datetime ; None si illisible."""
+    if isinstance(value, datetime):
+        return value
+    text = str(value or "").strip()
+    for fmt in _TIME_FORMATS:
+        try:
+            return datetime.strptime(text[:19], fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def _epoch(value):
+    parsed = parse_time(value)
+    return parsed.timestamp() if parsed else np.nan
+
+
+def _pack_keys(keys):
+    return zlib.compress("\n".join(keys).encode("utf-8"))
+
+
+def _unpack_keys(blob):
+    text = zlib.decompress(blob).decode("utf-8")
+    return text.split("\n") if text else []
+
+
+def _pack_array(values):
+    return zlib.compress(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+
+
+def _unpack_array(blob, columns):
+    return np.frombuffer(zlib.decompress(blob), dtype=np.float64).reshape(-1, columns)
+
+
+class SnapshotStore:
+    """
+    Snapshots horodatés des compteurs cumulés V$SQL / V$SYSTEM_EVENT (à la manière d'AWR).
+    - Un snapshot = une ligne SQLite : clés (SQL_ID, EVENT) et matrice clés x compteurs en float64,
+      compressées (zlib) ; les libellés (texte SQL) sont stockés une seule fois par clé.
+    - deltas() aligne deux snapshots consécutifs et calcule, par intervalle, l'écart et le débit
+      par seconde de chaque compteur, en tenant compte :
+        * du redémarrage de l'instance (STARTUP_TIME différent) : les compteurs repartent de zéro ;
+        * des curseurs vieillis puis rechargés (compteur en baisse ou chargement postérieur au
+          snapshot précédent) : l'écart vaut la valeur courante ;
+        * des clés absentes du snapshot précédent : sans référence (NaN) si l'extraction est un top-N.
+    """
+
+    DB_FILE = "snapshots.sqlite3"
+
+    def __init__(self, data_dir="datav1"):
+        self.data_dir = data_dir
+        os.makedirs(self.data_dir, exist_ok=True)
+        self.db_path = os.path.join(self.data_dir, self.DB_FILE)
+        self._local = threading.local()
+        self._init_db()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                source TEXT NOT NULL,
+                taken_at TEXT NOT NULL,
+                startup_time TEXT,
+                counters TEXT NOT NULL,
+                keys BLOB NOT NULL,
+                vals BLOB NOT NULL,
+                load_times BLOB,
+                attrs BLOB
+            );
+            CREATE INDEX IF NOT EXISTS idx_snapshots_source ON snapshots(source, taken_at);
+
+            CREATE TABLE IF NOT EXISTS labels (
+                source TEXT NOT NULL,
+                key TEXT NOT NULL,
+                label TEXT,
+                PRIMARY KEY (source, key)
+            );
+        """)
+        columns = [row[1] for row in self._conn().execute("PRAGMA table_info(snapshots)")]
+        if 'attrs' not in columns:
+            self._conn().execute("ALTER TABLE snapshots ADD COLUMN attrs BLOB")
+
+    # --- ÉCRITURE ---
+
+    def add_snapshot(self, source, keys, values, taken_at=None, startup_time=None, load_times=None, labels=None,
+                     attrs=None):
+        """
+        Enregistre un snapshot : keys (n), values (n x compteurs de la source), load_times (n, epoch
+        ou NaN) optionnel, labels {clé: libellé} optionnel, attrs (n) valeur de l'attribut de la
+        source (PLAN_HASH_VALUE) optionnel. Retourne l'id du snapshot.
+        """
+        spec = SNAPSHOT_SOURCES[source]
+        values = np.asarray(values, dtype=np.float64).reshape(len(keys), len(spec["counters"]))
+        taken_at = (taken_at or datetime.now()).replace(microsecond=0)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = conn.execute(
+                "INSERT INTO snapshots (source, taken_at, startup_time, counters, keys, vals, load_times, attrs) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (source, taken_at.isoformat(), startup_time, ",".join(spec["counters"]),
+                 _pack_keys(keys), _pack_array(values),
+                 _pack_array(load_times) if load_times is not None else None,
+                 _pack_array(attrs) if attrs is not None else None)
+            )
+            if labels:
+                conn.executemany("INSERT OR REPLACE INTO labels VALUES (?, ?, ?)",
+                                 [(source, k, v) for k, v in labels.items()])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return cur.lastrowid
+
+    def capture(self, csv_dir=None, taken_at=None, keep_days=DEFAULT_RETENTION_DAYS):
+        """
+        Snapshot des CSV produits par l'extraction (performance_metrics.csv, system_events.csv).
+        Les lignes d'une même clé (curseurs enfants d'un SQL_ID) sont additionnées.
+        Les snapshots de plus de `keep_days` jours sont ensuite supprimés (0 = aucune purge).
+        Retourne {source: id du snapshot}.
+        """
+        csv_dir = csv_dir or self.data_dir
+        startup_time = None
+        info_path = os.path.join(csv_dir, "database_info.csv")
+        if os.path.exists(info_path):
+            info = pd.read_csv(info_path)
+            if 'STARTUP_TIME' in info.columns and len(info):
+                parsed = parse_time(info['STARTUP_TIME'].iloc[0])
+                startup_time = parsed.isoformat() if parsed else None
+
+        captured = {}
+        for source, spec in SNAPSHOT_SOURCES.items():
+            path = os.path.join(csv_dir, spec["file"])
+            if not os.path.exists(path):
+                continue
+            df = pd.read_csv(path)
+            if spec["key"] not in df.columns:
+                continue
+            for col in spec["counters"]:
+                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0) if col in df.columns else 0.0
+            df[spec["key"]] = df[spec["key"]].astype(str)
+            grouped = df.groupby(spec["key"], sort=True)
+            values = grouped[spec["counters"]].sum()
+
+            load_times = None
+            if spec["load_time"] and spec["load_time"] in df.columns:
+                loaded = df[spec["load_time"]].map(_epoch)
+                load_times = loaded.groupby(df[spec["key"]]).max().reindex(values.index).to_numpy()
+            labels = None
+            if spec["label"] and spec["label"] in df.columns:
+                labels = grouped[spec["label"]].first().astype(str).to_dict()
+            attrs = None
+            if spec["attribute"] and spec["attribute"] in df.columns:
+                ordered = df.assign(_attr=pd.to_numeric(df[spec["attribute"]], errors='coerce'))
+                ordered = ordered.sort_values(spec["attribute_weight"], kind="stable")
+                attrs = ordered.groupby(spec["key"])["_attr"].last().reindex(values.index).to_numpy()
+
+            captured[source] = self.add_snapshot(source, list(values.index), values.to_numpy(), taken_at,
+                                                 startup_time, load_times, labels, attrs)
+        if captured:
+            purged = self.purge(keep_days, now=taken_at)
+            if purged:
+                print(f"🧹 {purged} snapshot(s) de plus de {keep_days} jours supprimé(s).")
+        return captured
+
+    def purge(self, keep_days=DEFAULT_RETENTION_DAYS, now=None):
+        """
+        Supprime les snapshots plus anciens que la rétention (comptée depuis `now`, défaut : maintenant) ;
+        retourne le nombre supprimé. keep_days = 0 : rétention illimitée.
+        """
+        if not keep_days:
+            return 0
+        limit = ((now or datetime.now()) - timedelta(days=keep_days)).isoformat()
+        return self._conn().execute("DELETE FROM snapshots WHERE taken_at < ?", (limit,)).rowcount
+
+    # --- LECTURE ---
+
+    def snapshots(self, source, start=None, end=None):
+        """Snapshots d'une source (id, date, démarrage instance, nombre de clés), du plus ancien au plus récent."""
+        rows = self._range_rows(source, start, end, columns="id, taken_at, startup_time, keys")
+        return [{"id": r[0], "taken_at": r[1], "startup_time": r[2], "keys": len(_unpack_keys(r[3]))} for r in rows]
+
+    def _range_rows(self, source, start, end, columns, with_previous=False, last=None):
+        """Snapshots de [start, end] par date croissante ; last : seulement les `last` plus récents."""
+        sql = f"SELECT {columns} FROM snapshots WHERE source = ?"
+        params = [source]
+        if end:
+            sql += " AND taken_at <= ?"
+            params.append(_iso(end))
+        if start:
+            bound = _iso(start)
+            if with_previous:
+                # Le snapshot juste avant `start` sert de référence au premier intervalle
+                previous = self._conn().execute(
+                    "SELECT MAX(taken_at) FROM snapshots WHERE source = ? AND taken_at < ?", (source, bound)
+                ).fetchone()[0]
+                bound = previous or bound
+            sql += " AND taken_at >= ?"
+            params.append(bound)
+        if last:
+            rows = self._conn().execute(sql + " ORDER BY taken_at DESC, id DESC LIMIT ?", params + [last]).fetchall()
+            return rows[::-1]
+        return self._conn().execute(sql + " ORDER BY taken_at, id", params).fetchall()
+
+    def _intervals(self, source, start, end, last=None):
+        """
+        Parcourt les intervalles entre snapshots consécutifs de [start, end] (le snapshot précédent
+        `start` sert de référence) : (début, fin, secondes, clés, écarts, reset, attributs de fin).
+        last : seulement les `last` intervalles les plus récents.
+        """
+        spec = SNAPSHOT_SOURCES[source]
+        counters = spec["counters"]
+        rows = self._range_rows(source, start, end, with_previous=True, last=last + 1 if last else None,
+                                columns="taken_at, startup_time, keys, vals, load_times, attrs")
+        previous = None
+        for taken_at, startup_time, key_blob, val_blob, load_blob, attr_blob in rows:
+            current = (
+                datetime.fromisoformat(taken_at), startup_time, np.array(_unpack_keys(key_blob), dtype=object),
+                _unpack_array(val_blob, len(counters)),
+                np.frombuffer(zlib.decompress(load_blob), dtype=np.float64) if load_blob else None
+            )
+            if previous is not None:
+                seconds, delta, reset = self._interval(previous, current, spec)
+                attrs = np.frombuffer(zlib.decompress(attr_blob), dtype=np.float64) if attr_blob else None
+                yield previous[0], current[0], seconds, current[2], delta, reset, attrs
+            previous = current
+
+    def deltas(self, source, start=None, end=None, keys=None):
+        """
+        Écarts par intervalle entre snapshots consécutifs de [start, end]. DataFrame long : begin, end,
+        seconds, key, <compteur>, <compteur>_per_s, reset (remise à zéro détectée) et, si la source
+        en a un, l'attribut en fin d'intervalle (PLAN_HASH_VALUE). keys : restreint à ces clés.
+        """
+        spec = SNAPSHOT_SOURCES[source]
+        counters = spec["counters"]
+        frames = []
+        for t0, t1, seconds, interval_keys, delta, reset, attrs in self._intervals(source, start, end):
+            frame = pd.DataFrame(delta, columns=counters)
+            rates = frame / seconds
+            rates.columns = [f"{c}_per_s" for c in counters]
+            frame = pd.concat([frame, rates], axis=1)
+            frame.insert(0, "key", interval_keys)
+            frame.insert(0, "seconds", seconds)
+            frame.insert(0, "end", t1.isoformat())
+            frame.insert(0, "begin", t0.isoformat())
+            frame["reset"] = reset
+            if spec["attribute"]:
+                frame[spec["attribute"]] = attrs if attrs is not None else np.nan
+            if keys is not None:
+                frame = frame[frame["key"].isin(keys)]
+            frames.append(frame)
+        if not frames:
+            columns = ["begin", "end", "seconds", "key"] + counters + [f"{c}_per_s" for c in counters] + ["reset"]
+            return pd.DataFrame(columns=columns + ([spec["attribute"]] if spec["attribute"] else []))
+        return pd.concat(frames, ignore_index=True)
+
+    def matrices(self, source, start=None, end=None, last=None):
+        """
+        Écarts alignés pour les calculs vectorisés sur tout l'historique :
+        {"keys": K clés, "ends": T fins d'intervalle, "seconds": (T,), "counters": noms,
+         "deltas": (T, K, compteurs) NaN si la clé est absente ou sans référence,
+         "attribute": (T, K) attribut en fin d'intervalle (PLAN_HASH_VALUE) ou None}.
+        last : seulement les `last` intervalles les plus récents.
+        """
+        spec = SNAPSHOT_SOURCES[source]
+        intervals = list(self._intervals(source, start, end, last))
+        keys = pd.Index(pd.unique(np.concatenate([i[3] for i in intervals]))) if intervals else pd.Index([])
+        deltas = np.full((len(intervals), len(keys), len(spec["counters"])), np.nan)
+        attribute = np.full((len(intervals), len(keys)), np.nan) if spec["attribute"] else None
+        for t, (_, _, _, interval_keys, delta, _, attrs) in enumerate(intervals):
+            cols = keys.get_indexer(interval_keys)
+            deltas[t, cols] = delta
+            if attribute is not None and attrs is not None:
+                attribute[t, cols] = attrs
+        return {
+            "keys": list(keys),
+            "ends": [i[1].isoformat() for i in intervals],
+            "seconds": np.array([i[2] for i in intervals], dtype=np.float64),
+            "counters": list(spec["counters"]),
+            "deltas": deltas,
+            "attribute": attribute,
+        }
+
+    def latest_id(self, source):
+        """Id du dernier snapshot d'une source (clé de cache des vues dérivées), None si aucun."""
+        row = self._conn().execute("SELECT MAX(id) FROM snapshots WHERE source = ?", (source,)).fetchone()
+        return row[0]
+
+    @staticmethod
+    def _interval(previous, current, spec):
+        """Écarts d'un intervalle, alignés sur les clés du snapshot courant : (secondes, écarts, reset)."""
+        t0, startup0, keys0, vals0, _ = previous
+        t1, startup1, keys1, vals1, loads1 = current
+        seconds = max((t1 - t0).total_seconds(), 1.0)
+
+        idx = pd.Index(keys0).get_indexer(keys1)
+        found = idx >= 0
+        before = np.full_like(vals1, np.nan)
+        before[found] = vals0[idx[found]]
+
+        if startup0 and startup1 and startup0 != startup1:
+            # Redémarrage : tous les compteurs repartent de zéro
+            return seconds, vals1.copy(), np.ones(len(keys1), dtype=bool)
+
+        loaded_since = np.zeros(len(keys1), dtype=bool)
+        if loads1 is not None:
+            loaded_since = np.nan_to_num(loads1, nan=-np.inf) > t0.timestamp()
+        decreased = found & (vals1 < before).any(axis=1)
+        reset = (found & loaded_since) | decreased
+        delta = vals1 - before
+        delta[reset] = vals1[reset]
+        # Clé nouvelle : chargée pendant l'intervalle ou extraction exhaustive -> partait de zéro
+        born = ~found & (loaded_since | spec["complete"])
+        delta[born] = vals1[born]
+        return seconds, delta, reset
+
+    def top(self, source, counter, start=None, end=None, n=10):
+        """Clés dont le compteur a le plus progressé sur [start, end] (somme des écarts par intervalle)."""
+        deltas = self.deltas(source, start, end).dropna(subset=[counter])
+        if deltas.empty:
+            return []
+        spec = SNAPSHOT_SOURCES[source]
+        totals = deltas.groupby("key")[spec["counters"]].sum()
+        seconds = deltas.groupby("key")["seconds"].sum()
+        ranked = totals.sort_values(counter, ascending=False).head(n)
+        labels = self.labels(source, list(ranked.index))
+        return [
+            {"key": key, "label": labels.get(key), **{c: float(row[c]) for c in spec["counters"]},
+             f"{counter}_per_s": round(float(row[counter]) / float(seconds[key]), 6)}
+            for key, row in ranked.iterrows()
+        ]
+
+    def series(self, source, key, counter, start=None, end=None):
+        """Série temporelle d'une clé pour les graphes : [{end, delta, rate, reset}]."""
+        deltas = self.deltas(source, start, end, keys=[key])
+        return [
+            {"end": r["end"], "delta": None if pd.isna(r[counter]) else float(r[counter]),
+             "rate": None if pd.isna(r[f"{counter}_per_s"]) else float(r[f"{counter}_per_s"]),
+             "reset": bool(r["reset"])}
+            for _, r in deltas.iterrows()
+        ]
+
+    def labels(self, source, keys):
+        if not keys:
+            return {}
+        rows = self._conn().execute(
+            f"SELECT key, label FROM labels WHERE source = ? AND key IN ({', '.join('?' * len(keys))})",
+            [source, *keys]
+        ).fetchall()
+        return dict(rows)
+
+
+def _iso(value):
+    parsed = parse_time(value)
+    if parsed is None:
+        raise ValueError(f"Date invalide : {value}")
+    return parsed.isoformat()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Snapshots des compteurs V$SQL / V$SYSTEM_EVENT")
+    parser.add_argument("command", choices=["capture", "top", "purge"])
+    parser.add_argument("--data-dir", default="datav1")
+    parser.add_argument("--source", choices=sorted(SNAPSHOT_SOURCES), default="sql")
+    parser.add_argument("--counter", default=None, help="Compteur de tri pour 'top' (défaut : le premier de la source)")
+    parser.add_argument("--start", help="Début de la période (AAAA-MM-JJ HH:MM:SS)")
+    parser.add_argument("--end", help="Fin de la période")
+    args = parser.parse_args()
+
+    store = SnapshotStore(args.data_dir)
+    if args.command == "capture":
+        print(f"📸 Snapshots enregistrés : {store.capture()}")
+    elif args.command == "purge":
+        print(f"🧹 {store.purge()} snapshot(s) supprimé(s).")
+    else:
+        counter = args.counter or SNAPSHOT_SOURCES[args.source]["counters"][0]
+        if counter not in SNAPSHOT_SOURCES[args.source]["counters"]:
+            print(f"❌ Compteur inconnu : {counter}")
+            sys.exit(1)
+        for row in store.top(args.source, counter, args.start, args.end):
+            print(f"{row['key']:<30} {row[counter]:>16.0f} {row[f'{counter}_per_s']:>12.3f}/s  {row['label'] or ''}")
@@ -1,19 +1,186 @@
 import os
-import json
 import sys
-from flask import Flask, render_template, request, jsonify
+import time
+import gzip
+import hashlib
+from functools import partial, wraps
+import threading
+from flask import Flask, render_template, request, jsonify, g, Response
 
 # Ajout du chemin parent pour importer vos modules existants
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from llm_engine import LLMEngine
-from rag_setup import OracleRAG
+from result_cache import ResultCache
+from result_store import ResultStore, EXPORT_FILES
+from snapshot_store import SnapshotStore, SNAPSHOT_SOURCES
+from regression_detector import RegressionDetector
+from llm_scheduler import INTERACTIVE, BATCH, request_context
+from fleet import target_data_dir, list_targets, load_manifest as load_fleet_manifest
+from datetime import datetime
+import metrics
 
 app = Flask(__name__)
 
-# Initialisation unique du Moteur IA pour le chatbot
-llm_engine = LLMEngine()
-rag_system = OracleRAG()
+# --- MOTEUR IA (CHARGEMENT DIFFÉRÉ) ---
+# LLMEngine et OracleRAG (chromadb + modèle d'embedding) sont importés et initialisés dans un
+# thread de préchauffage : les pages du dashboard sont servies pendant le chargement.
+AI_READY_TIMEOUT = float(os.getenv("AI_READY_TIMEOUT", "60"))
+
+_ai_services = {'llm': None, 'rag': None, 'error': None, 'started_at': None, 'ready_at': None}
+_ai_ready = threading.Event()
+_warm_up_lock = threading.Lock()
+
+def _warm_up():
+    try:
+        from llm_engine import LLMEngine
+        from rag_setup import OracleRAG
+        llm = LLMEngine()
+        rag = OracleRAG()
+        # Première requête : charge réellement le modèle d'embedding et ouvre l'index Chroma
+        rag.retrieve_context("warm-up", n_results=1)
+        _ai_services['llm'], _ai_services['rag'] = llm, rag
+        _ai_services['ready_at'] = datetime.now().isoformat()
+        print("✅ Moteur IA prêt (LLM + RAG).")
+    except Exception as e:
+        _ai_services['error'] = str(e)
+        print(f"❌ Échec du préchauffage IA : {e}")
+    finally:
+        _ai_ready.set()
+
+def start_warm_up():
+    """Lance (une seule fois) le préchauffage du moteur IA en arrière-plan."""
+    with _warm_up_lock:
+        if _ai_services['started_at'] is None:
+            _ai_services['started_at'] = datetime.now().isoformat()
+            threading.Thread(target=_warm_up, name="ai-warm-up", daemon=True).start()
+
+def get_ai_services(timeout=AI_READY_TIMEOUT):
+    """Attend que le moteur IA soit prêt ; retourne (llm, rag) ou (None, None) si indisponible."""
+    start_warm_up()
+    _ai_ready.wait(timeout)
+    return _ai_services['llm'], _ai_services['rag']
+
+# Cache des résultats JSON (revalidé par mtime, partagé par toutes les requêtes)
+result_cache = ResultCache()
+
+# Dossier de données du webapp (défaut : datav1/ du dépôt ; WEBAPP_DATA_DIR pour un autre jeu, ex. benchmarks)
+DATA_ROOT = os.getenv("WEBAPP_DATA_DIR") or os.path.join(os.path.dirname(__file__), '../../datav1')
+# Résultats des agents : versions transactionnelles (SQLite WAL) écrites par les agents et le pipeline
+result_store = ResultStore(DATA_ROOT)
+# Snapshots horodatés des compteurs V$SQL / V$SYSTEM_EVENT (écarts par intervalle)
+snapshot_store = SnapshotStore(DATA_ROOT)
+# Bases de la flotte : un dossier (CSV + store de résultats) par cible
+TARGETS_ROOT = os.path.join(DATA_ROOT, 'targets')
+# Stores des cibles, ouverts à la première requête puis réutilisés (connexions, cache `latest`)
+_target_stores = {}
+_target_stores_lock = threading.Lock()
+
+def _target_store(store_class, target):
+    """Store (ResultStore, SnapshotStore) d'une cible ; None si la cible est inconnue."""
+    if target not in list_targets(TARGETS_ROOT):
+        return None
+    key = (store_class, target)
+    with _target_stores_lock:
+        if key not in _target_stores:
+            _target_stores[key] = store_class(os.path.join(TARGETS_ROOT, target))
+        return _target_stores[key]
+
+# --- INSTRUMENTATION DES ROUTES ---
+HTTP_LATENCY = metrics.histogram("http_request_duration_seconds", "Latence des routes Flask", ("endpoint", "method"))
+HTTP_REQUESTS = metrics.counter("http_requests_total", "Requêtes HTTP par route et code", ("endpoint", "method", "status"))
+
+@app.before_request
+def _start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def _record_request(response):
+    start = getattr(g, 'request_start', None)
+    # request.endpoint (et non le chemin) : cardinalité bornée, même avec des ids de session
+    endpoint = request.endpoint or "unknown"
+    if start is not None:
+        HTTP_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint, method=request.method)
+    HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
+# --- API DE DONNÉES (graphes et listes du dashboard) ---
+# Réponses JSON compressées au-delà de API_GZIP_MIN_BYTES ; pages de API_MAX_PAGE_SIZE éléments au plus
+API_GZIP_MIN_BYTES = int(os.getenv("API_GZIP_MIN_BYTES", "1024"))
+API_GZIP_LEVEL = int(os.getenv("API_GZIP_LEVEL", "6"))
+API_PAGE_SIZE = int(os.getenv("API_PAGE_SIZE", "50"))
+API_MAX_PAGE_SIZE = 500
+
+HTTP_NOT_MODIFIED = metrics.counter("http_not_modified_total", "Réponses 304 (ETag inchangé) par route", ("endpoint",))
+HTTP_GZIP_BYTES = metrics.counter("http_gzip_bytes_total", "Octets JSON avant/après compression gzip", ("stage",))
+
+@app.after_request
+def _gzip_json(response):
+    """Compression gzip des réponses JSON volumineuses, si le client l'accepte."""
+    if (response.status_code != 200 or response.direct_passthrough or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers):
+        return response
+    data = response.get_data()
+    if len(data) < API_GZIP_MIN_BYTES:
+        return response
+    response.vary.add('Accept-Encoding')
+    if 'gzip' not in request.headers.get('Accept-Encoding', ''):
+        return response
+    compressed = gzip.compress(data, compresslevel=API_GZIP_LEVEL)
+    HTTP_GZIP_BYTES.inc(len(data), stage="raw")
+    HTTP_GZIP_BYTES.inc(len(compressed), stage="gzip")
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def revalidated_json(versions, builder):
+    """
+    Réponse JSON revalidable : l'ETag dérive des versions des données et de la requête (chemin +
+    paramètres). Si le client le présente (If-None-Match), 304 sans appeler builder().
+    ETag faible : la même donnée peut être servie compressée ou non.
+    """
+    etag = hashlib.sha1(repr((request.full_path, tuple(versions))).encode()).hexdigest()[:20]
+    if request.if_none_match.contains_weak(etag):
+        HTTP_NOT_MODIFIED.inc(endpoint=request.endpoint or "unknown")
+        response = Response(status=304)
+    else:
+        response = jsonify(builder())
+    response.set_etag(etag, weak=True)
+    # Le client garde la réponse mais la revalide à chaque consultation
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def page_args():
+    """(page, per_page) des paramètres ?page=1&per_page=50, bornés."""
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = max(1, min(request.args.get('per_page', API_PAGE_SIZE, type=int), API_MAX_PAGE_SIZE))
+    return page, per_page
+
+def paginated(items, total, page, per_page):
+    return {'page': page, 'per_page': per_page, 'total': total,
+            'pages': (total + per_page - 1) // per_page, 'items': items}
+
+@app.route('/healthz')
+def liveness():
+    """Liveness : le processus répond (indépendant du moteur IA)."""
+    return jsonify({'status': 'alive'})
+
+@app.route('/readyz')
+def readiness():
+    """Readiness : le moteur IA (LLM + RAG) est chargé et le chatbot peut répondre."""
+    body = {
+        'ai_started_at': _ai_services['started_at'],
+        'ai_ready_at': _ai_services['ready_at']
+    }
+    if _ai_services['error']:
+        return jsonify(dict(body, status='error', error=_ai_services['error'])), 503
+    if not _ai_ready.is_set():
+        return jsonify(dict(body, status='warming_up')), 503
+    return jsonify(dict(body, status='ready'))
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Métriques du processus au format texte Prometheus."""
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
 
 # --- MÉMOIRE DU CHATBOT (NOUVEAU) ---
 # Liste pour stocker l'historique de la session active
@@ -22,16 +189,9 @@ CHAT_HISTORY = []
 
 # --- FONCTIONS UTILITAIRES ---
 
-def load_json_data(filename, directory='datav1'):
-    """Charge un fichier JSON depuis le dossier spécifié (défaut: datav1/)"""
-    filepath = os.path.join(os.path.dirname(__file__), '../../', directory, filename)
-    if os.path.exists(filepath):
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return None
-    return None
+def load_result(agent):
+    """Dernière version des résultats d'un agent (security, optimizer, anomaly, backup), None si absente"""
+    return result_store.latest(agent)
 
 def get_security_status(data):
     """Détermine la couleur du statut sécurité"""
@@ -41,30 +201,56 @@ def get_security_status(data):
     if score >= 50: return "warning"
     return "danger"
 
-def get_system_context():
-    """Résume l'état actuel du système (Audit, Perf, Anomalies)"""
+# Agents dont dépendent le résumé du dashboard et le contexte du chatbot
+DASHBOARD_AGENTS = ['security', 'optimizer', 'anomaly']
+
+def _build_dashboard_summary():
+    sec_data = load_result('security')
+    perf_data = load_result('optimizer')
+
+    anomalies_alert = result_store.anomalies(classifications=['CRITIQUE', 'SUSPECT'])
+    has_critical = any(a.get('classification') == 'CRITIQUE' for a in anomalies_alert)
+
+    return {
+        'sec_score': sec_data.get('score', 'N/A') if sec_data else 'N/A',
+        'sec_color': get_security_status(sec_data),
+        'slow_queries': len(perf_data) if perf_data else 0,
+        'anomalies_count': len(anomalies_alert),
+        'anom_color': 'danger' if has_critical else 'warning' if anomalies_alert else 'success'
+    }
+
+def get_dashboard_summary():
+    """Scores, compteurs et couleurs du dashboard, recalculés uniquement si un agent a publié une nouvelle version"""
+    versions = result_store.latest_versions(DASHBOARD_AGENTS)
+    return result_cache.derived_from('dashboard_summary', versions, _build_dashboard_summary)
+
+def _build_system_context():
     context = "--- ÉTAT RÉEL DU SYSTÈME (Données Live) ---\n"
     
     # Sécurité
-    sec = load_json_data('last_audit.json', directory='datav1')
+    sec = load_result('security')
     if sec:
         risques = [r['nom'] for r in sec.get('risques', [])]
         context += f"[SÉCURITÉ] Score: {sec.get('score')}/100. Risques: {', '.join(risques[:3])}.\n"
     
     # Performance
-    perf = load_json_data('query_analysis.json')
+    perf = load_result('optimizer')
     if perf and isinstance(perf, list):
         exemples = [q.get('sql_id') for q in perf[:2]]
         context += f"[PERFORMANCE] {len(perf)} requêtes lentes. Ex: {', '.join(exemples)}.\n"
     
     # Anomalies
-    anom = load_json_data('detected_anomalies.json', directory='datav1')
-    if anom and isinstance(anom, list):
-        critiques = [a for a in anom if a.get('classification') == 'CRITIQUE']
+    if result_store.latest_run_id('anomaly') is not None:
+        critiques = result_store.anomalies(classifications=['CRITIQUE'])
         context += f"[ANOMALIES] {len(critiques)} menaces CRITIQUES détectées.\n"
         
     return context
 
+def get_system_context():
+    """Résume l'état actuel du système (Audit, Perf, Anomalies), mis en cache jusqu'à la prochaine version publiée"""
+    versions = result_store.latest_versions(DASHBOARD_AGENTS)
+    return result_cache.derived_from('system_context', versions, _build_system_context)
+
 def get_conversation_history(limit=3):
     """
     Formate les derniers échanges pour le prompt (3 paires de questions/réponses max)
@@ -84,110 +270,213 @@ def get_conversation_history(limit=3):
 
 @app.route('/')
 def index():
-    sec_data = load_json_data('last_audit.json', directory='datav1')
-    perf_data = load_json_data('query_analysis.json')
-    anom_data = load_json_data('detected_anomalies.json', directory='datav1') or []
-    
-    anomalies_alert = [a for a in anom_data if a.get('classification') in ['CRITIQUE', 'SUSPECT']]
-    has_critical = any(a.get('classification') == 'CRITIQUE' for a in anomalies_alert)
-
-    stats = {
-        'sec_score': sec_data.get('score', 'N/A') if sec_data else 'N/A',
-        'sec_color': get_security_status(sec_data),
-        'slow_queries': len(perf_data) if perf_data else 0,
-        'anomalies_count': len(anomalies_alert),
-        'anom_color': 'danger' if has_critical else 'warning' if anomalies_alert else 'success'
-    }
-    
-    # Préparation des données pour les graphes
-    # On passe les données brutes, le JS se chargera du reste
-    return render_template('index.html', stats=stats, perf_data=perf_data or [], anom_data=anom_data or [])
+    stats = get_dashboard_summary()
+    # Les graphes chargent leurs agrégats via /api/queries/summary et /api/anomalies/summary
+    return render_template('index.html', stats=stats)
 
 @app.route('/security')
 def security():
-    data = load_json_data('last_audit.json', directory='datav1')
+    data = load_result('security')
     return render_template('security.html', data=data or {'score': 0, 'risques': [], 'recommandations': []})
 
 @app.route('/performance')
 def performance():
-    data = load_json_data('query_analysis.json')
-    return render_template('performance.html', queries=data or [])
+    page, per_page = page_args()
+    data = load_result('optimizer') or []
+    pagination = paginated(data[(page - 1) * per_page:page * per_page], len(data), page, per_page)
+    return render_template('performance.html', queries=pagination.pop('items'), pagination=pagination)
 
 @app.route('/backup')
 def backup():
-    plan = load_json_data('backup_plan.json', directory='datav1') or {}
-    rman_path = os.path.join(os.path.dirname(__file__), '../../datav1', 'backup_script.rman')
-    rman_content = "Aucun script généré."
-    if os.path.exists(rman_path):
-        with open(rman_path, 'r', encoding='utf-8') as f:
-            rman_content = f.read()
+    plan = load_result('backup') or {}
+    rman_content = result_store.latest_artifact('backup')
+    if rman_content is None:
+        rman_content = "Aucun script généré."
     return render_template('backup.html', plan=plan, rman=rman_content)
 
+@app.route('/api/results/<agent>/history', methods=['GET'])
+def results_history(agent):
+    """Indicateurs des dernières versions d'un agent (graphes de tendance). Paramètres : ?limit=50&target=NOM"""
+    if agent not in EXPORT_FILES:
+        return jsonify({'error': f"Agent inconnu : {agent}"}), 404
+    limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+    target = request.args.get('target')
+    store = _result_store(target)
+    if store is None:
+        return jsonify({'error': f"Cible inconnue : {target}"}), 404
+    return jsonify({'agent': agent, 'target': target, 'runs': store.history(agent, limit=limit)})
+
+def _result_store(target):
+    """Store de résultats de datav1/ ou d'une cible de la flotte ; None si la cible est inconnue."""
+    if not target:
+        return result_store
+    return _target_store(ResultStore, target)
+
+def _split_arg(name):
+    return [v for v in request.args.get(name, '').split(',') if v]
+
+@app.route('/api/anomalies/summary', methods=['GET'])
+def anomalies_summary():
+    """Anomalies par classification, sévérité et période (graphes). Paramètres : ?bucket=hour|day&target="""
+    store = _result_store(request.args.get('target'))
+    if store is None:
+        return jsonify({'error': f"Cible inconnue : {request.args.get('target')}"}), 404
+    bucket = request.args.get('bucket', 'hour')
+    if bucket not in ResultStore.TIME_BUCKETS:
+        return jsonify({'error': f"Période inconnue : {bucket}", 'buckets': sorted(ResultStore.TIME_BUCKETS)}), 400
+    return revalidated_json((store.latest_run_id('anomaly'),), lambda: store.anomaly_summary(bucket=bucket))
+
+@app.route('/api/anomalies', methods=['GET'])
+def anomalies_page():
+    """
+    Anomalies de la dernière version, paginées.
+    Paramètres : ?page=1&per_page=50&classification=CRITIQUE,SUSPECT&min_severity=5&target=
+    """
+    store = _result_store(request.args.get('target'))
+    if store is None:
+        return jsonify({'error': f"Cible inconnue : {request.args.get('target')}"}), 404
+    page, per_page = page_args()
+    classifications = _split_arg('classification')
+    min_severity = request.args.get('min_severity', type=int)
+    run_id = store.latest_run_id('anomaly')
+
+    def build():
+        total = store.count_anomalies(classifications, run_id, min_severity)
+        items = store.anomalies(classifications, run_id, min_severity, limit=per_page, offset=(page - 1) * per_page)
+        return dict(paginated(items, total, page, per_page), run_id=run_id)
+    return revalidated_json((run_id,), build)
+
+@app.route('/api/queries/summary', methods=['GET'])
+def queries_summary():
+    """
+    Top-N des requêtes pour les graphes : ?by=gain (gain estimé par l'optimiseur) ou
+    ?by=elapsed (temps écoulé sur la période, snapshots V$SQL), n=5, target=
+    """
+    target = request.args.get('target')
+    store, snapshots = _result_store(target), _snapshot_store(target)
+    if store is None or snapshots is None:
+        return jsonify({'error': f"Cible inconnue : {target}"}), 404
+    by = request.args.get('by', 'gain')
+    if by not in ('gain', 'elapsed'):
+        return jsonify({'error': f"Critère inconnu : {by}", 'criteres': ['gain', 'elapsed']}), 400
+    n = max(1, min(request.args.get('n', 5, type=int), 100))
+    if by == 'elapsed':
+        return revalidated_json((snapshots.latest_id('sql'),),
+                                lambda: {'by': by, 'top': snapshots.top('sql', 'ELAPSED_TIME', n=n)})
+    run_id = store.latest_run_id('optimizer')
+    return revalidated_json((run_id,), lambda: dict(store.query_stats(run_id), by=by,
+                                                    top=store.queries_by_gain(limit=n, run_id=run_id)))
+
+@app.route('/api/queries', methods=['GET'])
+def queries_page():
+    """Analyses complètes de la dernière version de l'optimiseur, paginées. Paramètres : ?page=1&per_page=50&target="""
+    store = _result_store(request.args.get('target'))
+    if store is None:
+        return jsonify({'error': f"Cible inconnue : {request.args.get('target')}"}), 404
+    page, per_page = page_args()
+    run_id = store.latest_run_id('optimizer')
+
+    def build():
+        data = store.latest('optimizer') or []
+        items = data[(page - 1) * per_page:page * per_page]
+        return dict(paginated(items, len(data), page, per_page), run_id=run_id)
+    return revalidated_json((run_id,), build)
+
+def _snapshot_store(target):
+    """Store de snapshots de datav1/ ou d'une cible de la flotte ; None si la cible est inconnue."""
+    if not target:
+        return snapshot_store
+    return _target_store(SnapshotStore, target)
+
+@app.route('/api/snapshots/<source>', methods=['GET'])
+def snapshot_deltas(source):
+    """
+    Écarts des compteurs V$ sur une période (requêtes de plage pour les graphes).
+    Paramètres : ?start=&end= (AAAA-MM-JJ HH:MM:SS), counter=, n=10 (top), key= (série d'une clé), target=
+    """
+    if source not in SNAPSHOT_SOURCES:
+        return jsonify({'error': f"Source inconnue : {source}", 'sources': sorted(SNAPSHOT_SOURCES)}), 404
+    counters = SNAPSHOT_SOURCES[source]['counters']
+    counter = request.args.get('counter', counters[0])
+    if counter not in counters:
+        return jsonify({'error': f"Compteur inconnu : {counter}", 'counters': counters}), 400
+    store = _snapshot_store(request.args.get('target'))
+    if store is None:
+        return jsonify({'error': f"Cible inconnue : {request.args.get('target')}"}), 404
+    start, end, key = request.args.get('start'), request.args.get('end'), request.args.get('key')
+    try:
+        if key:
+            return jsonify({'source': source, 'counter': counter, 'key': key,
+                            'series': store.series(source, key, counter, start, end)})
+        n = max(1, min(request.args.get('n', 10, type=int), 100))
+        return jsonify({'source': source, 'counter': counter, 'top': store.top(source, counter, start, end, n)})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/regressions', methods=['GET'])
+def regressions():
+    """
+    SQL_ID en régression (temps, buffer gets, lectures disque par exécution), triés par impact.
+    Recalculé uniquement à l'arrivée d'un nouveau snapshot. Paramètres : ?limit=20&target=NOM
+    """
+    target = request.args.get('target')
+    store = _snapshot_store(target)
+    if store is None:
+        return jsonify({'error': f"Cible inconnue : {target}"}), 404
+    limit = max(1, min(request.args.get('limit', 20, type=int), 500))
+    version = store.latest_id('sql')
+
+    def build():
+        found = result_cache.derived_from(f"regressions:{target or ''}", (version,),
+                                          lambda: RegressionDetector(store=store).detect())
+        return {'target': target, 'total': len(found), 'regressions': found[:limit]}
+    return revalidated_json((version,), build)
+
+@app.route('/api/targets', methods=['GET'])
+def targets():
+    """Bases de la flotte (dossiers datav1/targets/) et état de leur dernière extraction."""
+    states = load_fleet_manifest(os.path.join(TARGETS_ROOT, 'fleet_manifest.json')).get('targets', {})
+    return jsonify([
+        {'name': name, 'extraction': {k: states.get(name, {}).get(k) for k in ('status', 'finished_at', 'error')}}
+        for name in list_targets(TARGETS_ROOT)
+    ])
+
 @app.route('/chatbot')
 def chatbot_page():
     return render_template('chatbot.html')
 
 # --- GESTION DES SESSIONS (PERSISTANCE) ---
 import uuid
-import glob
-from datetime import datetime
+from chat_store import ChatStore
+from answer_cache import SemanticAnswerCache, context_key
+from chat_memory import ChatMemory
 
-CHATS_DIR = os.path.join(os.path.dirname(__file__), '../../datav1', 'chats')
-os.makedirs(CHATS_DIR, exist_ok=True)
+CHATS_DIR = os.path.join(DATA_ROOT, 'chats')
+chat_store = ChatStore(CHATS_DIR)
+# Historique du prompt borné en tokens ; résumé glissant mis à jour en arrière-plan
+chat_memory = ChatMemory(chat_store)
 
-def save_chat_session(session_id, messages):
-    """Sauvegarde l'historique d'une session dans un fichier JSON."""
-    filename = f"session_{session_id}.json"
-    filepath = os.path.join(CHATS_DIR, filename)
-    
-    # Création d'un titre basé sur le premier message utilisateur s'il existe
-    title = "Nouvelle conversation"
-    if messages:
-        first_user_msg = next((m['content'] for m in messages if m['role'] == 'user'), None)
-        if first_user_msg:
-            title = first_user_msg[:30] + "..." if len(first_user_msg) > 30 else first_user_msg
-
-    data = {
-        'id': session_id,
-        'last_update': datetime.now().isoformat(),
-        'title': title,
-        'messages': messages
-    }
-    
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-def load_chat_session(session_id):
-    """Charge une session existante ou retourne une liste vide."""
-    filename = f"session_{session_id}.json"
-    filepath = os.path.join(CHATS_DIR, filename)
-    if os.path.exists(filepath):
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data.get('messages', [])
-        except:
-            return []
-    return []
-
-def list_chat_sessions():
-    """Liste toutes les sessions disponibles triées par date récente."""
-    sessions = []
-    files = glob.glob(os.path.join(CHATS_DIR, "session_*.json"))
-    for fpath in files:
-        try:
-            with open(fpath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                sessions.append({
-                    'id': data.get('id'),
-                    'title': data.get('title', 'Conversation sans titre'),
-                    'last_update': data.get('last_update', '')
-                })
-        except:
-            continue
-    # Tri décroissant par date
-    sessions.sort(key=lambda x: x['last_update'], reverse=True)
-    return sessions
+# Cache sémantique des réponses : une question déjà posée (même état système) est servie
+# sans RAG ni appel LLM. Réglages : ANSWER_CACHE_THRESHOLD / ANSWER_CACHE_SIZE / ANSWER_CACHE_TTL
+answer_cache = SemanticAnswerCache(name="chat")
+
+# Taille de page par défaut / maximale de /api/sessions
+SESSIONS_PAGE_SIZE = 50
+SESSIONS_PAGE_MAX = 200
+
+def append_chat_messages(session_id, messages):
+    """Ajoute les nouveaux messages au journal de la session (sans réécrire l'historique)."""
+    chat_store.append(session_id, messages)
+
+def load_chat_session(session_id, limit=None):
+    """Charge une session existante (ou ses `limit` derniers messages) ; liste vide si absente."""
+    if limit:
+        return chat_store.load_tail(session_id, limit)
+    return chat_store.load(session_id)
+
+def list_chat_sessions(limit=SESSIONS_PAGE_SIZE, cursor=None):
+    """Page de sessions triées par date récente, lue depuis l'index (sans lire les messages)."""
+    return chat_store.list_sessions(limit=limit, cursor=cursor)
 
 # --- API CHATBOT AVEC SESSIONS ---
 
@@ -201,30 +490,41 @@ def chat_api():
     user_message = data.get('message')
     session_id = data.get('session_id')
     
-    # Gestion de la session
     if not session_id:
         session_id = str(uuid.uuid4())
-        history = []
-    else:
-        history = load_chat_session(session_id)
     
-    # 1. Récupération des Contextes
-    docs, _ = rag_system.retrieve_context(user_message)
-    rag_context = "\n".join(docs)
+    # 0. Le moteur IA doit être prêt (attente bornée du préchauffage)
+    llm_engine, rag_system = get_ai_services()
+    if llm_engine is None:
+        error = _ai_services['error'] or "Moteur IA en cours de chargement, réessayez dans un instant."
+        response = jsonify({'error': error, 'session_id': session_id})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+
+    # 1. Historique borné : résumé des anciens échanges + derniers messages (fin du journal seulement)
+    recent_history_str = chat_memory.build_history(session_id)
+
+    # 2. Cache sémantique : la clé inclut l'état système courant (réponses périmées si les données
+    # changent) et l'historique (une relance comme "et pour la deuxième ?" dépend de la conversation)
     system_live_data = get_system_context()
+    query_embedding = rag_system.embed_query(user_message)
+    cache_key = context_key(system_live_data, recent_history_str)
+    bot_reply = answer_cache.lookup(query_embedding, cache_key)
+    if bot_reply is not None:
+        append_chat_messages(session_id, [
+            {'role': 'user', 'content': user_message},
+            {'role': 'assistant', 'content': bot_reply}
+        ])
+        chat_memory.schedule_update(session_id, partial(llm_engine.generate, priority=BATCH, caller="chat_memory"))
+        return jsonify({'response': bot_reply, 'session_id': session_id, 'cached': True})
+
+    # 3. Récupération des Contextes (recherche limitée au domaine détecté par le routeur)
+    from rag_setup import route_domain  # module déjà chargé par le préchauffage
+    docs, _ = rag_system.retrieve_context(user_message, domain=route_domain(user_message),
+                                          query_embedding=query_embedding)
+    rag_context = "\n".join(docs)
     
-    # 2. Récupération de l'Historique récent pour le prompt
-    # history contient toute la conversation, on prend les derniers échanges pour le LLM
-    recent_history_str = ""
-    limit = 6
-    if history:
-        for msg in history[-limit:]:
-            role = "UTILISATEUR" if msg['role'] == 'user' else "ASSISTANT"
-            recent_history_str += f"{role}: {msg['content']}\n"
-    else:
-        recent_history_str = "Aucun historique précédent."
-    
-    # 3. Construction du Prompt Complet
+    # 4. Construction du Prompt Complet
     system_instruction = (
         "Tu es l'assistant DBA intelligent. "
         "Tu as accès à :\n"
@@ -242,23 +542,38 @@ def chat_api():
         f"UTILISATEUR: {user_message}"
     )
     
-    # 4. Génération
-    bot_reply = llm_engine.generate(full_prompt)
+    # 5. Génération : priorité interactive, partage équitable entre sessions
+    bot_reply = llm_engine.generate(full_prompt, priority=INTERACTIVE, caller=f"chat:{session_id}")
+    if not bot_reply.startswith("❌ Erreur"):
+        answer_cache.store(query_embedding, cache_key, bot_reply)
     
-    # 5. Mise à jour et sauvegarde de la session
-    history.append({'role': 'user', 'content': user_message})
-    history.append({'role': 'assistant', 'content': bot_reply})
-    save_chat_session(session_id, history)
+    # 6. Ajout du nouvel échange au journal de la session
+    append_chat_messages(session_id, [
+        {'role': 'user', 'content': user_message},
+        {'role': 'assistant', 'content': bot_reply}
+    ])
+    # Résumé des messages sortis de la fenêtre récente, calculé après la réponse (hors priorité interactive)
+    chat_memory.schedule_update(session_id, partial(llm_engine.generate, priority=BATCH, caller="chat_memory"))
     
     return jsonify({
         'response': bot_reply,
-        'session_id': session_id
+        'session_id': session_id,
+        'cached': False
     })
 
 @app.route('/api/sessions', methods=['GET'])
 def get_sessions():
-    """Retourne la liste des sessions passées."""
-    return jsonify(list_chat_sessions())
+    """
+    Retourne une page de sessions passées.
+    Paramètres : ?limit=50&cursor=<next_cursor de la page précédente>
+    """
+    limit = request.args.get('limit', SESSIONS_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, SESSIONS_PAGE_MAX))
+    try:
+        sessions, next_cursor = list_chat_sessions(limit=limit, cursor=request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'sessions': sessions, 'next_cursor': next_cursor})
 
 @app.route('/api/sessions/<session_id>', methods=['GET'])
 def get_session_details(session_id):
@@ -269,15 +584,175 @@ def get_session_details(session_id):
 @app.route('/api/sessions/<session_id>', methods=['DELETE'])
 def delete_session_endpoint(session_id):
     """Supprime une session."""
-    filename = f"session_{session_id}.json"
-    filepath = os.path.join(CHATS_DIR, filename)
-    if os.path.exists(filepath):
-        try:
-            os.remove(filepath)
+    try:
+        if chat_store.delete(session_id):
             return jsonify({'status': 'deleted'})
-        except Exception as e:
-            return jsonify({'error': str(e)}), 500
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
     return jsonify({'error': 'Not found'}), 404
 
+# --- TÂCHES D'ANALYSE EN ARRIÈRE-PLAN ---
+from job_queue import JobQueue
+
+# Pool borné (AGENT_JOBS_MAX_WORKERS, défaut 2) : les pipelines LLM ne bloquent pas les requêtes Flask
+job_queue = JobQueue()
+
+_agents = {}
+_agents_lock = threading.Lock()
+
+def get_agent(name, target=None):
+    """
+    Instancie un agent à la première utilisation puis le réutilise entre les tâches.
+    target : base de la flotte (données dans datav1/targets/<nom>/), None pour datav1/.
+    """
+    data_dir = target_data_dir(target)
+    key = (name, target)
+    with _agents_lock:
+        if key not in _agents:
+            if name == 'optimizer':
+                from query_optimizer import QueryOptimizer
+                _agents[key] = QueryOptimizer(data_dir)
+            elif name == 'anomaly':
+                from anomaly_detector import AnomalyDetector
+                _agents[key] = AnomalyDetector(data_dir)
+            elif name == 'security':
+                from security_audit import SecurityAuditor
+                _agents[key] = SecurityAuditor(data_dir)
+            elif name == 'backup':
+                from backup_recommender import BackupRecommender
+                _agents[key] = BackupRecommender(data_dir)
+        return _agents[key]
+
+def _job_summary(result):
+    """Résumé léger renvoyé par l'API de statut (le détail reste dans les fichiers JSON)."""
+    if isinstance(result, dict) and ('error' in result or 'raw_report' in result):
+        raise RuntimeError(result.get('error') or "Réponse LLM non structurée (raw_report)")
+    if isinstance(result, list):
+        return {'items': len(result)}
+    return {'keys': sorted(result.keys()) if isinstance(result, dict) else []}
+
+# Les tâches ne reçoivent aucun chemin du client : les données sont celles de la cible (nom validé)
+
+def run_optimizer_job(job, target=None):
+    job.report(5, "Initialisation de l'optimiseur...")
+    agent = get_agent('optimizer', target)
+    return _job_summary(agent.analyze_slow_queries(progress_callback=job.report))
+
+def run_anomaly_job(job, target=None):
+    job.report(5, "Initialisation du détecteur...")
+    agent = get_agent('anomaly', target)
+    job.report(20, "Analyse des logs d'audit...")
+    return _job_summary(agent.analyze_logs())
+
+def run_security_job(job, target=None):
+    job.report(5, "Initialisation de l'auditeur...")
+    agent = get_agent('security', target)
+    job.report(20, "Audit des utilisateurs, rôles et privilèges...")
+    return _job_summary(agent.run_audit())
+
+def run_backup_job(job, rpo="24h", rto="4h", budget="Moyen", target=None):
+    job.report(5, "Initialisation du recommandeur...")
+    agent = get_agent('backup', target)
+    job.report(20, "Génération de la stratégie et du script RMAN...")
+    strategy, rman = agent.generate_full_plan(user_reqs={"rpo": rpo, "rto": rto, "budget": budget})
+    summary = _job_summary(strategy)
+    job.report(90, "Sauvegarde du plan...")
+    agent.save_plan(strategy, rman, agent.data_dir)
+    return summary
+
+def run_backup_batch_job(job, targets=None, workers=None):
+    """
+    Plans de sauvegarde de plusieurs bases (politiques YAML), sans interaction.
+    Politiques : fichier BACKUP_POLICY_FILE du serveur, sinon politique par défaut pour chaque
+    cible (comme la ligne de commande). workers : borné par BACKUP_BATCH_WORKERS.
+    """
+    import backup_batch
+    job.report(5, "Lecture des politiques de sauvegarde...")
+    if backup_batch.POLICY_FILE:
+        policies = backup_batch.load_policies(backup_batch.POLICY_FILE)
+    else:
+        policies = backup_batch.discover_targets(TARGETS_ROOT)
+    policies = backup_batch.select_targets(policies, targets)
+    workers = min(max(1, int(workers)), backup_batch.DEFAULT_WORKERS) if workers else None
+    results = backup_batch.generate_plans(policies, max_workers=workers, progress_callback=job.report)
+    failed = sorted(name for name, entry in results.items() if entry['status'] != 'ok')
+    if failed and len(failed) == len(results):
+        raise RuntimeError(f"Aucun plan généré ({', '.join(failed)})")
+    return {'targets': len(results), 'failed': failed}
+
+def run_fleet_extraction_job(job, targets=None, per_target=None, max_connections=None):
+    """
+    Extraction de toutes les bases de l'inventaire du serveur (FLEET_INVENTORY) ; une base
+    injoignable n'arrête pas les autres. Le client choisit les cibles par leur nom.
+    """
+    import fleet
+    job.report(5, "Lecture de l'inventaire...")
+    selected = fleet.select_targets(fleet.load_inventory(fleet.INVENTORY_FILE), targets)
+    results = fleet.extract_fleet(selected, per_target=per_target, max_connections=max_connections,
+                                  progress_callback=job.report)
+    failed = sorted(name for name, entry in results.items() if entry['status'] == 'failed')
+    if failed and len(failed) == len(results):
+        raise RuntimeError(f"Aucune base extraite ({', '.join(failed)})")
+    return {'targets': len(results), 'failed': failed}
+
+def batch_llm(kind, func):
+    """Appels LLM d'une tâche : priorité batch, un appelant par type de tâche, annulables avec la tâche."""
+    @wraps(func)
+    def run(job, **params):
+        with request_context(priority=BATCH, caller=kind, cancel_event=job.cancel_event):
+            return func(job, **params)
+    return run
+
+for kind, func in (('optimizer', run_optimizer_job), ('anomaly', run_anomaly_job), ('security', run_security_job),
+                   ('backup', run_backup_job), ('backup_batch', run_backup_batch_job),
+                   ('fleet_extraction', run_fleet_extraction_job)):
+    job_queue.register(kind, batch_llm(kind, func))
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """
+    Lance un agent en arrière-plan.
+    Payload attendu: { "type": "optimizer|anomaly|security|backup", "params": {...} (optionnel) }
+    """
+    data = request.json or {}
+    kind = data.get('type')
+    params = data.get('params') or {}
+    if not isinstance(params, dict):
+        return jsonify({'error': "'params' doit être un objet JSON"}), 400
+    try:
+        job, deduplicated = job_queue.submit(kind, params)
+    except KeyError:
+        return jsonify({'error': f"Type de tâche inconnu: {kind}", 'types': job_queue.kinds}), 400
+    except TypeError as e:
+        return jsonify({'error': f"Paramètres invalides: {e}"}), 400
+    return jsonify({'job_id': job.id, 'status': job.status, 'deduplicated': deduplicated}), 202
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """Retourne les tâches récentes (les plus récentes en premier)."""
+    return jsonify(job_queue.list_jobs())
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Statut et progression d'une tâche."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Annule une tâche en attente ou en cours (ses appels LLM encore en file sont abandonnés)."""
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify(job.to_dict()), 202
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    # Avec le reloader (debug), seul le processus fils (WERKZEUG_RUN_MAIN) sert les requêtes
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_warm_up()
+    app.run(debug=True, port=5000)
+else:
+    # Import par un serveur WSGI : préchauffage immédiat en arrière-plan
+    start_warm_up()
\ No newline at end of file